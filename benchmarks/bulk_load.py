@@ -0,0 +1,85 @@
+"""Bulk upsert throughput of the price and FTD ingestion paths on any backend
+
+Run from the repository root, against SQLite or a local PostgreSQL instance:
+    
+    python benchmarks/bulk_load.py --securities 200 --days 1000
+    python benchmarks/bulk_load.py --database-uri postgresql://localhost/finport_bench
+
+Each run loads fresh rows, then reloads the same keys so the update path is
+timed too. On PostgreSQL the batched INSERT path is compared with COPY.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models import init_app, db, PriceData, FTDData
+from src.services.bulk_writer import BulkWriter
+
+
+def price_rows(securities, days, close):
+    """Build daily price rows for a block of securities"""
+    start = date(2015, 1, 1)
+    return [{
+        'security_id': security_id,
+        'date': start + timedelta(days=i),
+        'open': close, 'high': close, 'low': close, 'close': close,
+        'volume': 1000 + i, 'vwap': close
+    } for security_id in securities for i in range(days)]
+
+
+def ftd_rows(securities, days, price):
+    """Build FTD rows for a block of securities"""
+    start = date(2015, 1, 1)
+    return [{
+        'security_id': security_id,
+        'date': start + timedelta(days=i),
+        'quantity': 500 + i,
+        'price': price,
+        'value': (500 + i) * price
+    } for security_id in securities for i in range(days)]
+
+
+def timed_upsert(writer, model, rows):
+    """Upsert rows and commit, returning rows per second"""
+    start = time.perf_counter()
+    writer.upsert(model, rows, ['security_id', 'date'])
+    db.session.commit()
+    return len(rows) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='Database to load into, defaults to a temporary SQLite file')
+    parser.add_argument('--securities', type=int, default=100)
+    parser.add_argument('--days', type=int, default=1000)
+    args = parser.parse_args()
+    
+    app = Flask('bulk_load')
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri or f'sqlite:///{tempfile.mktemp(suffix=".db")}'
+    init_app(app)
+    
+    with app.app_context():
+        modes = {'insert': BulkWriter(copy_threshold=sys.maxsize)}
+        if db.engine.dialect.name == 'postgresql':
+            modes['copy'] = BulkWriter(copy_threshold=1)
+        
+        print(f"{db.engine.dialect.name}: {args.securities} securities x {args.days} days per load")
+        for mode, writer in modes.items():
+            # Each mode loads its own block of securities so both start from empty
+            symbols = [f'{mode.upper()}{i}' for i in range(args.securities)]
+            securities = list(writer.ensure_securities(symbols).values())
+            db.session.commit()
+            for name, model, build in (('price_data', PriceData, price_rows), ('ftd_data', FTDData, ftd_rows)):
+                inserted = timed_upsert(writer, model, build(securities, args.days, 1.0))
+                updated = timed_upsert(writer, model, build(securities, args.days, 2.0))
+                print(f"  {mode:6} {name:10} insert {inserted:10.0f} rows/s   update {updated:10.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Indicator computation per security through pandas against one matrix for many securities
+
+Run from the repository root, no database is needed:
+    
+    python benchmarks/indicator_batch.py --securities 1000 --days 2500
+
+Histories of random length stand in for a universe of listings of
+different ages. Both paths compute every registered indicator, and the
+largest relative difference between them is reported.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.indicator_registry import compute_series, compute_matrix
+from src.services.indicator_store import INDICATOR_COLUMNS
+
+
+def close_matrix(securities, days, seed=0):
+    """Build random-walk closes, one security per column padded with NaN after its last bar"""
+    rng = np.random.default_rng(seed)
+    closes = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, (days, securities)), axis=0))
+    lengths = rng.integers(days // 10, days + 1, securities)
+    closes[np.arange(days)[:, None] >= lengths] = np.nan
+    return closes, lengths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--securities', type=int, default=500)
+    parser.add_argument('--days', type=int, default=2500)
+    args = parser.parse_args()
+    
+    closes, lengths = close_matrix(args.securities, args.days)
+    
+    start = time.perf_counter()
+    per_security = [compute_series(pd.Series(closes[:length, column])) for column, length in enumerate(lengths)]
+    series_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    batch = compute_matrix(closes)
+    matrix_time = time.perf_counter() - start
+    
+    worst = 0.0
+    for column, (length, frame) in enumerate(zip(lengths, per_security)):
+        for name in INDICATOR_COLUMNS:
+            expected = frame[name].to_numpy()
+            actual = batch[name][:length, column]
+            both = ~np.isnan(expected)
+            worst = max(worst, float(np.max(np.abs(expected[both] - actual[both])
+                                            / np.maximum(np.abs(expected[both]), 1.0), initial=0.0)))
+    
+    print(f"{args.securities} securities, up to {args.days} days")
+    print(f"  per security {series_time:8.3f}s")
+    print(f"  matrix       {matrix_time:8.3f}s   {series_time / matrix_time:5.1f}x")
+    print(f"  largest relative difference {worst:.3g}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Concurrent read/write throughput of SQLite with and without the production profile
+
+Run from the repository root:
+
+    python benchmarks/sqlite_profile.py --readers 8 --seconds 5
+
+One thread keeps committing small batches of price rows, the way a sync job
+does, while reader threads run the date-range query the price routes use.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, text
+from src.models.storage import SQLITE_PRAGMAS, apply_sqlite_pragmas, engine_options
+
+
+def make_engine(path, pragmas):
+    """Create an engine for a database file that applies the given pragmas"""
+    uri = f'sqlite:///{path}'
+    engine = create_engine(uri, **engine_options(uri))
+    
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+    
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS price_data (id INTEGER PRIMARY KEY, security_id INTEGER NOT NULL, '
+            'date DATE NOT NULL, close FLOAT, volume FLOAT, UNIQUE (security_id, date))'
+        ))
+        start = date(2000, 1, 1)
+        conn.execute(text('INSERT INTO price_data (security_id, date, close, volume) VALUES (:s, :d, 1.0, 100)'),
+                     [{'s': s, 'd': start + timedelta(days=i)} for s in range(20) for i in range(2000)])
+    return engine
+
+
+def run(engine, readers, seconds, batch_size):
+    """Run one writer and several readers for a fixed time, returning operation counts"""
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+    lock = threading.Lock()
+    
+    def writer():
+        day = date(2010, 1, 1)
+        while not stop.is_set():
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text('INSERT OR REPLACE INTO price_data (security_id, date, close, volume) '
+                                      'VALUES (:s, :d, 2.0, 200)'),
+                                 [{'s': 1000 + i, 'd': day} for i in range(batch_size)])
+                day += timedelta(days=1)
+                with lock:
+                    counts['writes'] += 1
+            except Exception:
+                with lock:
+                    counts['write_errors'] += 1
+    
+    def reader(security_id):
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT date, close FROM price_data WHERE security_id = :s '
+                                      'AND date BETWEEN :a AND :b ORDER BY date'),
+                                 {'s': security_id % 20, 'a': date(2001, 1, 1), 'b': date(2004, 12, 31)}).fetchall()
+                with lock:
+                    counts['reads'] += 1
+            except Exception:
+                with lock:
+                    counts['read_errors'] += 1
+    
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--batch-size', type=int, default=200)
+    args = parser.parse_args()
+    
+    profiles = {
+        'default': {'busy_timeout': 5000},
+        'production': {name: os.environ.get(env, default) for name, (env, default) in SQLITE_PRAGMAS.items()}
+    }
+    
+    for name, pragmas in profiles.items():
+        with tempfile.TemporaryDirectory() as directory:
+            engine = make_engine(os.path.join(directory, 'bench.db'), pragmas)
+            counts = run(engine, args.readers, args.seconds, args.batch_size)
+            engine.dispose()
+        
+        print(f"{name:>10}: {counts['reads'] / args.seconds:8.0f} reads/s "
+              f"{counts['writes'] / args.seconds:6.0f} writes/s "
+              f"({counts['read_errors']} read errors, {counts['write_errors']} write errors)")
+
+
+if __name__ == '__main__':
+    main()
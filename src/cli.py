@@ -0,0 +1,226 @@
+import os
+import time
+import click
+from datetime import datetime, timedelta
+from flask.cli import with_appcontext
+from .models import Security, WatchlistItem
+from .services.polygon_service import PolygonService
+from .services.ftd_service import FTDService
+from .services.indicator_store import IndicatorStore
+from .services.retention_service import RetentionService
+from .services.query_plans import check_query_plans
+from .services.indicator_engine import IndicatorEngine
+from .services.analytics_service import AnalyticsService
+from .services.swap_cycles import find_swap_cycles, find_swap_cycles_iterative, compare_swap_cycles
+
+@click.command('sync-prices')
+@click.argument('tickers', nargs=-1)
+@click.option('--file', 'tickers_file', type=click.File('r'), help='File with one ticker per line.')
+@click.option('--from', 'from_date', help='Start date (YYYY-MM-DD), defaults to 30 days ago.')
+@click.option('--to', 'to_date', help='End date (YYYY-MM-DD), defaults to today.')
+@click.option('--timespan', default='day', show_default=True)
+@click.option('--workers', default=8, show_default=True, help='Concurrent Polygon requests.')
+@click.option('--force', is_flag=True, help='Refetch ranges that are already covered.')
+@click.option('--grouped', is_flag=True, help='Use one market-wide grouped daily request per trading day.')
+@with_appcontext
+def sync_prices_command(tickers, tickers_file, from_date, to_date, timespan, workers, force, grouped):
+    """Sync price data for TICKERS (defaults to every active security)"""
+    tickers = list(tickers)
+    if tickers_file:
+        tickers.extend(line.strip() for line in tickers_file if line.strip())
+    
+    if grouped:
+        # Grouped mode stores the whole market unless tickers narrow it down
+        polygon_service = PolygonService(api_key=os.environ.get('POLYGON_API_KEY'))
+        summary = polygon_service.sync_grouped_daily(from_date, to_date, symbols=tickers or None,
+                                                     max_workers=workers)
+        click.echo(
+            f"Synced {summary['succeeded']}/{summary['days']} trading days "
+            f"({summary['records_added']} added, {summary['records_updated']} updated, "
+            f"{summary['records_failed']} failed) in {summary['execution_time']:.1f}s"
+        )
+        return
+    
+    if not tickers:
+        tickers = [s.symbol for s in Security.query.filter_by(is_active=True).all()]
+    
+    polygon_service = PolygonService(api_key=os.environ.get('POLYGON_API_KEY'))
+    summary = polygon_service.sync_universe(tickers, from_date, to_date, timespan=timespan,
+                                            max_workers=workers, force=force)
+    
+    click.echo(
+        f"Synced {summary['succeeded']}/{summary['tickers']} tickers, {summary['skipped']} already covered "
+        f"({summary['records_added']} added, {summary['records_updated']} updated, "
+        f"{summary['records_failed']} failed) in {summary['execution_time']:.1f}s"
+    )
+
+@click.command('ftd-backfill')
+@click.option('--from-year', default=2009, show_default=True, help='First year to load.')
+@click.option('--to-year', type=int, help='Last year to load, defaults to the current year.')
+@click.option('--workers', default=4, show_default=True, help='Concurrent archive downloads.')
+@click.option('--parse-workers', type=int, help='Parser processes, defaults to min(4, CPU count).')
+@click.option('--force', is_flag=True, help='Reload archives that are already loaded.')
+@with_appcontext
+def ftd_backfill_command(from_year, to_year, workers, parse_workers, force):
+    """Load every SEC FTD archive, resuming from the last loaded one"""
+    ftd_service = FTDService()
+    summary = ftd_service.backfill(from_year, to_year, download_workers=workers,
+                                   parse_workers=parse_workers, force=force)
+    
+    click.echo(
+        f"Loaded {summary['succeeded']}/{summary['archives']} archives, {summary['skipped']} already loaded "
+        f"({summary['records_loaded']} records, {summary['failed']} failed) in {summary['execution_time']:.1f}s"
+    )
+
+@click.command('migrate-indicators')
+@click.option('--delete', is_flag=True, help='Delete the legacy rows once each security is migrated.')
+@with_appcontext
+def migrate_indicators_command(delete):
+    """Copy technical_indicators rows into the wide indicator_snapshots table"""
+    written = IndicatorStore().migrate_legacy(delete=delete)
+    click.echo(f"Migrated {written} indicator snapshots")
+
+@click.command('retention')
+@click.option('--call-log-days', type=int, help='Days of raw API call logs to keep, defaults to API_CALL_LOG_RETENTION_DAYS or 30.')
+@click.option('--sync-log-days', type=int, help='Days of data sync logs to keep, defaults to DATA_SYNC_LOG_RETENTION_DAYS or 90.')
+@click.option('--vacuum-pages', type=int, help='Free pages to release, defaults to all of them.')
+@click.option('--convert', is_flag=True, help='Switch an existing SQLite database to incremental auto-vacuum (full VACUUM).')
+@with_appcontext
+def retention_command(call_log_days, sync_log_days, vacuum_pages, convert):
+    """Roll up API call logs by hour, delete expired logs and compact the database"""
+    retention_service = RetentionService(call_log_days=call_log_days, sync_log_days=sync_log_days)
+    summary = retention_service.run(vacuum_pages=vacuum_pages, convert=convert)
+    
+    click.echo(
+        f"Rolled up {summary['hours_rolled']} hours, deleted {summary['api_call_logs']} call logs and "
+        f"{summary['data_sync_logs']} sync logs, freed {summary['pages_freed']} pages "
+        f"in {summary['execution_time']:.1f}s"
+    )
+
+@click.command('check-query-plans')
+@click.argument('queries', nargs=-1)
+@click.option('--verbose', is_flag=True, help='Print every plan, not just the regressed ones.')
+@with_appcontext
+def check_query_plans_command(queries, verbose):
+    """Fail if any hot query (or QUERIES) is planned as a full scan or extra sort"""
+    results = check_query_plans(queries or None)
+    failed = [name for name, result in results.items() if result['problems']]
+    
+    for name, result in results.items():
+        if verbose or result['problems']:
+            click.echo(f"{'FAIL' if result['problems'] else 'ok'} {name}")
+            for step in result['plan']:
+                click.echo(f"    {step}")
+    
+    click.echo(f"{len(results) - len(failed)}/{len(results)} query plans use an index")
+    if failed:
+        raise click.ClickException(f"Query plans regressed: {', '.join(failed)}")
+
+@click.command('refresh-indicators')
+@click.argument('tickers', nargs=-1)
+@click.option('--reset', is_flag=True, help='Recompute the full history instead of resuming from the saved state.')
+@click.option('--check', is_flag=True, help='Compare incremental updates with a full recompute instead of refreshing.')
+@click.option('--tolerance', default=1e-9, show_default=True, help='Largest relative difference --check accepts.')
+@click.option('--watchlist', 'watchlist_id', type=int, help='Refresh the securities of a watchlist.')
+@click.option('--batch-size', default=100, show_default=True, help='Securities computed together as one matrix.')
+@with_appcontext
+def refresh_indicators_command(tickers, reset, check, tolerance, watchlist_id, batch_size):
+    """Update stored indicators for TICKERS (defaults to every active security)
+    
+    --check also compares the batch matrix computation with per-security
+    computation.
+    """
+    if tickers:
+        securities = Security.query.filter(Security.symbol.in_([t.upper() for t in tickers])).all()
+    elif watchlist_id is not None:
+        securities = Security.query.join(WatchlistItem, WatchlistItem.security_id == Security.id).filter(
+            WatchlistItem.watchlist_id == watchlist_id
+        ).all()
+    else:
+        securities = Security.query.filter_by(is_active=True).all()
+    engine = IndicatorEngine(batch_size=batch_size)
+    
+    if not check:
+        summary = engine.refresh([s.id for s in securities], reset=reset)
+        click.echo(
+            f"Updated {summary['updated']} securities and recomputed {summary['seeded']} "
+            f"({summary['bars']} bars) in {summary['execution_time']:.1f}s"
+        )
+        return
+    
+    failed = []
+    for security in securities:
+        differences = engine.check(security.id)
+        if differences is None:
+            continue
+        worst = max(differences, key=differences.get)
+        if differences[worst] > tolerance:
+            failed.append(security.symbol)
+            click.echo(f"FAIL {security.symbol}: {worst} differs by {differences[worst]:.3g}")
+    
+    symbols = {security.id: security.symbol for security in securities}
+    ids = list(symbols)
+    for start in range(0, len(ids), batch_size):
+        for security_id, differences in engine.check_batch(ids[start:start + batch_size]).items():
+            worst = max(differences, key=differences.get)
+            if differences[worst] > tolerance:
+                failed.append(symbols[security_id])
+                click.echo(f"FAIL {symbols[security_id]}: batch {worst} differs by {differences[worst]:.3g}")
+    failed = list(dict.fromkeys(failed))
+    
+    click.echo(f"{len(securities) - len(failed)}/{len(securities)} securities match a full recompute")
+    if failed:
+        raise click.ClickException(f"Incremental indicators diverged for {', '.join(failed)}")
+
+@click.command('check-swap-cycles')
+@click.argument('tickers', nargs=-1)
+@click.option('--lookback', default=365, show_default=True, help='Days of history to detect cycles in.')
+@click.option('--tolerance', default=1e-9, show_default=True, help='Largest relative difference in cycle statistics.')
+@with_appcontext
+def check_swap_cycles_command(tickers, lookback, tolerance):
+    """Check that vectorized swap cycle detection matches the bar-by-bar reference for TICKERS
+    
+    Defaults to every active security. Nothing is written.
+    """
+    if tickers:
+        securities = Security.query.filter(Security.symbol.in_([t.upper() for t in tickers])).all()
+    else:
+        securities = Security.query.filter_by(is_active=True).all()
+    analytics_service = AnalyticsService()
+    start_date = datetime.now().date() - timedelta(days=lookback)
+    
+    failed = []
+    timings = {'iterative': 0.0, 'vectorized': 0.0}
+    for security in securities:
+        df = analytics_service.swap_cycle_frame(security.id, start_date)
+        if df is None:
+            continue
+        start = time.perf_counter()
+        expected = find_swap_cycles_iterative(df)
+        timings['iterative'] += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = find_swap_cycles(df)
+        timings['vectorized'] += time.perf_counter() - start
+        
+        difference = compare_swap_cycles(expected, actual)
+        if difference > tolerance:
+            failed.append(security.symbol)
+            click.echo(f"FAIL {security.symbol}: {len(expected)} cycles expected, {len(actual)} found, "
+                       f"statistics differ by {difference:.3g}")
+    
+    click.echo(
+        f"{len(securities) - len(failed)}/{len(securities)} securities match "
+        f"(iterative {timings['iterative']:.2f}s, vectorized {timings['vectorized']:.2f}s)"
+    )
+    if failed:
+        raise click.ClickException(f"Swap cycles differ for {', '.join(failed)}")
+
+def register_commands(app):
+    """Register all CLI commands with the Flask app"""
+    app.cli.add_command(sync_prices_command)
+    app.cli.add_command(ftd_backfill_command)
+    app.cli.add_command(migrate_indicators_command)
+    app.cli.add_command(retention_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(refresh_indicators_command)
+    app.cli.add_command(check_swap_cycles_command)
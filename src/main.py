@@ -5,8 +5,10 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
-from src.models import init_app
+from src.models import init_app, database_uri
 from src.routes import register_routes
+from src.cli import register_commands
+from src.services.write_behind import init_write_behind
 
 # Set up Polygon API key from environment variable
 if not os.environ.get('POLYGON_API_KEY'):
@@ -21,20 +23,27 @@ CORS(app)
 # Register routes
 register_routes(app)
 
+# Register CLI commands
+register_commands(app)
+
 # Configure database
-# Use /tmp on Render for writable database location
+# SQLALCHEMY_DATABASE_URI or DATABASE_URL select another backend such as PostgreSQL,
+# otherwise use SQLite, in /tmp on Render for a writable database location
 if os.environ.get('RENDER'):
     db_path = '/tmp/app.db'
 else:
     db_path = os.path.join(os.path.dirname(__file__), 'database', 'app.db')
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(f"sqlite:///{db_path}")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize database
 db = init_app(app)
 
+# Persist analytics results in the background
+init_write_behind(app)
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
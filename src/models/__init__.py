@@ -1,20 +1,24 @@
-from flask_sqlalchemy import SQLAlchemy
-
-db = SQLAlchemy()
+from .base import db
 
 # Import all models to ensure they are registered with SQLAlchemy
-from .security import Security, PriceData, FTDData, InstitutionalOwnership, OptionData, ETFHolding
+from .security import Security, PriceData, IntradayBar, PriceCoverage, FTDData, FTDArchive, InstitutionalOwnership, OptionData, ETFHolding
 from .user import User, Watchlist, WatchlistItem, UserSetting, Alert
-from .analytics import SwapCycle, VolatilityCycle, MarketCorrelation, TechnicalIndicator
-from .api_integration import ApiProvider, ApiKey, ApiEndpoint, ApiCallLog, DataSyncLog
+from .analytics import SwapCycle, VolatilityCycle, MarketCorrelation, TechnicalIndicator, IndicatorSnapshot, IndicatorState
+from .api_integration import ApiProvider, ApiKey, ApiEndpoint, ApiCallLog, ApiCallRollup, DataSyncLog
+from .storage import configure_storage, attach_pragmas, pool_metrics, database_uri
+from .schema import ensure_columns, ensure_indexes
 
 def init_app(app):
     """Initialize the SQLAlchemy app"""
+    configure_storage(app)
     db.init_app(app)
     
     # Create tables if they don't exist
     with app.app_context():
+        attach_pragmas(db.engine)
         db.create_all()
+        ensure_columns(db.engine, db.metadata)
+        ensure_indexes(db.engine, db.metadata)
         
     return db
 
@@ -1,6 +1,5 @@
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from .security import db
+from .base import db
 
 class SwapCycle(db.Model):
     """Model for swap theory cycle data"""
@@ -24,6 +23,11 @@ class SwapCycle(db.Model):
     # Relationship
     security = db.relationship('Security', backref='swap_cycles')
     
+    __table_args__ = (
+        db.UniqueConstraint('security_id', 'start_date', 'end_date', name='uix_swap_cycle_security_start_end'),
+        db.Index('ix_swap_cycles_security_active', 'security_id', 'is_active'),
+    )
+    
     def __repr__(self):
         return f'<SwapCycle {self.security.symbol} {self.cycle_type} #{self.cycle_number}>'
 
@@ -171,3 +175,85 @@ class TechnicalIndicator(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+
+class IndicatorSnapshot(db.Model):
+    """Model for all technical indicator values of a security on one date, one column per indicator"""
+    __tablename__ = 'indicator_snapshots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    security_id = db.Column(db.Integer, db.ForeignKey('securities.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    timeframe = db.Column(db.String(10), nullable=False, default='1d')  # 1d, 1h, etc.
+    sma_20 = db.Column(db.Float)
+    sma_50 = db.Column(db.Float)
+    sma_200 = db.Column(db.Float)
+    ema_12 = db.Column(db.Float)
+    ema_26 = db.Column(db.Float)
+    macd = db.Column(db.Float)
+    macd_signal = db.Column(db.Float)
+    macd_histogram = db.Column(db.Float)
+    rsi = db.Column(db.Float)
+    bb_upper = db.Column(db.Float)
+    bb_middle = db.Column(db.Float)
+    bb_lower = db.Column(db.Float)
+    rsi_trade_signal = db.Column(db.String(10))  # buy, sell, hold
+    macd_trade_signal = db.Column(db.String(10))  # buy, sell, hold
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationship
+    security = db.relationship('Security', backref='indicator_snapshots')
+    
+    __table_args__ = (
+        db.UniqueConstraint('security_id', 'timeframe', 'date',
+                           name='uix_indicator_snapshot_security_timeframe_date'),
+    )
+    
+    def __repr__(self):
+        return f'<IndicatorSnapshot {self.security.symbol} {self.timeframe} {self.date}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'security_id': self.security_id,
+            'security_symbol': self.security.symbol if self.security else None,
+            'date': self.date.isoformat() if self.date else None,
+            'timeframe': self.timeframe,
+            'sma_20': self.sma_20,
+            'sma_50': self.sma_50,
+            'sma_200': self.sma_200,
+            'ema_12': self.ema_12,
+            'ema_26': self.ema_26,
+            'macd': self.macd,
+            'macd_signal': self.macd_signal,
+            'macd_histogram': self.macd_histogram,
+            'rsi': self.rsi,
+            'bb_upper': self.bb_upper,
+            'bb_middle': self.bb_middle,
+            'bb_lower': self.bb_lower,
+            'rsi_trade_signal': self.rsi_trade_signal,
+            'macd_trade_signal': self.macd_trade_signal,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class IndicatorState(db.Model):
+    """Model for the running indicator state of a security, resumed by the incremental engine"""
+    __tablename__ = 'indicator_states'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    security_id = db.Column(db.Integer, db.ForeignKey('securities.id'), nullable=False)
+    timeframe = db.Column(db.String(10), nullable=False, default='1d')  # 1d, 1h, etc.
+    last_date = db.Column(db.Date, nullable=False)  # Last bar folded into the state
+    bar_count = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.Text, nullable=False)  # JSON string of window sums, buffers and EMA values
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationship
+    security = db.relationship('Security')
+    
+    __table_args__ = (
+        db.UniqueConstraint('security_id', 'timeframe', name='uix_indicator_state_security_timeframe'),
+    )
+    
+    def __repr__(self):
+        return f'<IndicatorState {self.security.symbol} {self.timeframe} {self.last_date}>'
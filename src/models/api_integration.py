@@ -1,6 +1,5 @@
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from .security import db
+from .base import db
 
 class ApiProvider(db.Model):
     """Model for API providers"""
@@ -127,6 +126,10 @@ class ApiCallLog(db.Model):
     provider = db.relationship('ApiProvider')
     endpoint = db.relationship('ApiEndpoint')
     
+    __table_args__ = (
+        db.Index('ix_api_call_logs_created_at', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<ApiCallLog {self.provider.name} {self.request_method} {self.created_at}>'
 
@@ -149,6 +152,51 @@ class ApiCallLog(db.Model):
         }
 
 
+class ApiCallRollup(db.Model):
+    """Model for hourly aggregates of API call logs per provider and endpoint"""
+    __tablename__ = 'api_call_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('api_providers.id'), nullable=False)
+    endpoint_id = db.Column(db.Integer, db.ForeignKey('api_endpoints.id'))
+    hour = db.Column(db.DateTime, nullable=False)  # Start of the hour, UTC
+    call_count = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    response_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    latency_p50 = db.Column(db.Float)  # Time in seconds
+    latency_p95 = db.Column(db.Float)
+    latency_p99 = db.Column(db.Float)
+    latency_max = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    provider = db.relationship('ApiProvider')
+    endpoint = db.relationship('ApiEndpoint')
+    
+    __table_args__ = (
+        db.Index('ix_api_call_rollups_hour_provider', 'hour', 'provider_id'),
+    )
+    
+    def __repr__(self):
+        return f'<ApiCallRollup {self.provider_id} {self.endpoint_id} {self.hour}>'
+
+    def to_dict(self):
+        return {
+            'provider_id': self.provider_id,
+            'provider_name': self.provider.name if self.provider else None,
+            'endpoint_id': self.endpoint_id,
+            'endpoint_name': self.endpoint.name if self.endpoint else None,
+            'hour': self.hour.isoformat() if self.hour else None,
+            'call_count': self.call_count,
+            'error_count': self.error_count,
+            'response_bytes': self.response_bytes,
+            'latency_p50': self.latency_p50,
+            'latency_p95': self.latency_p95,
+            'latency_p99': self.latency_p99,
+            'latency_max': self.latency_max
+        }
+
+
 class DataSyncLog(db.Model):
     """Model for data synchronization logs"""
     __tablename__ = 'data_sync_logs'
@@ -170,6 +218,10 @@ class DataSyncLog(db.Model):
     # Relationship
     security = db.relationship('Security')
     
+    __table_args__ = (
+        db.Index('ix_data_sync_logs_created_at', 'created_at'),
+    )
+    
     def __repr__(self):
         security_symbol = self.security.symbol if self.security else 'ALL'
         return f'<DataSyncLog {self.data_type} {security_symbol} {self.created_at}>'
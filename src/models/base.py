@@ -0,0 +1,4 @@
+from flask_sqlalchemy import SQLAlchemy
+
+# The single SQLAlchemy instance, engine and connection pool every model registers against
+db = SQLAlchemy()
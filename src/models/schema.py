@@ -0,0 +1,78 @@
+import logging
+from sqlalchemy import inspect, text, UniqueConstraint
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _existing_keys(inspector, table_name):
+    """Get the column tuples of a table's existing unique constraints and indexes"""
+    indexes = inspector.get_indexes(table_name)
+    unique = {tuple(c['column_names']) for c in inspector.get_unique_constraints(table_name)}
+    unique.update(tuple(index['column_names']) for index in indexes if index.get('unique'))
+    return unique, {index['name'] for index in indexes}
+
+
+def ensure_columns(engine, metadata):
+    """Add nullable columns declared on models to existing tables
+    
+    ``create_all`` only creates missing tables, so a column added to a model
+    later never reaches an existing database. Only nullable columns without a
+    server default are added, existing rows get NULL.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        
+        for column in table.columns:
+            if column.name in existing_columns or not column.nullable or column.server_default is not None:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            logger.info(f"Added column {column.name} to {table.name}")
+
+
+def ensure_indexes(engine, metadata):
+    """Add unique constraints and indexes declared on models to existing tables
+    
+    ``create_all`` only creates missing tables, so constraints and indexes added
+    to a model later never reach an existing database. Missing unique
+    constraints are created as unique indexes of the same name, after removing
+    duplicate rows (the row with the highest id is kept).
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        unique_keys, index_names = _existing_keys(inspector, table.name)
+        
+        for constraint in table.constraints:
+            if not isinstance(constraint, UniqueConstraint):
+                continue
+            columns = tuple(column.name for column in constraint.columns)
+            if columns in unique_keys:
+                continue
+            
+            column_list = ', '.join(columns)
+            with engine.begin() as conn:
+                removed = conn.execute(text(
+                    f'DELETE FROM {table.name} WHERE id NOT IN '
+                    f'(SELECT MAX(id) FROM {table.name} GROUP BY {column_list})'
+                )).rowcount
+                conn.execute(text(
+                    f'CREATE UNIQUE INDEX IF NOT EXISTS {constraint.name} ON {table.name} ({column_list})'
+                ))
+            logger.info(f"Added unique index {constraint.name} to {table.name} ({removed} duplicate rows removed)")
+        
+        for index in table.indexes:
+            if index.name not in index_names:
+                index.create(engine, checkfirst=True)
+                logger.info(f"Added index {index.name} to {table.name}")
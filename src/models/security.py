@@ -1,7 +1,5 @@
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-
-db = SQLAlchemy()
+from .base import db
 
 class Security(db.Model):
     """Model for securities (stocks, ETFs, etc.)"""
@@ -44,12 +42,66 @@ class PriceData(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('security_id', 'date', name='uix_price_data_security_date'),
+        # Covers the date-ordered OHLCV frame loads so they never touch the table
+        db.Index('ix_price_data_security_date_ohlcv', 'security_id', 'date',
+                 'open', 'high', 'low', 'close', 'volume', 'vwap'),
     )
     
     def __repr__(self):
         return f'<PriceData {self.security.symbol} {self.date}>'
 
 
+class IntradayBar(db.Model):
+    """Model for intraday (minute/hour) price bars
+    
+    Rows are clustered by security, timespan and month so a chart window reads
+    one contiguous range of the primary key.
+    """
+    __tablename__ = 'intraday_bars'
+    
+    security_id = db.Column(db.Integer, db.ForeignKey('securities.id'), primary_key=True)
+    timespan = db.Column(db.String(10), primary_key=True)  # minute, hour
+    month = db.Column(db.Integer, primary_key=True)  # YYYYMM partition key (UTC)
+    timestamp = db.Column(db.BigInteger, primary_key=True)  # Bar start, epoch milliseconds
+    open = db.Column(db.Float)
+    high = db.Column(db.Float)
+    low = db.Column(db.Float)
+    close = db.Column(db.Float, nullable=False)
+    volume = db.Column(db.Float)
+    vwap = db.Column(db.Float)
+    transactions = db.Column(db.Integer)
+    
+    __table_args__ = (
+        {'sqlite_with_rowid': False},
+    )
+    
+    def __repr__(self):
+        return f'<IntradayBar {self.security_id} {self.timespan} {self.timestamp}>'
+
+
+class PriceCoverage(db.Model):
+    """Model for contiguous date ranges already synced from the price provider"""
+    __tablename__ = 'price_coverage'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    security_id = db.Column(db.Integer, db.ForeignKey('securities.id'), nullable=False)
+    timespan = db.Column(db.String(10), nullable=False)  # day, hour, minute
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationship
+    security = db.relationship('Security')
+    
+    __table_args__ = (
+        db.Index('ix_price_coverage_security_timespan_start', 'security_id', 'timespan', 'start_date'),
+        db.UniqueConstraint('security_id', 'timespan', 'start_date', name='uix_price_coverage_security_timespan_start'),
+    )
+    
+    def __repr__(self):
+        return f'<PriceCoverage {self.security.symbol} {self.timespan} {self.start_date}..{self.end_date}>'
+
+
 class FTDData(db.Model):
     """Model for Failure-to-Deliver data"""
     __tablename__ = 'ftd_data'
@@ -70,6 +122,23 @@ class FTDData(db.Model):
         return f'<FTDData {self.security.symbol} {self.date}>'
 
 
+class FTDArchive(db.Model):
+    """Model for SEC FTD archives that have been fully loaded into ftd_data"""
+    __tablename__ = 'ftd_archives'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(255), unique=True, nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    half = db.Column(db.Integer, nullable=False)
+    records_loaded = db.Column(db.Integer, default=0)
+    symbols_loaded = db.Column(db.Integer, default=0)
+    sha256 = db.Column(db.String(64))  # Content digest of the loaded archive, to spot republished files
+    loaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FTDArchive {self.url}>'
+
+
 class InstitutionalOwnership(db.Model):
     """Model for institutional ownership data"""
     __tablename__ = 'institutional_ownership'
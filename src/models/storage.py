@@ -0,0 +1,156 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite pragmas applied to every new connection, each overridable by env var
+SQLITE_PRAGMAS = {
+    # auto_vacuum must be set before anything writes the database header, and
+    # only takes effect on new databases
+    'auto_vacuum': ('SQLITE_AUTO_VACUUM', 'INCREMENTAL'),
+    'journal_mode': ('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': ('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': ('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'cache_size': ('SQLITE_CACHE_SIZE', str(-64 * 1024)),  # negative values are KiB, so 64 MiB
+    'busy_timeout': ('SQLITE_BUSY_TIMEOUT', '5000')  # milliseconds
+}
+
+# Engine pool options, each overridable by env var
+POOL_OPTIONS = {
+    'pool_size': ('DB_POOL_SIZE', int, 10),
+    'max_overflow': ('DB_MAX_OVERFLOW', int, 20),
+    'pool_timeout': ('DB_POOL_TIMEOUT', float, 30),
+    'pool_recycle': ('DB_POOL_RECYCLE', int, 3600),
+    'pool_pre_ping': ('DB_POOL_PRE_PING', lambda value: value.lower() in ('1', 'true', 'yes'), True)
+}
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records checkouts, time spent waiting for a connection and overflow use"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'max_overflow_used': 0
+        }
+    
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._metrics_lock:
+                self._metrics['timeouts'] += 1
+            raise
+        
+        waited = time.perf_counter() - start_time
+        with self._metrics_lock:
+            self._metrics['checkouts'] += 1
+            self._metrics['wait_time'] += waited
+            self._metrics['max_wait_time'] = max(self._metrics['max_wait_time'], waited)
+            self._metrics['max_overflow_used'] = max(self._metrics['max_overflow_used'], max(self.overflow(), 0))
+        return connection
+    
+    def recreate(self):
+        """Recreate the pool, keeping it instrumented"""
+        pool = super().recreate()
+        pool._metrics = self._metrics
+        pool._metrics_lock = self._metrics_lock
+        return pool
+    
+    def get_metrics(self):
+        """Get checkout counters along with the pool's current state"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics.update({
+            'pool_size': self.size(),
+            'checked_out': self.checkedout(),
+            'idle': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+            'average_wait_time': metrics['wait_time'] / metrics['checkouts'] if metrics['checkouts'] else 0.0
+        })
+        return metrics
+
+
+def pool_metrics(engine):
+    """Get connection pool metrics for an engine, or None if its pool isn't instrumented"""
+    pool = engine.pool
+    return pool.get_metrics() if isinstance(pool, InstrumentedQueuePool) else None
+
+
+def sqlite_pragmas():
+    """Get the pragmas for the configured SQLite profile
+    
+    Setting SQLITE_PROFILE=default disables tuning and leaves SQLite's defaults.
+    """
+    if os.environ.get('SQLITE_PROFILE', 'production').lower() == 'default':
+        return {}
+    return {name: os.environ.get(env, default) for name, (env, default) in SQLITE_PRAGMAS.items()}
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas=None):
+    """Apply pragmas to a raw sqlite3 connection"""
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def database_uri(default):
+    """Get the database URI from SQLALCHEMY_DATABASE_URI or DATABASE_URL, falling back to a default"""
+    uri = os.environ.get('SQLALCHEMY_DATABASE_URI') or os.environ.get('DATABASE_URL') or default
+    # Hosted Postgres services hand out postgres:// URLs, which SQLAlchemy no longer accepts
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def engine_options(uri):
+    """Get SQLAlchemy engine options for a database URI"""
+    options = {}
+    # In-memory SQLite uses a per-thread pool that can't be sized
+    if uri.startswith('sqlite') and (uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri):
+        return options
+    
+    options['poolclass'] = InstrumentedQueuePool
+    for name, (env, cast, default) in POOL_OPTIONS.items():
+        value = os.environ.get(env)
+        options[name] = cast(value) if value is not None else default
+    return options
+
+
+def configure_storage(app):
+    """Apply the storage profile to an app before the database is initialized"""
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    options = engine_options(uri)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def attach_pragmas(engine):
+    """Apply the SQLite profile to every connection the engine opens"""
+    if engine.dialect.name != 'sqlite':
+        return
+    
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            apply_sqlite_pragmas(dbapi_connection)
+    
+    logger.info(f"Using SQLite profile {sqlite_pragmas() or 'default'}")
@@ -1,7 +1,5 @@
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-
-db = SQLAlchemy()
+from .base import db
 
 class User(db.Model):
     """Model for users"""
@@ -144,6 +142,11 @@ class Alert(db.Model):
     user = db.relationship('User', backref='alerts')
     security = db.relationship('Security')
     
+    __table_args__ = (
+        db.Index('ix_alerts_user_active', 'user_id', 'is_active'),
+        db.Index('ix_alerts_security_active', 'security_id', 'is_active'),
+    )
+    
     def __repr__(self):
         return f'<Alert {self.alert_type} {self.value} for {self.security.symbol}>'
 
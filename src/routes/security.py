@@ -2,9 +2,13 @@ from flask import Blueprint, jsonify, request
 from datetime import datetime, timedelta
 from ..models import db, Security, PriceData, FTDData
 from ..services.polygon_service import PolygonService
+from ..services.intraday_store import INTRADAY_TIMESPANS
 from ..services.ftd_service import FTDService
 from ..services.analytics_service import AnalyticsService
+from ..services.indicator_registry import resolve_indicators
+from ..services.data_access import load_price_frame, load_ftd_frame, has_price_data, frame_records
 import os
+import numpy as np
 
 security_bp = Blueprint('security', __name__, url_prefix='/api/securities')
 
@@ -13,6 +17,10 @@ _polygon_service = None
 _ftd_service = None
 _analytics_service = None
 
+def security_fields(security):
+    """Get a security's column values for a JSON response"""
+    return {column.name: getattr(security, column.name) for column in security.__table__.columns}
+
 def get_polygon_service():
     """Get or create polygon service instance"""
     global _polygon_service
@@ -41,7 +49,7 @@ def get_securities():
         securities = Security.query.all()
         return jsonify({
             'success': True,
-            'data': [s.__dict__ for s in securities]
+            'data': [security_fields(s) for s in securities]
         }), 200
     except Exception as e:
         return jsonify({
@@ -73,7 +81,60 @@ def search_securities():
         
         return jsonify({
             'success': True,
-            'data': [s.__dict__ for s in securities]
+            'data': [security_fields(s) for s in securities]
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@security_bp.route('/correlation-matrix', methods=['GET'])
+def get_correlation_matrix():
+    """Get correlation, covariance and beta matrices between securities for several lookback windows"""
+    try:
+        # Parse query parameters
+        tickers = [t.strip() for t in request.args.get('tickers', '').split(',') if t.strip()]
+        windows = request.args.get('windows', '30,90,365')
+        
+        if len(tickers) < 2:
+            return jsonify({
+                'success': False,
+                'error': 'At least 2 tickers are required'
+            }), 400
+        try:
+            windows = [int(w) for w in windows.split(',') if w.strip()]
+        except ValueError:
+            windows = []
+        if not windows or min(windows) < 2:
+            return jsonify({
+                'success': False,
+                'error': 'Windows must be comma-separated numbers of days, at least 2'
+            }), 400
+        
+        # Calculate the matrices
+        analytics_service = get_analytics_service()
+        result = analytics_service.calculate_correlation_matrix(tickers, windows)
+        if not result:
+            return jsonify({
+                'success': False,
+                'error': 'Failed to calculate correlation matrix'
+            }), 500
+        
+        # Pairs without enough data are null
+        return jsonify({
+            'success': True,
+            'data': {
+                'tickers': [s.symbol for s in result['securities']],
+                'windows': {
+                    str(window): {
+                        name: np.where(np.isnan(values), None, values).tolist() if values.dtype.kind == 'f'
+                        else values.tolist()
+                        for name, values in matrices.items()
+                    }
+                    for window, matrices in result['matrices'].items()
+                }
+            }
         }), 200
     except Exception as e:
         return jsonify({
@@ -100,7 +161,7 @@ def get_security(ticker):
         
         return jsonify({
             'success': True,
-            'data': security.__dict__
+            'data': security_fields(security)
         }), 200
     except Exception as e:
         return jsonify({
@@ -130,17 +191,56 @@ def get_security_price(ticker):
                     'error': f'Security {ticker} not found'
                 }), 404
         
-        # Check if we have price data in the database
-        price_data = PriceData.query.filter_by(security_id=security.id).all()
+        # Intraday bars live in their own store and are always served for a window
+        if timespan in INTRADAY_TIMESPANS:
+            polygon_service = get_polygon_service()
+            result = polygon_service.get_intraday_data(
+                ticker.upper(),
+                timespan=timespan,
+                from_date=from_date,
+                to_date=to_date
+            )
+            if not result:
+                return jsonify({
+                    'success': False,
+                    'error': f'Failed to fetch {timespan} bars for {ticker}'
+                }), 500
+            
+            formatted_data = []
+            for bar in result['bars']:
+                formatted_data.append({
+                    'timestamp': datetime.utcfromtimestamp(bar['timestamp'] / 1000).isoformat() + 'Z',
+                    'open': bar['open'],
+                    'high': bar['high'],
+                    'low': bar['low'],
+                    'close': bar['close'],
+                    'volume': bar['volume'],
+                    'vwap': bar['vwap']
+                })
+            
+            return jsonify({
+                'success': True,
+                'data': {
+                    'security': security_fields(security),
+                    'price_data': formatted_data
+                }
+            }), 200
+        
+        if timespan != 'day':
+            return jsonify({
+                'success': False,
+                'error': f'Unsupported timespan {timespan}'
+            }), 400
         
-        # If no price data or requesting specific date range, fetch from Polygon API
-        if not price_data or from_date or to_date:
+        # If no price data or requesting specific date range, fill any gaps from Polygon API
+        if not has_price_data(security.id) or from_date or to_date:
             polygon_service = get_polygon_service()
             result = polygon_service.get_price_data(
                 ticker.upper(),
                 timespan=timespan,
                 from_date=from_date,
-                to_date=to_date
+                to_date=to_date,
+                as_frame=True
             )
             if not result:
                 return jsonify({
@@ -149,25 +249,14 @@ def get_security_price(ticker):
                 }), 500
             
             price_data = result['price_data']
-        
-        # Format response
-        formatted_data = []
-        for p in price_data:
-            formatted_data.append({
-                'date': p.date.isoformat(),
-                'open': p.open,
-                'high': p.high,
-                'low': p.low,
-                'close': p.close,
-                'volume': p.volume,
-                'vwap': p.vwap
-            })
+        else:
+            price_data = load_price_frame(security.id)
         
         return jsonify({
             'success': True,
             'data': {
-                'security': security.__dict__,
-                'price_data': formatted_data
+                'security': security_fields(security),
+                'price_data': frame_records(price_data)
             }
         }), 200
     except Exception as e:
@@ -194,6 +283,7 @@ def get_security_ftd(ticker):
         
         # If not found, fetch from Polygon API
         if not security:
+            polygon_service = get_polygon_service()
             security = polygon_service.get_ticker_details(ticker.upper())
             if not security:
                 return jsonify({
@@ -202,11 +292,12 @@ def get_security_ftd(ticker):
                 }), 404
         
         # Check if we have FTD data in the database
-        ftd_data = FTDData.query.filter_by(security_id=security.id).all()
+        ftd_data = load_ftd_frame(security.id)
         
-        # If no FTD data or requesting specific year/half, fetch from SEC EDGAR
-        if not ftd_data or (year and half):
-            result = ftd_service.fetch_ftd_data(ticker.upper(), year, half)
+        # If no FTD data or requesting specific year/half, make sure that period's archives are loaded
+        if ftd_data is None or (year and half):
+            ftd_service = get_ftd_service()
+            result = ftd_service.fetch_ftd_data(ticker.upper(), year, half, as_frame=True)
             if not result:
                 return jsonify({
                     'success': False,
@@ -215,21 +306,11 @@ def get_security_ftd(ticker):
             
             ftd_data = result['ftd_data']
         
-        # Format response
-        formatted_data = []
-        for f in ftd_data:
-            formatted_data.append({
-                'date': f.date.isoformat(),
-                'quantity': f.quantity,
-                'price': f.price,
-                'value': f.value
-            })
-        
         return jsonify({
             'success': True,
             'data': {
-                'security': security.__dict__,
-                'ftd_data': formatted_data
+                'security': security_fields(security),
+                'ftd_data': frame_records(ftd_data)
             }
         }), 200
     except Exception as e:
@@ -245,14 +326,24 @@ def get_security_indicators(ticker):
         # Parse query parameters
         from_date = request.args.get('from')
         to_date = request.args.get('to')
+        selector = request.args.get('indicators')
         
         if from_date:
             from_date = datetime.strptime(from_date, '%Y-%m-%d').date()
         if to_date:
             to_date = datetime.strptime(to_date, '%Y-%m-%d').date()
         
+        try:
+            indicators = resolve_indicators(selector)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         # Calculate technical indicators
-        result = analytics_service.calculate_technical_indicators(ticker.upper(), from_date, to_date)
+        analytics_service = get_analytics_service()
+        result = analytics_service.calculate_technical_indicators(ticker.upper(), from_date, to_date, indicators)
         if not result:
             return jsonify({
                 'success': False,
@@ -262,7 +353,7 @@ def get_security_indicators(ticker):
         return jsonify({
             'success': True,
             'data': {
-                'security': result['security'].__dict__,
+                'security': security_fields(result['security']),
                 'indicators': result['indicators']
             }
         }), 200
@@ -281,6 +372,7 @@ def get_security_swap_cycles(ticker):
         lookback_days = int(lookback_days)
         
         # Analyze swap cycles
+        analytics_service = get_analytics_service()
         result = analytics_service.analyze_swap_cycles(ticker.upper(), lookback_days)
         if not result:
             return jsonify({
@@ -291,7 +383,7 @@ def get_security_swap_cycles(ticker):
         return jsonify({
             'success': True,
             'data': {
-                'security': result['security'].__dict__,
+                'security': security_fields(result['security']),
                 'cycles': result['cycles'],
                 'price_data': result['price_data']
             }
@@ -311,6 +403,7 @@ def get_security_volatility_cycles(ticker):
         lookback_days = int(lookback_days)
         
         # Analyze volatility cycles
+        analytics_service = get_analytics_service()
         result = analytics_service.analyze_volatility_cycles(ticker.upper(), lookback_days)
         if not result:
             return jsonify({
@@ -321,7 +414,7 @@ def get_security_volatility_cycles(ticker):
         return jsonify({
             'success': True,
             'data': {
-                'security': result['security'].__dict__,
+                'security': security_fields(result['security']),
                 'volatility_data': result['volatility_data']
             }
         }), 200
@@ -343,6 +436,7 @@ def get_security_correlations(ticker):
         comparison_tickers = comparison.split(',')
         
         # Calculate correlations
+        analytics_service = get_analytics_service()
         result = analytics_service.calculate_market_correlations(ticker.upper(), comparison_tickers, lookback_days)
         if not result:
             return jsonify({
@@ -353,7 +447,7 @@ def get_security_correlations(ticker):
         return jsonify({
             'success': True,
             'data': {
-                'security': result['security'].__dict__,
+                'security': security_fields(result['security']),
                 'correlations': result['correlations']
             }
         }), 200
@@ -0,0 +1,75 @@
+from flask import Blueprint, jsonify, request, current_app
+from datetime import datetime
+from ..models import db, pool_metrics, ApiProvider, ApiEndpoint
+from ..services.rate_limiter import get_rate_limiter
+from ..services.retention_service import RetentionService
+
+system_bp = Blueprint('system', __name__, url_prefix='/api/system')
+
+@system_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Get connection pool, write-behind queue and rate limiter metrics"""
+    try:
+        write_behind = current_app.extensions.get('write_behind')
+        return jsonify({
+            'success': True,
+            'data': {
+                'database': {
+                    'dialect': db.engine.dialect.name,
+                    'pool': pool_metrics(db.engine)
+                },
+                'write_behind': write_behind.get_metrics() if write_behind else None,
+                'rate_limits': get_rate_limiter().get_metrics()
+            }
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@system_bp.route('/api-usage', methods=['GET'])
+def get_api_usage():
+    """Get hourly API call rollups"""
+    try:
+        # Parse query parameters
+        provider_name = request.args.get('provider')
+        endpoint_name = request.args.get('endpoint')
+        from_date = request.args.get('from')
+        to_date = request.args.get('to')
+        
+        if from_date:
+            from_date = datetime.fromisoformat(from_date)
+        if to_date:
+            to_date = datetime.fromisoformat(to_date)
+        
+        provider_id = None
+        endpoint_id = None
+        if provider_name:
+            provider = ApiProvider.query.filter_by(name=provider_name).first()
+            if not provider:
+                return jsonify({
+                    'success': False,
+                    'error': f'Provider {provider_name} not found'
+                }), 404
+            provider_id = provider.id
+            
+            if endpoint_name:
+                endpoint = ApiEndpoint.query.filter_by(provider_id=provider.id, name=endpoint_name).first()
+                if not endpoint:
+                    return jsonify({
+                        'success': False,
+                        'error': f'Endpoint {endpoint_name} not found'
+                    }), 404
+                endpoint_id = endpoint.id
+        
+        rollups = RetentionService().get_rollups(provider_id, endpoint_id, from_date, to_date)
+        return jsonify({
+            'success': True,
+            'data': [rollup.to_dict() for rollup in rollups]
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
@@ -0,0 +1,198 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ArchiveCache:
+    """Content-addressed on-disk cache for downloaded archives
+    
+    Archive bodies are stored once under ``blobs/`` named by their SHA-256, and
+    each URL has a small JSON ref under ``refs/`` recording which blob it last
+    resolved to along with the ETag and Last-Modified validators used for
+    conditional refreshes. All writes go through a temp file and ``os.replace``
+    so concurrent workers never observe partial files. Once the blobs exceed
+    ``max_bytes`` the least recently used ones are evicted, except blobs pinned
+    by this process while they are still being read.
+    """
+    
+    DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+    
+    def __init__(self, directory=None, max_bytes=None):
+        """Initialize the cache with its directory and size budget"""
+        self.directory = directory or os.environ.get(
+            'ARCHIVE_CACHE_DIR',
+            os.path.join(tempfile.gettempdir(), 'finport_archive_cache')
+        )
+        self.max_bytes = max_bytes or int(os.environ.get('ARCHIVE_CACHE_MAX_BYTES', self.DEFAULT_MAX_BYTES))
+        self.blob_dir = os.path.join(self.directory, 'blobs')
+        self.ref_dir = os.path.join(self.directory, 'refs')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.ref_dir, exist_ok=True)
+        self._pins = Counter()
+        self._lock = threading.Lock()
+    
+    def _ref_path(self, url):
+        """Get the path of the ref file for a URL"""
+        return os.path.join(self.ref_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+    
+    def _blob_path(self, digest):
+        """Get the path of the blob with a content digest"""
+        return os.path.join(self.blob_dir, digest)
+    
+    def _write_atomic(self, path, data):
+        """Write a file so readers see either the old or the complete new contents"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def pin(self, entry):
+        """Keep a cache entry's content from being evicted until it is unpinned"""
+        with self._lock:
+            self._pins[entry['sha256']] += 1
+    
+    def unpin(self, entry):
+        """Release a pin taken on a cache entry"""
+        with self._lock:
+            self._pins[entry['sha256']] -= 1
+            if self._pins[entry['sha256']] <= 0:
+                del self._pins[entry['sha256']]
+    
+    def lookup(self, url, pin=False):
+        """Get the cache entry for a URL, or None if it isn't cached
+        
+        With ``pin`` the returned entry is pinned, and the caller must unpin it.
+        """
+        try:
+            with open(self._ref_path(url)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        
+        # The blob may have been evicted since the ref was written. Pinning
+        # before checking means it can't be evicted once it's found.
+        if pin:
+            self.pin(entry)
+        if not os.path.exists(self._blob_path(entry['sha256'])):
+            if pin:
+                self.unpin(entry)
+            return None
+        return entry
+    
+    def conditional_headers(self, entry):
+        """Get the validator headers for refreshing a cached entry"""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    def path(self, entry):
+        """Get the file path of a cache entry's content"""
+        return self._blob_path(entry['sha256'])
+    
+    def read(self, entry):
+        """Read the content of a cache entry, marking it as recently used"""
+        path = self._blob_path(entry['sha256'])
+        with open(path, 'rb') as f:
+            content = f.read()
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return content
+    
+    def store(self, url, content, etag=None, last_modified=None, pin=False):
+        """Store the content fetched from a URL, returning its cache entry
+        
+        With ``pin`` the returned entry is pinned, and the caller must unpin it.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        entry = {
+            'url': url,
+            'sha256': digest,
+            'size': len(content),
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': datetime.utcnow().isoformat()
+        }
+        if pin:
+            self.pin(entry)
+        
+        blob_path = self._blob_path(digest)
+        if os.path.exists(blob_path):
+            os.utime(blob_path)
+        else:
+            self._write_atomic(blob_path, content)
+        self._write_atomic(self._ref_path(url), json.dumps(entry).encode('utf-8'))
+        self.evict()
+        return entry
+    
+    def size(self):
+        """Get the total size of the cached blobs in bytes"""
+        total = 0
+        for entry in os.scandir(self.blob_dir):
+            if entry.is_file() and not entry.name.startswith('.tmp-'):
+                total += entry.stat().st_size
+        return total
+    
+    def evict(self, max_bytes=None):
+        """Delete least recently used blobs until the cache fits its size budget
+        
+        Pinned blobs are skipped, so the cache can stay over budget until they
+        are unpinned and it is evicted again.
+        """
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        blobs = []
+        for entry in os.scandir(self.blob_dir):
+            if entry.is_file() and not entry.name.startswith('.tmp-'):
+                stat = entry.stat()
+                blobs.append((stat.st_mtime, stat.st_size, entry.path))
+        
+        total = sum(size for _, size, _ in blobs)
+        evicted = 0
+        # Held while deleting, so a blob can't be pinned between the check and its removal
+        with self._lock:
+            for _, size, path in sorted(blobs):
+                if total <= max_bytes:
+                    break
+                if os.path.basename(path) in self._pins:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+        
+        if evicted:
+            logger.info(f"Evicted {evicted} archives from {self.directory}")
+        return evicted
+
+
+# Shared cache, created lazily
+_archive_cache = None
+
+def get_archive_cache():
+    """Get or create the process-wide archive cache"""
+    global _archive_cache
+    if _archive_cache is None:
+        _archive_cache = ArchiveCache()
+    return _archive_cache
@@ -0,0 +1,306 @@
+import io
+import os
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import select, tuple_, and_, Integer
+from sqlalchemy.dialects import sqlite, postgresql
+from ..models import db, Security, PriceData, FTDData
+from .columnar_store import get_columnar_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class BulkWriter:
+    """Batched INSERT ... ON CONFLICT DO UPDATE writer shared by ingestion paths"""
+    
+    def __init__(self, batch_size=500, copy_threshold=None):
+        """Initialize the writer with the number of rows per statement
+        
+        On PostgreSQL, upserts of at least ``copy_threshold`` rows (default
+        POSTGRES_COPY_THRESHOLD or 1000) are loaded with COPY instead.
+        """
+        self.batch_size = batch_size
+        self.copy_threshold = copy_threshold or int(os.environ.get('POSTGRES_COPY_THRESHOLD', 1000))
+    
+    def _dialect_insert(self):
+        """Get the dialect-specific insert construct supporting ON CONFLICT"""
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            return sqlite.insert
+        if dialect == 'postgresql':
+            return postgresql.insert
+        return None
+    
+    def existing_keys_query(self, table, conflict_columns, keys):
+        """Build the select of conflict keys that already exist in the table"""
+        columns = [table.c[name] for name in conflict_columns]
+        if len(columns) == 1:
+            query = select(columns[0]).where(columns[0].in_([k[0] for k in keys]))
+        else:
+            # SQLite can't use an index for a row-value IN, so narrow on the leading column first
+            query = select(*columns).where(
+                columns[0].in_({k[0] for k in keys}),
+                tuple_(*columns).in_(keys)
+            )
+        return query
+    
+    def _existing_keys(self, table, conflict_columns, keys):
+        """Get the subset of conflict keys that already exist in the table"""
+        return {tuple(row) for row in db.session.execute(self.existing_keys_query(table, conflict_columns, keys))}
+    
+    def to_rows(self, values):
+        """Convert a DataFrame or a dict of column arrays into row dicts, with NaN as None
+        
+        Scalars in a dict of arrays are repeated on every row.
+        """
+        if isinstance(values, pd.DataFrame):
+            values = {name: values[name] for name in values.columns}
+        if not isinstance(values, dict):
+            return values
+        
+        lengths = [len(v) for v in values.values() if np.ndim(v) > 0]
+        if not lengths:
+            return [values] if values else []
+        
+        columns = []
+        for value in values.values():
+            if np.ndim(value) == 0:
+                columns.append([value] * lengths[0])
+            else:
+                series = pd.Series(value, copy=False)
+                # object dtype turns NumPy scalars into Python values the DB driver accepts
+                columns.append(series.astype(object).where(series.notna(), None).tolist())
+        names = list(values)
+        return [dict(zip(names, row)) for row in zip(*columns)]
+    
+    def _copy_upsert(self, table, rows, conflict_columns, update_columns):
+        """Upsert rows on PostgreSQL by COPYing them into a staging table and merging it
+        
+        The staging table is a temp table dropped at commit, so the load stays
+        within the session transaction like the INSERT path.
+        """
+        names = list(rows[0])
+        frame = pd.DataFrame.from_records(rows, columns=names)
+        for name in names:
+            # Integer columns holding NULLs come back as floats, which COPY rejects
+            if isinstance(table.c[name].type, Integer):
+                frame[name] = pd.to_numeric(frame[name]).round().astype('Int64')
+        # Every value is quoted and NULL is an unquoted empty field, so no string, not even an empty one, reads as NULL
+        values = frame.astype(object).where(frame.notna(), None)
+        buffer = io.StringIO()
+        for row in values.itertuples(index=False, name=None):
+            buffer.write(','.join('' if value is None else '"' + str(value).replace('"', '""') + '"' for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        
+        quote = db.engine.dialect.identifier_preparer.quote
+        stage = quote(f'{table.name}_stage')
+        columns = ', '.join(quote(name) for name in names)
+        if update_columns:
+            action = 'DO UPDATE SET ' + ', '.join(f'{quote(name)} = EXCLUDED.{quote(name)}' for name in update_columns)
+        else:
+            action = 'DO NOTHING'
+        
+        conn = db.session.connection()
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS {stage}')
+        conn.exec_driver_sql(
+            f'CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {columns} FROM {quote(table.name)} WITH NO DATA'
+        )
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {stage} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+        
+        # xmax is 0 only for rows this statement inserted
+        inserted = conn.exec_driver_sql(
+            f'INSERT INTO {quote(table.name)} ({columns}) SELECT {columns} FROM {stage} '
+            f'ON CONFLICT ({", ".join(quote(name) for name in conflict_columns)}) {action} '
+            f'RETURNING (xmax = 0)'
+        ).scalars().all()
+        records_added = sum(inserted)
+        return {'added': records_added, 'updated': len(rows) - records_added}
+    
+    def upsert(self, model, rows, conflict_columns, update_columns=None):
+        """Insert rows or update them in place when the unique key already exists
+        
+        ``rows`` is a list of dicts, a DataFrame or a dict of column arrays. Rows
+        are written in batches of ``batch_size`` within the current session
+        transaction; the caller is responsible for committing.
+        """
+        table = model.__table__
+        rows = self.to_rows(rows)
+        
+        # De-duplicate on the conflict key, the last row for a key wins
+        unique_rows = {}
+        for row in rows:
+            unique_rows[tuple(row[name] for name in conflict_columns)] = row
+        if not unique_rows:
+            return {'added': 0, 'updated': 0}
+        
+        if update_columns is None:
+            update_columns = [name for name in unique_rows[next(iter(unique_rows))]
+                              if name not in conflict_columns]
+        
+        if db.engine.dialect.name == 'postgresql' and len(unique_rows) >= self.copy_threshold:
+            return self._copy_upsert(table, list(unique_rows.values()), conflict_columns, update_columns)
+        
+        insert = self._dialect_insert()
+        if insert is not None:
+            # One statement executed with each batch of parameters, so it is compiled once
+            stmt = insert(table)
+            if update_columns:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=conflict_columns,
+                    set_={name: stmt.excluded[name] for name in update_columns}
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+        
+        items = list(unique_rows.items())
+        records_added = 0
+        records_updated = 0
+        
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            existing = self._existing_keys(table, conflict_columns, [key for key, _ in batch])
+            records_updated += len(existing)
+            records_added += len(batch) - len(existing)
+            values = [row for _, row in batch]
+            
+            if insert is not None:
+                db.session.execute(stmt, values)
+            else:
+                # Generic fallback for dialects without ON CONFLICT support
+                new_rows = [row for key, row in batch if key not in existing]
+                if new_rows:
+                    db.session.execute(table.insert(), new_rows)
+                for key, row in batch:
+                    if key in existing and update_columns:
+                        db.session.execute(
+                            table.update()
+                            .where(and_(*[table.c[name] == value for name, value in zip(conflict_columns, key)]))
+                            .values({name: row[name] for name in update_columns})
+                        )
+        
+        return {'added': records_added, 'updated': records_updated}
+    
+    def ensure_securities(self, symbols, names=None, security_type='unknown'):
+        """Get security ids for symbols, creating lightweight stubs for unknown ones"""
+        symbols = list(dict.fromkeys(symbols))
+        names = names or {}
+        security_ids = {}
+        
+        for start in range(0, len(symbols), self.batch_size):
+            batch = symbols[start:start + self.batch_size]
+            rows = db.session.execute(
+                select(Security.id, Security.symbol).where(Security.symbol.in_(batch))
+            ).all()
+            security_ids.update({symbol: security_id for security_id, symbol in rows})
+        
+        missing = [symbol for symbol in symbols if symbol not in security_ids]
+        if missing:
+            self.upsert(Security, [{
+                'symbol': symbol,
+                'name': names.get(symbol) or symbol,
+                'security_type': security_type,
+                'is_active': True
+            } for symbol in missing], ['symbol'], update_columns=[])
+            
+            for start in range(0, len(missing), self.batch_size):
+                batch = missing[start:start + self.batch_size]
+                rows = db.session.execute(
+                    select(Security.id, Security.symbol).where(Security.symbol.in_(batch))
+                ).all()
+                security_ids.update({symbol: security_id for security_id, symbol in rows})
+            logger.info(f"Created {len(missing)} security stubs")
+        
+        return security_ids
+    
+    def _price_bar_row(self, security_id, agg):
+        """Convert a Polygon aggregate bar into a price data row"""
+        if agg.timestamp is None or agg.close is None:
+            raise ValueError("aggregate is missing timestamp or close")
+        
+        return {
+            'security_id': security_id,
+            # Convert timestamp to date
+            'date': datetime.fromtimestamp(agg.timestamp / 1000).date(),
+            'open': agg.open,
+            'high': agg.high,
+            'low': agg.low,
+            'close': agg.close,
+            'volume': agg.volume,
+            'vwap': agg.vwap
+        }
+    
+    def _queue_columnar(self, rows):
+        """Queue written price rows for the columnar store, if it is enabled"""
+        store = get_columnar_store()
+        if store is None:
+            return
+        by_security = {}
+        for row in rows:
+            by_security.setdefault(row['security_id'], []).append(row)
+        for security_id, security_rows in by_security.items():
+            store.queue(db.session(), security_id, security_rows)
+    
+    def write_price_bars(self, security_id, aggs):
+        """Write Polygon aggregate bars for a security as daily price data"""
+        rows = []
+        records_failed = 0
+        
+        for agg in aggs or []:
+            try:
+                rows.append(self._price_bar_row(security_id, agg))
+            except Exception as e:
+                logger.error(f"Error processing price bar for security {security_id}: {str(e)}")
+                records_failed += 1
+        
+        counts = self.upsert(PriceData, rows, ['security_id', 'date'])
+        self._queue_columnar(rows)
+        counts['processed'] = len(aggs) if aggs else 0
+        counts['failed'] = records_failed
+        counts['last_date'] = max((row['date'] for row in rows), default=None)
+        return counts
+    
+    def write_grouped_bars(self, security_ids, aggs):
+        """Write grouped daily bars for many securities, keyed by ticker in security_ids"""
+        rows = []
+        records_failed = 0
+        
+        for agg in aggs or []:
+            try:
+                rows.append(self._price_bar_row(security_ids[agg.ticker], agg))
+            except Exception as e:
+                logger.error(f"Error processing grouped price bar for {agg.ticker}: {str(e)}")
+                records_failed += 1
+        
+        counts = self.upsert(PriceData, rows, ['security_id', 'date'])
+        self._queue_columnar(rows)
+        counts['processed'] = len(aggs) if aggs else 0
+        counts['failed'] = records_failed
+        return counts
+    
+    def write_ftd_arrays(self, security_ids, arrays):
+        """Write parsed FTD arrays, keyed by symbol in security_ids"""
+        rows = [{
+            'security_id': security_ids[symbol],
+            'date': date,
+            'quantity': quantity,
+            'price': price,
+            'value': quantity * price
+        } for symbol, date, quantity, price in zip(
+            arrays['symbols'].tolist(),
+            arrays['dates'].tolist(),
+            arrays['quantities'].tolist(),
+            arrays['prices'].tolist()
+        )]
+        
+        counts = self.upsert(FTDData, rows, ['security_id', 'date'])
+        counts['processed'] = len(rows) + arrays['failed']
+        counts['failed'] = arrays['failed']
+        return counts
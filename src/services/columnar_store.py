@@ -0,0 +1,223 @@
+import os
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from ..models import db, PriceData
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One fixed-size record per daily bar, sorted by date
+BAR_DTYPE = np.dtype([
+    ('date', 'M8[D]'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+    ('vwap', '<f8')
+])
+BAR_COLUMNS = [name for name in BAR_DTYPE.names if name != 'date']
+
+# Session.info key holding bars written in the current transaction
+PENDING_KEY = 'columnar_store_pending'
+
+
+class ColumnarStore:
+    """Memory-mapped columnar copy of daily price bars, one file per security
+    
+    Each security's bars live in ``<directory>/<security_id>.bars`` as a raw
+    array of BAR_DTYPE records sorted by date. Bars newer than the last stored
+    date are appended in place; anything else (backfills, corrections) rewrites
+    the file through a temp file and ``os.replace``. Reads memory-map the file
+    and slice it by date with a binary search, so no per-row objects are built.
+    
+    The store mirrors the price_data table and is updated after each commit
+    that writes bars, so a rolled-back transaction never reaches it.
+    """
+    
+    def __init__(self, directory):
+        """Initialize the store in a directory"""
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, security_id):
+        """Get the path of a security's bar file"""
+        return os.path.join(self.directory, f'{int(security_id)}.bars')
+    
+    @contextmanager
+    def _locked(self, security_id):
+        """Hold an exclusive lock on a security's file across threads and processes"""
+        with self._lock, open(self._path(security_id) + '.lock', 'a') as handle:
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+    
+    def _dedupe(self, records):
+        """Sort records by date, keeping the last record for each date"""
+        # np.unique keeps the first occurrence, so search the reversed array
+        _, last = np.unique(records['date'][::-1], return_index=True)
+        return records[len(records) - 1 - last]
+    
+    def _to_records(self, rows):
+        """Convert price data row dicts into a date-sorted record array, the last row for a date wins"""
+        records = np.empty(len(rows), dtype=BAR_DTYPE)
+        records['date'] = np.array([row['date'] for row in rows], dtype='M8[D]')
+        for name in BAR_COLUMNS:
+            records[name] = np.array([row.get(name) for row in rows], dtype=np.float64)
+        return self._dedupe(records)
+    
+    def _write_all(self, security_id, records):
+        """Atomically replace a security's bar file"""
+        path = self._path(security_id)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(records.tobytes())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def has(self, security_id):
+        """Check whether a security's bars are in the store"""
+        return os.path.exists(self._path(security_id))
+    
+    def read(self, security_id, start_date=None, end_date=None):
+        """Get a read-only record view of a security's bars in an inclusive date range
+        
+        Returns None when the security isn't in the store.
+        """
+        path = self._path(security_id)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+        
+        # Ignore a trailing partial record from an append in progress
+        count = size // BAR_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=BAR_DTYPE)
+        bars = np.memmap(path, dtype=BAR_DTYPE, mode='r', shape=(count,))
+        
+        dates = bars['date']
+        start = np.searchsorted(dates, np.datetime64(start_date, 'D'), 'left') if start_date else 0
+        end = np.searchsorted(dates, np.datetime64(end_date, 'D'), 'right') if end_date else count
+        return bars[start:end]
+    
+    def frame(self, security_id, start_date=None, end_date=None):
+        """Get a security's bars in a date range as a DataFrame indexed by date"""
+        bars = self.read(security_id, start_date, end_date)
+        if bars is None:
+            return None
+        
+        return pd.DataFrame({name: bars[name] for name in BAR_COLUMNS},
+                            index=pd.DatetimeIndex(bars['date'].astype('M8[ns]'), name='date'))
+    
+    def write(self, security_id, rows):
+        """Merge price data rows into a security's bars, returning the number of bars stored"""
+        if not rows:
+            return 0
+        records = self._to_records(rows)
+        
+        with self._locked(security_id):
+            existing = self.read(security_id)
+            if existing is None or len(existing) == 0:
+                self._write_all(security_id, records)
+            elif records['date'][0] > existing['date'][-1]:
+                # Pure append, the common case for daily syncs
+                with open(self._path(security_id), 'ab') as f:
+                    f.write(records.tobytes())
+            else:
+                merged = np.concatenate([np.asarray(existing), records])
+                self._write_all(security_id, self._dedupe(merged))
+        return len(records)
+    
+    def rebuild(self, security_id):
+        """Rebuild a security's bars from the price_data table"""
+        query = select(
+            PriceData.date, PriceData.open, PriceData.high, PriceData.low,
+            PriceData.close, PriceData.volume, PriceData.vwap
+        ).where(PriceData.security_id == security_id).order_by(PriceData.date)
+        
+        with db.engine.connect() as connection:
+            rows = connection.execute(query).mappings().all()
+        
+        with self._locked(security_id):
+            if rows:
+                self._write_all(security_id, self._to_records(rows))
+            elif os.path.exists(self._path(security_id)):
+                os.remove(self._path(security_id))
+        return len(rows)
+    
+    def queue(self, session, security_id, rows):
+        """Queue rows written in a session's transaction for the store once it commits"""
+        pending = session.info.setdefault(PENDING_KEY, {})
+        pending.setdefault(security_id, []).extend(rows)
+    
+    def flush_pending(self, session):
+        """Write the rows queued by a committed transaction"""
+        pending = session.info.pop(PENDING_KEY, None)
+        if not pending:
+            return
+        
+        for security_id, rows in pending.items():
+            try:
+                if self.has(security_id):
+                    self.write(security_id, rows)
+                else:
+                    # First bars for this security, take the full history from the table
+                    self.rebuild(security_id)
+            except Exception as e:
+                logger.error(f"Error updating columnar store for security {security_id}: {str(e)}")
+                # Drop the file rather than leave it stale, it will be rebuilt on the next read
+                if os.path.exists(self._path(security_id)):
+                    os.remove(self._path(security_id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _flush_columnar_store(session):
+    """Copy bars from a committed transaction into the columnar store"""
+    if PENDING_KEY in session.info:
+        store = get_columnar_store()
+        if store is not None:
+            store.flush_pending(session)
+        else:
+            session.info.pop(PENDING_KEY, None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_columnar_store(session):
+    """Forget bars from a rolled-back transaction"""
+    session.info.pop(PENDING_KEY, None)
+
+
+# Shared store, created lazily when COLUMNAR_STORE_DIR is set
+_columnar_store = None
+
+def get_columnar_store():
+    """Get the process-wide columnar store, or None if it isn't enabled"""
+    global _columnar_store
+    directory = os.environ.get('COLUMNAR_STORE_DIR')
+    if not directory:
+        return None
+    if _columnar_store is None or _columnar_store.directory != directory:
+        _columnar_store = ColumnarStore(directory)
+    return _columnar_store
@@ -0,0 +1,62 @@
+import logging
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fewest days of returns both securities need for a pair to be reported
+MIN_OBSERVATIONS = 10
+
+
+def window_returns(panel, start_date):
+    """Get the daily returns of each security in a close panel over the days from start_date
+    
+    A security's return on a day it traded is from its previous close in the
+    window, however many days back, and NaN on days it didn't trade and on
+    its first day in the window.
+    """
+    window = panel[panel.index >= pd.Timestamp(start_date)]
+    closes = window.to_numpy(dtype=np.float64)
+    previous = window.ffill().shift(1).to_numpy(dtype=np.float64)
+    return closes / previous - 1
+
+
+def correlation_matrices(returns, min_observations=MIN_OBSERVATIONS):
+    """Compute pairwise return statistics between the columns of a (days x securities) array
+    
+    Each pair uses the days both securities have a return. Returns a dict of
+    N x N arrays: correlation, covariance, beta, r_squared and observations.
+    ``beta[i, j]`` is the beta of security i against security j, 0 when j's
+    returns don't vary. Pairs with fewer than ``min_observations`` days are NaN.
+    """
+    defined = ~np.isnan(returns)
+    x = np.where(defined, returns, 0.0)
+    mask = defined.astype(np.float64)
+    n = x.shape[1]
+    
+    # A single product yields every pairwise sum, restricted to the days both columns are defined
+    sums = np.hstack([x, x * x, mask]).T @ np.hstack([x, mask])
+    products = sums[:n, :n]
+    totals = sums[:n, n:]  # totals[i, j] sums i's returns over the days j has one
+    squares = sums[n:2 * n, n:]
+    counts = sums[2 * n:, n:]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = (products - totals * totals.T / counts) / (counts - 1)
+        # variance[i, j] is the variance of i over the days j has a return
+        variance = np.maximum((squares - totals * totals / counts) / (counts - 1), 0.0)
+        correlation = np.clip(covariance / np.sqrt(variance * variance.T), -1, 1)
+        beta = np.where(variance.T != 0, covariance / variance.T, 0.0)
+    
+    too_few = counts < min_observations
+    for values in (covariance, correlation, beta):
+        values[too_few] = np.nan
+    return {
+        'correlation': correlation,
+        'covariance': covariance,
+        'beta': beta,
+        'r_squared': correlation ** 2,
+        'observations': np.rint(counts).astype(np.int64)
+    }
@@ -0,0 +1,147 @@
+import logging
+from datetime import datetime, timedelta
+from ..models import db, PriceCoverage
+from .bulk_writer import BulkWriter
+from .market_calendar import has_trading_days, next_trading_day, previous_trading_day, last_completed_session
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class CoverageService:
+    """Service for tracking which date ranges of price data are already stored"""
+    
+    def __init__(self, writer=None):
+        """Initialize the service with the bulk writer used for batched coverage updates"""
+        self.writer = writer or BulkWriter()
+    
+    def get_intervals(self, security_id, timespan):
+        """Get the covered intervals for a security as sorted (start, end) tuples"""
+        rows = PriceCoverage.query.filter_by(security_id=security_id, timespan=timespan) \
+            .order_by(PriceCoverage.start_date).all()
+        return [(row.start_date, row.end_date) for row in rows]
+    
+    def get_intervals_bulk(self, security_ids, timespan):
+        """Get covered intervals for many securities in one query"""
+        intervals = {security_id: [] for security_id in security_ids}
+        if not security_ids:
+            return intervals
+        
+        rows = db.session.query(PriceCoverage.security_id, PriceCoverage.start_date, PriceCoverage.end_date) \
+            .filter(PriceCoverage.security_id.in_(security_ids), PriceCoverage.timespan == timespan) \
+            .order_by(PriceCoverage.security_id, PriceCoverage.start_date).all()
+        for security_id, start_date, end_date in rows:
+            intervals[security_id].append((start_date, end_date))
+        return intervals
+    
+    def missing_ranges(self, security_id, timespan, start_date, end_date, intervals=None):
+        """Get the sub-ranges of [start_date, end_date] that contain uncovered trading days"""
+        if intervals is None:
+            intervals = self.get_intervals(security_id, timespan)
+        
+        missing = []
+        cursor = start_date
+        for covered_start, covered_end in intervals:
+            if covered_end < cursor:
+                continue
+            if covered_start > end_date:
+                break
+            if covered_start > cursor:
+                missing.append((cursor, min(covered_start - timedelta(days=1), end_date)))
+            cursor = max(cursor, covered_end + timedelta(days=1))
+            if cursor > end_date:
+                break
+        if cursor <= end_date:
+            missing.append((cursor, end_date))
+        
+        # Only keep gaps with trading days, trimmed to the first and last session
+        return [
+            (next_trading_day(gap_start), previous_trading_day(gap_end))
+            for gap_start, gap_end in missing
+            if has_trading_days(gap_start, gap_end)
+        ]
+    
+    def _merge(self, intervals, start_date, end_date):
+        """Add [start_date, end_date] to sorted intervals, merging intervals separated only by non-trading days"""
+        merged = []
+        for interval_start, interval_end in sorted(intervals + [(start_date, end_date)]):
+            if merged and not has_trading_days(merged[-1][1] + timedelta(days=1), interval_start - timedelta(days=1)):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], interval_end))
+            else:
+                merged.append((interval_start, interval_end))
+        return merged
+    
+    def record(self, security_id, timespan, start_date, end_date):
+        """Mark [start_date, end_date] as covered, merging with touching intervals
+        
+        Intervals separated only by weekends or holidays are merged. The caller is
+        responsible for committing.
+        """
+        if start_date > end_date:
+            return
+        
+        merged = self._merge(self.get_intervals(security_id, timespan), start_date, end_date)
+        
+        PriceCoverage.query.filter_by(security_id=security_id, timespan=timespan).delete()
+        db.session.add_all([
+            PriceCoverage(security_id=security_id, timespan=timespan, start_date=interval_start, end_date=interval_end)
+            for interval_start, interval_end in merged
+        ])
+    
+    def record_fetch(self, security_id, timespan, start_date, end_date, bars_returned=0, last_bar_date=None, limit=None):
+        """Record coverage for a completed provider fetch
+        
+        Sessions that have not closed yet are left uncovered so they are fetched
+        again, as is anything past the last bar when the response hit ``limit``.
+        """
+        covered_end = min(end_date, last_completed_session())
+        if limit and last_bar_date and bars_returned >= limit:
+            # The last day of a truncated intraday response may be incomplete
+            last_complete = last_bar_date if timespan == 'day' else last_bar_date - timedelta(days=1)
+            covered_end = min(covered_end, last_complete)
+        self.record(security_id, timespan, start_date, covered_end)
+    
+    def record_fetch_many(self, intervals, timespan):
+        """Record coverage for a provider fetch that returned many securities at once
+        
+        ``intervals`` maps each security to the (start, end) ranges it received
+        bars for, so days a security had no bar stay uncovered. Existing
+        intervals are read with one query per batch, merged in memory and only
+        the securities whose coverage changed are rewritten, with one delete and
+        one bulk upsert per batch. The caller is responsible for committing.
+        """
+        last_session = last_completed_session()
+        received = {}
+        for security_id, ranges in intervals.items():
+            ranges = [(start, min(end, last_session)) for start, end in ranges if start <= last_session]
+            if ranges:
+                received[security_id] = ranges
+        
+        security_ids = list(received)
+        now = datetime.utcnow()
+        for batch_start in range(0, len(security_ids), self.writer.batch_size):
+            batch = security_ids[batch_start:batch_start + self.writer.batch_size]
+            existing = self.get_intervals_bulk(batch, timespan)
+            
+            changed = {}
+            for security_id in batch:
+                merged = existing[security_id]
+                for start, end in received[security_id]:
+                    merged = self._merge(merged, start, end)
+                if merged != existing[security_id]:
+                    changed[security_id] = merged
+            if not changed:
+                continue
+            
+            PriceCoverage.query.filter(
+                PriceCoverage.security_id.in_(list(changed)),
+                PriceCoverage.timespan == timespan
+            ).delete(synchronize_session=False)
+            self.writer.upsert(PriceCoverage, [{
+                'security_id': security_id,
+                'timespan': timespan,
+                'start_date': interval_start,
+                'end_date': interval_end,
+                'updated_at': now
+            } for security_id, merged in changed.items() for interval_start, interval_end in merged],
+                ['security_id', 'timespan', 'start_date'])
@@ -0,0 +1,175 @@
+import math
+import logging
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, String, type_coerce
+from ..models import db, PriceData, FTDData
+from .columnar_store import get_columnar_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'vwap')
+FTD_COLUMNS = ('quantity', 'price', 'value')
+
+# NumPy dtype for each loadable column, nullable columns load as float so NULL becomes NaN
+COLUMN_DTYPES = {
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'volume': np.float64,
+    'vwap': np.float64,
+    'quantity': np.int64,
+    'price': np.float64,
+    'value': np.float64
+}
+
+
+def frame_query(model, security_id, columns, start_date=None, end_date=None, **filters):
+    """Build the date-ordered select behind load_frame"""
+    table = model.__table__
+    query = select(
+        type_coerce(table.c.date, String),
+        *[table.c[name] for name in columns]
+    ).where(table.c.security_id == security_id)
+    
+    for name, value in filters.items():
+        query = query.where(table.c[name] == value)
+    if start_date:
+        query = query.where(table.c.date >= start_date)
+    if end_date:
+        query = query.where(table.c.date <= end_date)
+    return query.order_by(table.c.date)
+
+
+def load_frame(model, security_id, columns, start_date=None, end_date=None, dtypes=None, **filters):
+    """Load date-indexed columns of a per-security daily table without building ORM objects
+    
+    Only the requested columns are selected and rows come back as plain tuples.
+    The date column is fetched as its stored text and parsed in one NumPy call
+    rather than row by row. ``dtypes`` overrides COLUMN_DTYPES and extra keyword
+    arguments filter on column equality.
+    """
+    dtypes = {**COLUMN_DTYPES, **(dtypes or {})}
+    query = frame_query(model, security_id, columns, start_date, end_date, **filters)
+    
+    rows = db.session.execute(query).all()
+    if not rows:
+        return None
+    
+    values = list(zip(*rows))
+    index = pd.DatetimeIndex(np.array(values[0], dtype='M8[D]').astype('M8[ns]'), name='date')
+    data = {}
+    for name, column in zip(columns, values[1:]):
+        dtype = dtypes.get(name, object)
+        if dtype is np.int64 and None in column:
+            dtype = np.float64
+        # NumPy turns None into NaN for float columns
+        data[name] = np.array(column, dtype=dtype)
+    return pd.DataFrame(data, index=index)
+
+
+def load_price_frame(security_id, start_date=None, end_date=None, columns=PRICE_COLUMNS):
+    """Load daily price bars for a security as a DataFrame indexed by date, or None if there are none"""
+    store = get_columnar_store()
+    if store is not None:
+        if not store.has(security_id):
+            store.rebuild(security_id)
+        df = store.frame(security_id, start_date, end_date)
+        if df is None or df.empty:
+            return None
+        return df[list(columns)]
+    
+    return load_frame(PriceData, security_id, columns, start_date, end_date)
+
+
+def load_ftd_frame(security_id, start_date=None, end_date=None, columns=FTD_COLUMNS):
+    """Load FTD data for a security as a DataFrame indexed by date, or None if there is none"""
+    return load_frame(FTDData, security_id, columns, start_date, end_date)
+
+
+def _close_query(security_ids, start_date=None, end_date=None):
+    """Build the select of (security_id, date, close) for many securities, ordered by security and date"""
+    query = select(PriceData.security_id, type_coerce(PriceData.date, String), PriceData.close).where(
+        PriceData.security_id.in_(list(security_ids))
+    )
+    if start_date:
+        query = query.where(PriceData.date >= start_date)
+    if end_date:
+        query = query.where(PriceData.date <= end_date)
+    return query.order_by(PriceData.security_id, PriceData.date)
+
+
+def load_close_matrix(security_ids, start_date=None, end_date=None):
+    """Load the daily closes of many securities in one query, as (security_ids, dates, closes)
+    
+    ``dates`` and ``closes`` are 2-D arrays with a column per returned
+    security, holding its bars in order from the first row. Shorter histories
+    are padded at the end with NaT dates and NaN closes, so each column is the
+    security's own series even where trading days differ between securities.
+    Securities without bars are left out. Returns None if there are no bars.
+    """
+    rows = db.session.execute(_close_query(security_ids, start_date, end_date)).all()
+    if not rows:
+        return None
+    
+    ids, days, closes = zip(*rows)
+    ids = np.array(ids)
+    found, starts, counts = np.unique(ids, return_index=True, return_counts=True)
+    # Position of each bar within its security's history and the column of that security
+    positions = np.arange(len(ids)) - np.repeat(starts, counts)
+    columns = np.repeat(np.arange(len(found)), counts)
+    
+    date_matrix = np.full((counts.max(), len(found)), np.datetime64('NaT'), dtype='M8[D]')
+    close_matrix = np.full((counts.max(), len(found)), np.nan)
+    date_matrix[positions, columns] = np.array(days, dtype='M8[D]')
+    close_matrix[positions, columns] = np.array(closes, dtype=np.float64)
+    return found.tolist(), date_matrix, close_matrix
+
+
+def load_close_panel(security_ids, start_date=None, end_date=None):
+    """Load the daily closes of many securities in one query, aligned on date
+    
+    Returns a DataFrame indexed by every date any of them traded, with a
+    column per security id holding NaN where it has no bar, or None if there
+    are no bars.
+    """
+    rows = db.session.execute(_close_query(security_ids, start_date, end_date)).all()
+    if not rows:
+        return None
+    
+    ids, days, closes = zip(*rows)
+    frame = pd.DataFrame({
+        'security_id': np.array(ids),
+        'date': np.array(days, dtype='M8[D]').astype('M8[ns]'),
+        'close': np.array(closes, dtype=np.float64)
+    })
+    panel = frame.pivot(index='date', columns='security_id', values='close')
+    panel.columns.name = None
+    return panel
+
+
+def has_price_data(security_id):
+    """Check whether any daily price bars are stored for a security"""
+    return db.session.execute(
+        select(PriceData.id).where(PriceData.security_id == security_id).limit(1)
+    ).first() is not None
+
+
+def frame_records(df):
+    """Convert a date-indexed frame into JSON-ready dicts with ISO dates and NaN as None"""
+    if df is None:
+        return []
+    
+    dates = df.index.strftime('%Y-%m-%d').tolist()
+    columns = list(df.columns)
+    arrays = [df[name].tolist() for name in columns]
+    return [
+        {'date': day, **{
+            name: None if isinstance(value, float) and math.isnan(value) else value
+            for name, value in zip(columns, row)
+        }}
+        for day, row in zip(dates, zip(*arrays))
+    ]
@@ -0,0 +1,91 @@
+import io
+import zipfile
+import logging
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columns of the pipe-delimited SEC FTD files that we keep
+FTD_COLUMNS = ['SETTLEMENT DATE', 'SYMBOL', 'QUANTITY (FAILS)', 'DESCRIPTION', 'PRICE']
+
+DEFAULT_CHUNK_SIZE = 100000
+
+
+def _open_archive(source):
+    """Open an FTD zip from its bytes or from a file path, which is read incrementally"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return zipfile.ZipFile(io.BytesIO(source))
+    return zipfile.ZipFile(source)
+
+
+def _typed_chunk(chunk, symbols=None):
+    """Convert a chunk of raw text columns into typed arrays, dropping unusable rows"""
+    symbol = chunk['SYMBOL'].str.strip()
+    date = pd.to_datetime(chunk['SETTLEMENT DATE'], format='%Y%m%d', errors='coerce')
+    quantity = pd.to_numeric(chunk['QUANTITY (FAILS)'], errors='coerce')
+    price = pd.to_numeric(chunk['PRICE'], errors='coerce')
+    
+    keep = symbol.notna() & (symbol != '')
+    if symbols is not None:
+        keep &= symbol.isin(symbols)
+    valid = keep & date.notna() & quantity.notna() & price.notna()
+    
+    return {
+        'symbols': symbol[valid].to_numpy(dtype=object),
+        'dates': date[valid].to_numpy(dtype='datetime64[D]'),
+        'quantities': quantity[valid].to_numpy(dtype=np.int64),
+        'prices': price[valid].to_numpy(dtype=np.float64),
+        'descriptions': chunk['DESCRIPTION'][valid].to_numpy(dtype=object),
+        'failed': int((keep & ~valid).sum())
+    }
+
+
+def iter_ftd_chunks(source, symbols=None, chunksize=DEFAULT_CHUNK_SIZE):
+    """Stream an FTD archive as chunks of typed NumPy arrays
+    
+    ``source`` is the zip's bytes or a path to it. Each member is decompressed
+    and parsed ``chunksize`` rows at a time, reading only the columns we store,
+    so memory stays bounded regardless of archive size. When ``symbols`` is
+    given, rows for other symbols are dropped as they are read.
+    
+    Each chunk is a dict with ``symbols``, ``dates`` (datetime64[D]),
+    ``quantities`` (int64), ``prices`` (float64) and ``descriptions`` arrays,
+    plus ``failed``, the number of rows whose values couldn't be parsed.
+    """
+    if symbols is not None:
+        symbols = set(symbols)
+    
+    with _open_archive(source) as archive:
+        for member in archive.infolist():
+            if member.is_dir():
+                continue
+            
+            with archive.open(member) as f:
+                reader = pd.read_csv(
+                    f,
+                    sep='|',
+                    usecols=FTD_COLUMNS,
+                    dtype={column: str for column in FTD_COLUMNS},
+                    encoding='latin-1',
+                    on_bad_lines='skip',
+                    chunksize=chunksize
+                )
+                for chunk in reader:
+                    yield _typed_chunk(chunk, symbols)
+
+
+def parse_ftd_archive(source, symbols=None, chunksize=DEFAULT_CHUNK_SIZE):
+    """Parse a whole FTD archive into a single dict of typed arrays"""
+    chunks = list(iter_ftd_chunks(source, symbols=symbols, chunksize=chunksize))
+    if not chunks:
+        chunks = [_typed_chunk(pd.DataFrame({column: pd.Series(dtype=str) for column in FTD_COLUMNS}))]
+    
+    result = {
+        name: np.concatenate([chunk[name] for chunk in chunks])
+        for name in ('symbols', 'dates', 'quantities', 'prices', 'descriptions')
+    }
+    result['failed'] = sum(chunk['failed'] for chunk in chunks)
+    return result
@@ -1,10 +1,17 @@
 import os
+import time
 import requests
-import pandas as pd
 import logging
+import multiprocessing
 from datetime import datetime, timedelta
-from io import StringIO
-from ..models import db, Security, FTDData, ApiProvider, ApiKey, ApiEndpoint, ApiCallLog, DataSyncLog
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from flask import has_app_context
+from ..models import db, Security, FTDData, FTDArchive, ApiProvider, ApiKey, ApiEndpoint, ApiCallLog, DataSyncLog
+from .rate_limiter import get_rate_limiter
+from .bulk_writer import BulkWriter
+from .archive_cache import get_archive_cache
+from .ftd_parser import iter_ftd_chunks, parse_ftd_archive
+from .data_access import load_ftd_frame
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,9 +20,22 @@ logger = logging.getLogger(__name__)
 class FTDService:
     """Service for fetching and processing Failure-to-Deliver (FTD) data from SEC EDGAR"""
     
+    # SEC fair access policy allows 10 requests per second
+    DEFAULT_MINUTE_LIMIT = 600
+    DEFAULT_DAILY_LIMIT = None
+    
+    # Half-year archives are treated as final once the period is this many days past
+    CLOSED_PERIOD_DAYS = 45
+    
     def __init__(self):
         """Initialize the FTD service"""
         self.base_url = "https://www.sec.gov/data/foiadocsfailsdatahtm"
+        self.writer = BulkWriter()
+        self.cache = get_archive_cache()
+        self.rate_limiter = get_rate_limiter()
+        self.rate_limit_bucket = 'SEC EDGAR:default'
+        self.minute_limit = self.DEFAULT_MINUTE_LIMIT
+        self.daily_limit = self.DEFAULT_DAILY_LIMIT
         self._provider_registered = False
     
     def _ensure_registered(self):
@@ -46,13 +66,43 @@ class FTDService:
                 db.session.commit()
                 logger.info("Registered SEC EDGAR as API provider")
             
+            # Register API key, SEC EDGAR needs none but limits are tracked per key
+            api_key = ApiKey.query.filter_by(provider_id=provider.id, key_name='default').first()
+            if not api_key:
+                api_key = ApiKey(
+                    provider_id=provider.id,
+                    key_name='default',
+                    key_value='public',
+                    is_active=True,
+                    daily_limit=self.DEFAULT_DAILY_LIMIT,
+                    minute_limit=self.DEFAULT_MINUTE_LIMIT
+                )
+                db.session.add(api_key)
+                db.session.commit()
+                logger.info("Registered SEC EDGAR API key")
+            
+            # Enforce the limits stored on the API key
+            self.minute_limit = api_key.minute_limit
+            self.daily_limit = api_key.daily_limit
+            
             # Register common endpoints
             self._register_endpoints(provider.id)
-            
+        
         except Exception as e:
             logger.error(f"Error registering SEC EDGAR API provider: {str(e)}")
             db.session.rollback()
     
+    def _acquire(self, blocking=True):
+        """Wait for a request slot under the SEC EDGAR rate limits"""
+        if has_app_context():
+            self._ensure_registered()
+        return self.rate_limiter.acquire(
+            self.rate_limit_bucket,
+            per_minute=self.minute_limit,
+            per_day=self.daily_limit,
+            blocking=blocking
+        )
+    
     def _register_endpoints(self, provider_id):
         """Register common SEC EDGAR API endpoints"""
         endpoints = [
@@ -98,15 +148,16 @@ class FTDService:
                 request_url=url,
                 request_method=method,
                 request_params=str(params) if params else None,
-                response_code=response.status_code if response else None,
-                response_size=len(response.content) if response and hasattr(response, 'content') else None,
-                is_success=response.ok if response else False,
-                error_message=str(error) if error else None
+                response_code=response.status_code if response is not None else None,
+                response_size=len(response.content) if response is not None and hasattr(response, 'content') else None,
+                is_success=response.ok if response is not None else False,
+                error_message=str(error) if error else None,
+                execution_time=response.elapsed.total_seconds() if getattr(response, 'elapsed', None) else None
             )
             
             db.session.add(log)
             db.session.commit()
-            
+        
         except Exception as e:
             logger.error(f"Error logging API call: {str(e)}")
             db.session.rollback()
@@ -140,129 +191,289 @@ class FTDService:
                 return [f"https://www.sec.gov/files/data/fails-deliver-data/cnsfails{year}b.zip"]
         else:
             # 2009 has a different format
-            urls = []
-            if half == 1:
-                for month in range(1, 7):
-                    urls.append(f"https://www.sec.gov/files/data/fails-deliver-data/cnsfails{year}0{month}.zip")
-            else:
-                for month in range(7, 13):
-                    urls.append(f"https://www.sec.gov/files/data/fails-deliver-data/cnsfails{year}{month}.zip")
-            return urls
+            months = range(1, 7) if half == 1 else range(7, 13)
+            return [f"https://www.sec.gov/files/data/fails-deliver-data/cnsfails{year}{month:02d}.zip"
+                    for month in months]
     
-    def fetch_ftd_data(self, ticker, year=None, half=None):
-        """Fetch FTD data for a specific ticker"""
+    def _default_period(self, year=None, half=None):
+        """Resolve the year and half to load, defaulting to the current half"""
+        current_month = datetime.now().month
+        year = year or datetime.now().year
+        half = half or (1 if current_month <= 6 else 2)
+        return year, half
+    
+    def _is_closed_period(self, year, half):
+        """Check whether a half year ended long enough ago that its archive won't change"""
+        period_end = datetime(year, 6, 30) if half == 1 else datetime(year, 12, 31)
+        return period_end < datetime.now() - timedelta(days=self.CLOSED_PERIOD_DAYS)
+    
+    def _fetch_archive(self, url, immutable=False, pin=False):
+        """Get an FTD archive into the on-disk cache without touching the database
+        
+        Immutable archives are never re-requested, others are refreshed with a
+        conditional GET. Returns the cache entry along with the response, if a
+        request was made, so the caller can log it. With ``pin`` the entry is
+        pinned in the cache, and the caller must unpin it once it has been read.
+        """
+        response = None
+        entry = None
         try:
-            # Get security from database
-            security = Security.query.filter_by(symbol=ticker).first()
-            if not security:
-                logger.error(f"Security {ticker} not found in database")
-                return None
+            entry = self.cache.lookup(url, pin=pin)
+            if entry and immutable:
+                return {'url': url, 'entry': entry, 'response': None, 'error': None}
             
-            # Get FTD file URLs
-            urls = self._get_ftd_file_urls(year, half)
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            }
+            headers.update(self.cache.conditional_headers(entry))
+            self._acquire()
+            response = requests.get(url, headers=headers)
+            
+            if response.status_code == 304 and entry:
+                return {'url': url, 'entry': entry, 'response': response, 'error': None}
+            if response.status_code != 200:
+                raise ValueError(f"Error downloading FTD data from {url}: {response.status_code}")
             
-            # Create data sync log
-            sync_log = DataSyncLog(
-                data_type='ftd_data',
-                security_id=security.id,
-                start_date=datetime(year, 1 if half == 1 else 7, 1).date(),
-                end_date=datetime(year, 6 if half == 1 else 12, 31).date()
+            stored = self.cache.store(
+                url,
+                response.content,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                pin=pin
             )
+            if pin and entry:
+                self.cache.unpin(entry)
+            return {'url': url, 'entry': stored, 'response': response, 'error': None}
+        except Exception as e:
+            if pin and entry:
+                self.cache.unpin(entry)
+            return {'url': url, 'entry': None, 'response': response, 'error': e}
+    
+    def _write_chunk(self, chunk, security_ids):
+        """Write one parsed chunk of an FTD archive, creating securities for new symbols"""
+        # Create lightweight stubs for symbols we haven't seen yet
+        new_symbols = [symbol for symbol in dict.fromkeys(chunk['symbols'].tolist()) if symbol not in security_ids]
+        if new_symbols:
+            names = dict(zip(chunk['symbols'].tolist(), chunk['descriptions'].tolist()))
+            security_ids.update(self.writer.ensure_securities(
+                new_symbols,
+                names={symbol: names[symbol] for symbol in new_symbols if isinstance(names[symbol], str)}
+            ))
+        return self.writer.write_ftd_arrays(security_ids, chunk)
+    
+    def _store_archive(self, url, year, half, chunks, start_time, archive=None, error=None, sha256=None):
+        """Write parsed chunks of an FTD archive, mark it loaded and record its DataSyncLog"""
+        sync_log = DataSyncLog(
+            data_type='ftd_data',
+            start_date=datetime(year, 1 if half == 1 else 7, 1).date(),
+            end_date=datetime(year, 6, 30).date() if half == 1 else datetime(year, 12, 31).date()
+        )
+        
+        try:
+            if error is not None:
+                raise error
+            
+            security_ids = {}
+            records = {'processed': 0, 'added': 0, 'updated': 0, 'failed': 0}
+            for chunk in chunks:
+                counts = self._write_chunk(chunk, security_ids)
+                for name in records:
+                    records[name] += counts[name]
             
-            records_processed = 0
-            records_added = 0
-            records_updated = 0
-            records_failed = 0
+            sync_log.records_processed = records['processed']
+            sync_log.records_added = records['added']
+            sync_log.records_updated = records['updated']
+            sync_log.records_failed = records['failed']
+            sync_log.is_success = True
             
-            for url in urls:
+            if not archive:
+                archive = FTDArchive(url=url, year=year, half=half)
+                db.session.add(archive)
+            archive.records_loaded = records['processed'] - records['failed']
+            archive.symbols_loaded = len(security_ids)
+            archive.sha256 = sha256
+            archive.loaded_at = datetime.utcnow()
+        
+        except Exception as e:
+            logger.error(f"Error processing FTD data file {url}: {str(e)}")
+            db.session.rollback()
+            archive = None
+            sync_log.is_success = False
+            sync_log.error_message = str(e)
+        
+        sync_log.execution_time = (datetime.now() - start_time).total_seconds()
+        db.session.add(sync_log)
+        db.session.commit()
+        return archive
+    
+    def load_archive(self, url, year, half, force=False):
+        """Load every symbol from one FTD archive, skipping archives that are already loaded
+        
+        Archives of closed periods are trusted once loaded. Archives of the open
+        period are revalidated through the cache and reloaded when their
+        content has changed since they were loaded.
+        """
+        archive = FTDArchive.query.filter_by(url=url).first()
+        closed = self._is_closed_period(year, half)
+        if archive and closed and not force:
+            return archive
+        
+        start_time = datetime.now()
+        result = self._fetch_archive(url, immutable=closed)
+        if result['response'] is not None:
+            self._log_api_call('ftd_data', url, 'GET', None, result['response'])
+        if result['error'] is not None:
+            return self._store_archive(url, year, half, [], start_time, archive, error=result['error'])
+        
+        sha256 = result['entry']['sha256']
+        if archive and archive.sha256 == sha256 and not force:
+            return archive
+        content = self.cache.read(result['entry'])
+        return self._store_archive(url, year, half, iter_ftd_chunks(content), start_time, archive, sha256=sha256)
+    
+    def load_period(self, year=None, half=None, force=False):
+        """Load every FTD archive for a half year, returning the archives that loaded"""
+        year, half = self._default_period(year, half)
+        archives = []
+        for url in self._get_ftd_file_urls(year, half):
+            archive = self.load_archive(url, year, half, force=force)
+            if archive:
+                archives.append(archive)
+        return archives
+    
+    def list_archives(self, start_year=2009, end_year=None):
+        """List (url, year, half) for every published FTD archive in a range of years"""
+        end_year = end_year or datetime.now().year
+        archives = []
+        for year in range(start_year, end_year + 1):
+            for half in (1, 2):
                 try:
-                    # Download and process the file
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                    }
-                    response = requests.get(url, headers=headers)
-                    self._log_api_call('ftd_data', url, 'GET', None, response)
-                    
-                    if response.status_code != 200:
-                        logger.error(f"Error downloading FTD data from {url}: {response.status_code}")
-                        records_failed += 1
-                        continue
-                    
-                    # Save the zip file temporarily - use /tmp for Render.com compatibility
-                    import tempfile
-                    zip_path = os.path.join(tempfile.gettempdir(), f"ftd_data_{year}_{half}.zip")
-                    with open(zip_path, 'wb') as f:
-                        f.write(response.content)
-                    
-                    # Read the CSV file from the zip
-                    df = pd.read_csv(zip_path, compression='zip', sep='|')
-                    
-                    # Filter for the specific ticker
-                    df = df[df['SYMBOL'] == ticker]
-                    records_processed += len(df)
+                    urls = self._get_ftd_file_urls(year, half)
+                except ValueError:
+                    # Periods that haven't been published yet
+                    continue
+                archives.extend((url, year, half) for url in urls)
+        return archives
+    
+    def backfill(self, start_year=2009, end_year=None, download_workers=4, parse_workers=None, force=False):
+        """Load every FTD archive from start_year to end_year
+        
+        Archives are downloaded concurrently into the cache, parsed in a process
+        pool and written by this thread as each one finishes. Cached archives
+        stay pinned from download until parsed, so other downloads evicting the
+        cache can't delete them first. Archives of closed periods already
+        marked as loaded are skipped, so an interrupted backfill resumes where
+        it left off. Loaded archives of open periods are revalidated and only
+        reloaded if their content changed.
+        """
+        self._ensure_registered()
+        parse_workers = parse_workers or min(4, os.cpu_count() or 1)
+        
+        archives = self.list_archives(start_year, end_year)
+        loaded = {a.url: a for a in FTDArchive.query.all()}
+        todo = [(url, year, half) for url, year, half in archives
+                if force or url not in loaded or not self._is_closed_period(year, half)]
+        
+        summary = {
+            'archives': len(archives),
+            'skipped': len(archives) - len(todo),
+            'succeeded': 0,
+            'failed': 0,
+            'records_loaded': 0
+        }
+        start_time = time.time()
+        
+        # Parse in fresh interpreter processes rather than forking this threaded one
+        context = multiprocessing.get_context('forkserver' if os.name == 'posix' else 'spawn')
+        with ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+                ProcessPoolExecutor(max_workers=parse_workers, mp_context=context) as parsers:
+            pending = {}
+            queue = iter(todo)
+            
+            while True:
+                # Bound the archives downloaded or parsed but not yet written
+                while len(pending) < download_workers + parse_workers:
+                    item = next(queue, None)
+                    if item is None:
+                        break
+                    url, year, half = item
+                    future = downloads.submit(self._fetch_archive, url, self._is_closed_period(year, half), pin=True)
+                    pending[future] = ('download', url, year, half, datetime.now(), None)
+                
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, url, year, half, started, entry = pending.pop(future)
+                    archive = None
                     
-                    # Process each row
-                    for _, row in df.iterrows():
+                    if stage == 'download':
+                        result = future.result()
+                        if result['response'] is not None:
+                            self._log_api_call('ftd_data', url, 'GET', None, result['response'])
+                        if result['error'] is None:
+                            entry = result['entry']
+                            if not force and url in loaded and loaded[url].sha256 == entry['sha256']:
+                                self.cache.unpin(entry)
+                                summary['skipped'] += 1
+                                continue
+                            path = self.cache.path(entry)
+                            pending[parsers.submit(parse_ftd_archive, path)] = ('parse', url, year, half, started, entry)
+                            continue
+                        archive = self._store_archive(url, year, half, [], started, loaded.get(url),
+                                                      error=result['error'])
+                    else:
+                        self.cache.unpin(entry)
                         try:
-                            # Parse date
-                            date = datetime.strptime(row['SETTLEMENT DATE'], '%Y%m%d').date()
-                            
-                            # Check if FTD data already exists for this date
-                            ftd_data = FTDData.query.filter_by(
-                                security_id=security.id,
-                                date=date
-                            ).first()
-                            
-                            # Calculate value
-                            quantity = int(row['QUANTITY (FAILS)'])
-                            price = float(row['PRICE'])
-                            value = quantity * price
-                            
-                            if ftd_data:
-                                # Update existing record
-                                ftd_data.quantity = quantity
-                                ftd_data.price = price
-                                ftd_data.value = value
-                                records_updated += 1
-                            else:
-                                # Create new record
-                                ftd_data = FTDData(
-                                    security_id=security.id,
-                                    date=date,
-                                    quantity=quantity,
-                                    price=price,
-                                    value=value
-                                )
-                                db.session.add(ftd_data)
-                                records_added += 1
-                                
+                            chunks, error = [future.result()], None
                         except Exception as e:
-                            logger.error(f"Error processing FTD data for {ticker} on {row['SETTLEMENT DATE']}: {str(e)}")
-                            records_failed += 1
+                            chunks, error = [], e
+                        archive = self._store_archive(url, year, half, chunks, started, loaded.get(url),
+                                                      error=error, sha256=entry['sha256'])
                     
-                    # Clean up
-                    os.remove(zip_path)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing FTD data file {url}: {str(e)}")
-                    records_failed += 1
+                    if archive:
+                        summary['succeeded'] += 1
+                        summary['records_loaded'] += archive.records_loaded
+                    else:
+                        summary['failed'] += 1
+        
+        # Pinned archives may have kept the cache over its budget
+        self.cache.evict()
+        summary['execution_time'] = time.time() - start_time
+        logger.info(f"Loaded {summary['succeeded']}/{len(todo)} FTD archives "
+                    f"({summary['skipped']} already loaded) in {summary['execution_time']:.1f}s")
+        return summary
+    
+    def fetch_ftd_data(self, ticker, year=None, half=None, as_frame=False):
+        """Fetch FTD data for a specific ticker
+        
+        The half-year archives are loaded once for every symbol, so repeat calls
+        for any ticker in the same period are served from the database. With
+        ``as_frame`` the data is returned as a date-indexed DataFrame instead of
+        FTDData objects.
+        """
+        try:
+            year, half = self._default_period(year, half)
+            archives = self.load_period(year, half)
             
-            # Update sync log
-            sync_log.records_processed = records_processed
-            sync_log.records_added = records_added
-            sync_log.records_updated = records_updated
-            sync_log.records_failed = records_failed
-            sync_log.is_success = records_failed == 0
+            # Get security from database
+            security = Security.query.filter_by(symbol=ticker).first()
+            if not security:
+                logger.error(f"Security {ticker} not found in database")
+                return None
             
-            db.session.add(sync_log)
-            db.session.commit()
+            if as_frame:
+                ftd_data = load_ftd_frame(security.id)
+            else:
+                ftd_data = FTDData.query.filter_by(security_id=security.id).order_by(FTDData.date).all()
             
             return {
                 'security': security,
-                'ftd_data': FTDData.query.filter_by(security_id=security.id).all(),
-                'sync_log': sync_log
+                'ftd_data': ftd_data,
+                'archives': archives
             }
-            
+        
         except Exception as e:
             logger.error(f"Error fetching FTD data for {ticker}: {str(e)}")
             db.session.rollback()
@@ -289,7 +500,7 @@ class FTDService:
             query = query.order_by(FTDData.date)
             
             return query.all()
-            
+        
         except Exception as e:
             logger.error(f"Error getting FTD data for {ticker}: {str(e)}")
             return None
@@ -0,0 +1,451 @@
+import json
+import math
+import logging
+import numpy as np
+import pandas as pd
+from collections import deque
+from itertools import islice
+from datetime import datetime
+from sqlalchemy import select, func, and_
+from ..models import db, Security, PriceData, IndicatorSnapshot, IndicatorState
+from .data_access import load_price_frame, load_close_matrix
+from .indicator_store import IndicatorStore, INDICATOR_COLUMNS
+from .indicator_registry import (
+    SMA_PERIODS, EMA_PERIODS, MACD_SIGNAL_PERIOD, RSI_PERIOD, BB_PERIOD, BB_WIDTH, compute_series, compute_matrix
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def compute_indicators(df, names=None):
+    """Add indicator columns to a date-indexed frame with a close column, over its full history
+    
+    ``names`` selects indicators as in resolve_indicators, defaulting to all.
+    """
+    for name, values in compute_series(df['close'], names).items():
+        df[name] = values
+    return df
+
+
+def new_closes(rows, last_dates):
+    """Group (security_id, date, close) rows into a date-indexed close series per security
+    
+    Only bars after the security's date in ``last_dates`` are kept. Dates may
+    be date objects or ISO text, as drivers return them either way.
+    """
+    if not rows:
+        return {}
+    
+    frame = pd.DataFrame(rows, columns=['security_id', 'date', 'close'])
+    frame['date'] = np.array(frame['date'].tolist(), dtype='M8[D]').astype('M8[ns]')
+    closes = {}
+    for security_id, group in frame.groupby('security_id', sort=False):
+        group = group[group['date'] > pd.Timestamp(last_dates[security_id])]
+        if not group.empty:
+            closes[security_id] = group.set_index('date')['close']
+    return closes
+
+
+def update_rows(snapshot_rows, state_rows):
+    """Bundle computed snapshot rows with the state row that covers them, one update per security
+    
+    An update is written as a whole by write_updates, so a state is never
+    stored without the snapshots it has moved past.
+    """
+    snapshots = {}
+    for row in snapshot_rows:
+        snapshots.setdefault((row['security_id'], row['timeframe']), []).append(row)
+    return [{
+        'security_id': state['security_id'],
+        'timeframe': state['timeframe'],
+        'snapshots': snapshots.get((state['security_id'], state['timeframe']), []),
+        'state': state
+    } for state in state_rows]
+
+
+def write_updates(updates, writer):
+    """Write updates from update_rows in the caller's transaction, snapshots before the states"""
+    writer.upsert(IndicatorSnapshot, [row for update in updates for row in update['snapshots']],
+                  ['security_id', 'timeframe', 'date'])
+    return writer.upsert(IndicatorState, [update['state'] for update in updates], ['security_id', 'timeframe'])
+
+
+class RunningIndicators:
+    """Indicator state for one security that is advanced one bar at a time in O(1)
+    
+    Rolling windows keep their sums along with the closes needed to drop the
+    oldest value, EMAs keep their last value. The Bollinger deviation is taken
+    from the last closes about their own mean, as a running sum of squares
+    cancels badly on flat stretches. RSI keeps the same simple rolling mean of gains and losses as
+    compute_indicators rather than Wilder smoothing, so both paths agree.
+    """
+    
+    def __init__(self):
+        """Initialize an empty state, before the first bar"""
+        self.bar_count = 0
+        self.last_close = None
+        self.last_histogram = None
+        self.closes = deque(maxlen=max(SMA_PERIODS + (BB_PERIOD,)))
+        self.sums = {period: 0.0 for period in SMA_PERIODS}
+        self.gains = deque(maxlen=RSI_PERIOD)
+        self.losses = deque(maxlen=RSI_PERIOD)
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self.emas = {period: None for period in EMA_PERIODS}
+        self.macd_signal = None
+    
+    @staticmethod
+    def _ema(previous, value, span):
+        """Advance an EMA without bias adjustment, seeded with its first value"""
+        if previous is None:
+            return value
+        alpha = 2.0 / (span + 1)
+        return (1 - alpha) * previous + alpha * value
+    
+    def advance(self, close):
+        """Fold one close into the state, returning that bar's indicator values"""
+        close = float(close)
+        
+        # Drop the value leaving each window before adding the new one
+        for period in SMA_PERIODS:
+            if len(self.closes) >= period:
+                self.sums[period] -= self.closes[-period]
+            self.sums[period] += close
+        self.closes.append(close)
+        
+        # The first bar has no change and counts as neither a gain nor a loss
+        delta = close - self.last_close if self.last_close is not None else 0.0
+        if len(self.gains) == RSI_PERIOD:
+            self.gain_sum -= self.gains[0]
+            self.loss_sum -= self.losses[0]
+        self.gains.append(max(delta, 0.0))
+        self.losses.append(max(-delta, 0.0))
+        self.gain_sum += self.gains[-1]
+        self.loss_sum += self.losses[-1]
+        
+        for period in EMA_PERIODS:
+            self.emas[period] = self._ema(self.emas[period], close, period)
+        macd = self.emas[12] - self.emas[26]
+        self.macd_signal = self._ema(self.macd_signal, macd, MACD_SIGNAL_PERIOD)
+        
+        self.bar_count += 1
+        self.last_close = close
+        values = self.values()
+        self.last_histogram = values['macd_histogram']
+        return values
+    
+    def _window_sum(self, total, values):
+        """Get a running window sum, snapped to zero when every value in the window is zero"""
+        return 0.0 if not any(values) else max(total, 0.0)
+    
+    def values(self):
+        """Get the indicator values for the last bar folded into the state"""
+        values = dict.fromkeys(INDICATOR_COLUMNS, np.nan)
+        if self.bar_count == 0:
+            return values
+        
+        for period in SMA_PERIODS:
+            if self.bar_count >= period:
+                values[f'sma_{period}'] = self.sums[period] / period
+        
+        for period in EMA_PERIODS:
+            values[f'ema_{period}'] = self.emas[period]
+        values['macd'] = self.emas[12] - self.emas[26]
+        values['macd_signal'] = self.macd_signal
+        values['macd_histogram'] = values['macd'] - self.macd_signal
+        
+        if self.bar_count >= RSI_PERIOD:
+            avg_gain = self._window_sum(self.gain_sum, self.gains) / RSI_PERIOD
+            avg_loss = self._window_sum(self.loss_sum, self.losses) / RSI_PERIOD
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rs = np.float64(avg_gain) / np.float64(avg_loss)
+                values['rsi'] = float(100 - (100 / (1 + rs)))
+        
+        if self.bar_count >= BB_PERIOD:
+            mean = self.sums[BB_PERIOD] / BB_PERIOD
+            window = list(islice(self.closes, len(self.closes) - BB_PERIOD, None))
+            centre = math.fsum(window) / BB_PERIOD
+            std = math.sqrt(math.fsum((close - centre) ** 2 for close in window) / (BB_PERIOD - 1))
+            values['bb_middle'] = mean
+            values['bb_upper'] = mean + std * BB_WIDTH
+            values['bb_lower'] = mean - std * BB_WIDTH
+        return values
+    
+    @classmethod
+    def from_history(cls, closes, last):
+        """Build the state after a full history, from its closes and the indicator values of its last bar"""
+        state = cls()
+        closes = np.asarray(closes, dtype=np.float64)
+        if len(closes) == 0:
+            return state
+        
+        deltas = np.diff(closes, prepend=closes[0])
+        state.bar_count = len(closes)
+        state.last_close = float(closes[-1])
+        state.closes.extend(closes[-state.closes.maxlen:].tolist())
+        state.sums = {period: math.fsum(closes[-period:]) for period in SMA_PERIODS}
+        state.gains.extend(np.maximum(deltas[-RSI_PERIOD:], 0.0).tolist())
+        state.losses.extend(np.maximum(-deltas[-RSI_PERIOD:], 0.0).tolist())
+        state.gain_sum = math.fsum(state.gains)
+        state.loss_sum = math.fsum(state.losses)
+        
+        state.emas = {period: float(last[f'ema_{period}']) for period in EMA_PERIODS}
+        state.macd_signal = float(last['macd_signal'])
+        state.last_histogram = float(last['macd_histogram'])
+        return state
+    
+    def to_json(self):
+        """Serialize the state for storage"""
+        return json.dumps({
+            'last_close': self.last_close,
+            'last_histogram': self.last_histogram,
+            'closes': list(self.closes),
+            'sums': {str(period): total for period, total in self.sums.items()},
+            'gains': list(self.gains),
+            'losses': list(self.losses),
+            'gain_sum': self.gain_sum,
+            'loss_sum': self.loss_sum,
+            'emas': {str(period): value for period, value in self.emas.items()},
+            'macd_signal': self.macd_signal
+        })
+    
+    @classmethod
+    def from_json(cls, text, bar_count):
+        """Restore a stored state"""
+        data = json.loads(text)
+        state = cls()
+        state.bar_count = bar_count
+        state.last_close = data['last_close']
+        state.last_histogram = data['last_histogram']
+        state.closes.extend(data['closes'])
+        state.sums = {int(period): total for period, total in data['sums'].items()}
+        state.gains.extend(data['gains'])
+        state.losses.extend(data['losses'])
+        state.gain_sum = data['gain_sum']
+        state.loss_sum = data['loss_sum']
+        state.emas = {int(period): value for period, value in data['emas'].items()}
+        state.macd_signal = data['macd_signal']
+        return state
+
+
+class IndicatorEngine:
+    """Keeps stored indicators current by resuming each security from its saved state
+    
+    Only bars after a security's last folded date are computed. Securities
+    without a state, or refreshed with ``reset``, are computed over their full
+    history ``batch_size`` at a time with compute_matrix and their state is
+    seeded from the result. So are securities with bars backfilled at or
+    before their last folded date, spotted by the bar count up to that date no
+    longer matching the state's. Bars rewritten in place after they were
+    folded in are only picked up by a reset.
+    """
+    
+    def __init__(self, store=None, timeframe='1d', chunk_size=500, batch_size=100):
+        """Initialize the engine with the indicator store it writes to"""
+        self.store = store or IndicatorStore()
+        self.writer = self.store.writer
+        self.timeframe = timeframe
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+    
+    def _load_states(self, security_ids):
+        """Get the stored state of each security that has one, as {id: (last_date, state)}
+        
+        States of securities with backfilled bars are left out, so they are seeded again.
+        """
+        rows = db.session.execute(
+            select(IndicatorState.security_id, IndicatorState.last_date,
+                   IndicatorState.bar_count, IndicatorState.state)
+            .where(IndicatorState.security_id.in_(security_ids),
+                   IndicatorState.timeframe == self.timeframe)
+        ).all()
+        backfilled = self._backfilled(security_ids) if rows else set()
+        if backfilled:
+            logger.info(f"Reseeding indicators for {len(backfilled)} securities with backfilled bars")
+        return {security_id: (last_date, RunningIndicators.from_json(state, bar_count))
+                for security_id, last_date, bar_count, state in rows if security_id not in backfilled}
+    
+    def _backfilled(self, security_ids):
+        """Get the securities whose bars up to their last folded date no longer match their state's bar count"""
+        return set(db.session.execute(
+            select(IndicatorState.security_id)
+            .outerjoin(PriceData, and_(PriceData.security_id == IndicatorState.security_id,
+                                       PriceData.date <= IndicatorState.last_date))
+            .where(IndicatorState.security_id.in_(security_ids),
+                   IndicatorState.timeframe == self.timeframe)
+            .group_by(IndicatorState.security_id, IndicatorState.bar_count)
+            .having(func.count(PriceData.id) != IndicatorState.bar_count)
+        ).scalars().all())
+    
+    def _load_new_closes(self, states):
+        """Get the closes after each security's last folded date, in one query per chunk"""
+        since = min(last_date for last_date, _ in states.values())
+        rows = db.session.execute(
+            select(PriceData.security_id, PriceData.date, PriceData.close)
+            .where(PriceData.security_id.in_(list(states)), PriceData.date > since)
+            .order_by(PriceData.security_id, PriceData.date)
+        ).all()
+        return new_closes(rows, {security_id: last_date for security_id, (last_date, _) in states.items()})
+    
+    def _advance(self, security_id, state, closes):
+        """Fold new closes into a state, returning snapshot rows for them"""
+        previous_histogram = state.last_histogram
+        frame = pd.DataFrame([state.advance(close) for close in closes.to_numpy()], index=closes.index)
+        return self.store.rows(security_id, frame, self.timeframe, previous_histogram)
+    
+    def _seed_batch(self, security_ids):
+        """Compute the full history of several securities as one matrix and build their states
+        
+        Returns the snapshot rows and {security_id: (state, last_date)} for the
+        securities that have price data.
+        """
+        loaded = load_close_matrix(security_ids)
+        if loaded is None:
+            return [], {}
+        found, dates, closes = loaded
+        values = compute_matrix(closes)
+        
+        lengths = np.count_nonzero(~np.isnat(dates), axis=0)
+        states = {}
+        for column, (security_id, length) in enumerate(zip(found, lengths)):
+            last = {name: values[name][length - 1, column] for name in INDICATOR_COLUMNS}
+            state = RunningIndicators.from_history(closes[:length, column], last)
+            states[security_id] = (state, dates[length - 1, column].astype(object))
+        return self.store.matrix_rows(found, dates, values, self.timeframe), states
+    
+    def _state_row(self, security_id, state, last_date):
+        """Build the stored row for a state"""
+        return {
+            'security_id': security_id,
+            'timeframe': self.timeframe,
+            'last_date': last_date,
+            'bar_count': state.bar_count,
+            'state': state.to_json(),
+            'updated_at': datetime.utcnow()
+        }
+    
+    def _updates(self, security_ids, reset, summary):
+        """Compute the rows that bring a chunk of securities up to date, without writing them
+        
+        Yields (snapshot_rows, state_rows) once for the securities resumed from
+        their state and then per batch of seeded securities, so full histories
+        don't pile up for the whole chunk. ``summary`` counts are updated as it goes.
+        """
+        states = {} if reset else self._load_states(security_ids)
+        if states:
+            snapshot_rows = []
+            state_rows = []
+            for security_id, closes in self._load_new_closes(states).items():
+                state = states[security_id][1]
+                snapshot_rows.extend(self._advance(security_id, state, closes))
+                state_rows.append(self._state_row(security_id, state, closes.index[-1].date()))
+                summary['updated'] += 1
+                summary['bars'] += len(closes)
+            yield snapshot_rows, state_rows
+        
+        missing = [security_id for security_id in security_ids if security_id not in states]
+        for batch_start in range(0, len(missing), self.batch_size):
+            rows, seeded = self._seed_batch(missing[batch_start:batch_start + self.batch_size])
+            state_rows = []
+            for security_id, (state, last_date) in seeded.items():
+                state_rows.append(self._state_row(security_id, state, last_date))
+                summary['seeded'] += 1
+                summary['bars'] += state.bar_count
+            yield rows, state_rows
+    
+    def compute(self, security_ids, reset=False):
+        """Compute the rows that bring securities up to date without writing them
+        
+        Returns (snapshot_rows, state_rows) for the caller to persist, meant for
+        a few securities at a time as every row is kept in memory.
+        """
+        summary = {'updated': 0, 'seeded': 0, 'bars': 0}
+        snapshot_rows = []
+        state_rows = []
+        for rows, states in self._updates(list(security_ids), reset, summary):
+            snapshot_rows.extend(rows)
+            state_rows.extend(states)
+        return snapshot_rows, state_rows
+    
+    def refresh(self, security_ids=None, reset=False):
+        """Bring stored indicators up to date, returning a summary
+        
+        Defaults to every active security. Each chunk of securities is written
+        with bulk upserts and committed.
+        """
+        start_time = datetime.now()
+        if security_ids is None:
+            security_ids = db.session.execute(
+                select(Security.id).where(Security.is_active.is_(True))
+            ).scalars().all()
+        security_ids = list(security_ids)
+        summary = {'securities': len(security_ids), 'updated': 0, 'seeded': 0, 'bars': 0}
+        
+        for start in range(0, len(security_ids), self.chunk_size):
+            state_rows = []
+            for snapshot_rows, states in self._updates(security_ids[start:start + self.chunk_size], reset, summary):
+                self.writer.upsert(IndicatorSnapshot, snapshot_rows, ['security_id', 'timeframe', 'date'])
+                state_rows.extend(states)
+            self.writer.upsert(IndicatorState, state_rows, ['security_id', 'timeframe'])
+            db.session.commit()
+        
+        summary['execution_time'] = (datetime.now() - start_time).total_seconds()
+        logger.info(f"Refreshed indicators for {summary['updated']} securities and seeded "
+                    f"{summary['seeded']} ({summary['bars']} bars) in {summary['execution_time']:.1f}s")
+        return summary
+    
+    def check(self, security_id, split=0.5):
+        """Compare incremental updates with a full recompute, returning the largest difference per column
+        
+        The state is seeded from the first ``split`` of the history and advanced
+        bar by bar through the rest. Nothing is written. Returns None when the
+        security has too little history to split.
+        """
+        df = load_price_frame(security_id, columns=['close'])
+        if df is None or len(df) < 2:
+            return None
+        
+        closes = df['close'].to_numpy()
+        cut = max(1, int(len(closes) * split))
+        head = compute_indicators(df.iloc[:cut].copy())
+        state = RunningIndicators.from_history(closes[:cut], head.iloc[-1])
+        incremental = pd.DataFrame([state.advance(close) for close in closes[cut:]])
+        full = compute_indicators(df.copy()).iloc[cut:]
+        return _differences(full, incremental)
+    
+    def check_batch(self, security_ids):
+        """Compare the matrix computation with per-security computation, returning {security_id: differences}
+        
+        The differences are the largest per column, as in check(). Nothing is written.
+        """
+        loaded = load_close_matrix(security_ids)
+        if loaded is None:
+            return {}
+        found, dates, closes = loaded
+        values = compute_matrix(closes)
+        
+        results = {}
+        for column, security_id in enumerate(found):
+            length = np.count_nonzero(~np.isnat(dates[:, column]))
+            full = compute_indicators(pd.DataFrame({'close': closes[:length, column]}))
+            batch = {name: values[name][:length, column] for name in INDICATOR_COLUMNS}
+            results[security_id] = _differences(full, batch)
+        return results
+
+
+def _differences(expected_values, actual_values):
+    """Get the largest relative difference per indicator column between two computations"""
+    differences = {}
+    for name in INDICATOR_COLUMNS:
+        expected = np.asarray(expected_values[name], dtype=np.float64)
+        actual = np.asarray(actual_values[name], dtype=np.float64)
+        if not np.array_equal(np.isnan(expected), np.isnan(actual)):
+            differences[name] = np.inf
+            continue
+        both = ~np.isnan(expected)
+        # Relative to the magnitude of the values, so prices of any scale compare alike
+        scale = np.maximum(np.abs(expected[both]), 1.0)
+        differences[name] = float(np.max(np.abs(expected[both] - actual[both]) / scale, initial=0.0))
+    return differences
@@ -0,0 +1,277 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from .indicator_store import INDICATOR_COLUMNS
+
+SMA_PERIODS = (20, 50, 200)
+EMA_PERIODS = (12, 26)
+MACD_SIGNAL_PERIOD = 9
+RSI_PERIOD = 14
+BB_PERIOD = 20
+BB_WIDTH = 2
+
+# Most window values the matrix rolling standard deviation materializes at once
+WINDOW_BLOCK_VALUES = 1 << 22
+
+# Every registered series by name, including intermediates that aren't stored
+INDICATORS = {}
+
+# Selector names that expand to several stored indicators
+INDICATOR_GROUPS = {
+    'sma': [f'sma_{period}' for period in SMA_PERIODS],
+    'ema': [f'ema_{period}' for period in EMA_PERIODS],
+    'macd': ['macd', 'macd_signal', 'macd_histogram'],
+    'bb': ['bb_upper', 'bb_middle', 'bb_lower'],
+    'bollinger': ['bb_upper', 'bb_middle', 'bb_lower']
+}
+
+
+def register_indicator(name, compute, depends=(), stored=True, matrix=None, **params):
+    """Register how a series is computed from the series it depends on
+    
+    ``compute`` is called with a dict holding the dependency series (and
+    ``close``) plus ``params`` as keyword arguments. Unstored series are shared
+    intermediates that can be depended on but not selected. ``matrix`` computes
+    the same values over 2-D arrays with one column per security, it defaults
+    to ``compute`` for indicators that are plain arithmetic.
+    """
+    INDICATORS[name] = {
+        'compute': compute,
+        'matrix': matrix or compute,
+        'depends': tuple(depends),
+        'stored': stored,
+        'params': params
+    }
+
+
+def resolve_indicators(selector=None):
+    """Get the stored indicator names a selector asks for, in storage order
+    
+    ``selector`` is a comma-separated string or list of indicator or group
+    names; None selects every indicator. Raises ValueError for unknown names.
+    """
+    if selector is None:
+        return list(INDICATOR_COLUMNS)
+    if isinstance(selector, str):
+        selector = selector.split(',')
+    
+    names = set()
+    for item in (item.strip().lower() for item in selector):
+        if not item:
+            continue
+        if item in INDICATOR_GROUPS:
+            names.update(INDICATOR_GROUPS[item])
+        elif item in INDICATORS and INDICATORS[item]['stored']:
+            names.add(item)
+        else:
+            raise ValueError(f"Unknown indicator {item}")
+    return [name for name in INDICATOR_COLUMNS if name in names]
+
+
+def indicator_plan(names):
+    """Get the series needed for some indicators, each after the series it depends on"""
+    plan = []
+    visiting = set()
+    
+    def visit(name):
+        if name in plan or name == 'close':
+            return
+        if name in visiting:
+            raise ValueError(f"Indicator {name} depends on itself")
+        visiting.add(name)
+        for dependency in INDICATORS[name]['depends']:
+            visit(dependency)
+        visiting.discard(name)
+        plan.append(name)
+    
+    for name in names:
+        visit(name)
+    return plan
+
+
+def compute_series(close, names=None):
+    """Compute the requested indicators from a close series, returning a DataFrame of them
+    
+    Only the dependency subgraph of ``names`` is computed and each shared
+    intermediate is computed once.
+    """
+    names = resolve_indicators(names)
+    series = {'close': close}
+    for name in indicator_plan(names):
+        indicator = INDICATORS[name]
+        series[name] = indicator['compute'](series, **indicator['params'])
+    return pd.DataFrame({name: series[name] for name in names}, index=close.index)
+
+
+def compute_matrix(closes, names=None):
+    """Compute the requested indicators for many securities at once, returning {name: 2-D array}
+    
+    ``closes`` holds one security per column with its bars in order from the
+    first row; shorter histories are padded with NaN at the end. Values for a
+    column match compute_series over that security's closes.
+    """
+    names = resolve_indicators(names)
+    series = {'close': np.asarray(closes, dtype=np.float64)}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name in indicator_plan(names):
+            indicator = INDICATORS[name]
+            series[name] = indicator['matrix'](series, **indicator['params'])
+    return {name: series[name] for name in names}
+
+
+def _rolling_mean(series, window):
+    """Rolling mean of the close"""
+    return series['close'].rolling(window=window).mean()
+
+
+def _rolling_std(series, window):
+    """Rolling sample standard deviation of the close"""
+    return series['close'].rolling(window=window).std()
+
+
+def _window_means(values, window, reference=0.0):
+    """Trailing means of each column over ``window`` rows from cumulative sums, NaN before a full window
+    
+    Sums are taken of the values less ``reference``, which keeps them small
+    (and a constant column exact) when it is close to the values.
+    """
+    sums = np.cumsum(values - reference, axis=0)
+    means = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        means[window - 1] = sums[window - 1]
+        means[window:] = sums[window:] - sums[:-window]
+        means[window - 1:] = means[window - 1:] / window + reference
+    return means
+
+
+def _matrix_rolling_mean(series, window):
+    """Rolling mean of the close of each security"""
+    closes = series['close']
+    return _window_means(closes, window, closes[:1])
+
+
+def _matrix_rolling_std(series, window):
+    """Rolling sample standard deviation of the close of each security
+    
+    Deviations are taken from each window's own mean rather than from running
+    sums of squares, which cancel badly. The windows are materialized a block
+    of rows at a time, about WINDOW_BLOCK_VALUES values, so memory stays
+    bounded however many securities and bars there are.
+    """
+    closes = series['close']
+    std = np.full(closes.shape, np.nan)
+    block_rows = max(1, WINDOW_BLOCK_VALUES // (window * max(closes.shape[1], 1)))
+    for start in range(window - 1, len(closes), block_rows):
+        stop = min(start + block_rows, len(closes))
+        windows = sliding_window_view(closes[start - window + 1:stop], window, axis=0)
+        deviations = windows - windows.mean(axis=-1, keepdims=True)
+        std[start:stop] = np.sqrt(np.einsum('ijk,ijk->ij', deviations, deviations) / (window - 1))
+    return std
+
+
+def _matrix_ema(series, span, source='close'):
+    """EMA of each security without bias adjustment, advanced a row of securities at a time"""
+    values = series[source]
+    alpha = 2.0 / (span + 1)
+    ema = np.empty_like(values)
+    if len(values):
+        ema[0] = values[0]
+    # Same operations as pandas, which divides by the (unit) total weight each step
+    total = (1 - alpha) + alpha
+    for row in range(1, len(values)):
+        ema[row] = ((1 - alpha) * ema[row - 1] + alpha * values[row]) / total
+    return ema
+
+
+def _matrix_price_change(series):
+    """Change in close from the previous bar of each security"""
+    change = np.full(series['close'].shape, np.nan)
+    change[1:] = np.diff(series['close'], axis=0)
+    return change
+
+
+def _ema(series, span, source='close'):
+    """EMA of a series without bias adjustment"""
+    return series[source].ewm(span=span, adjust=False).mean()
+
+
+def _alias(series, source):
+    """An intermediate series exposed under another name"""
+    return series[source]
+
+
+def _price_change(series):
+    """Change in close from the previous bar"""
+    return series['close'].diff()
+
+
+def _average_gain(series, window):
+    """Rolling mean of the gains, a bar without a gain counts as zero"""
+    delta = series['price_change']
+    return delta.where(delta > 0, 0).rolling(window=window).mean()
+
+
+def _average_loss(series, window):
+    """Rolling mean of the losses, a bar without a loss counts as zero"""
+    delta = series['price_change']
+    return (-delta.where(delta < 0, 0)).rolling(window=window).mean()
+
+
+def _matrix_average_gain(series, window):
+    """Rolling mean of the gains of each security, a bar without a gain counts as zero"""
+    delta = series['price_change']
+    return _window_means(np.where(delta > 0, delta, 0.0), window)
+
+
+def _matrix_average_loss(series, window):
+    """Rolling mean of the losses of each security, a bar without a loss counts as zero"""
+    delta = series['price_change']
+    return _window_means(np.where(delta < 0, -delta, 0.0), window)
+
+
+def _rsi(series):
+    """RSI from the average gain and loss"""
+    rs = series['average_gain'] / series['average_loss']
+    return 100 - (100 / (1 + rs))
+
+
+def _difference(series, left, right):
+    """Difference of two series"""
+    return series[left] - series[right]
+
+
+def _band(series, width):
+    """Bollinger band ``width`` standard deviations from the middle band"""
+    return series['bb_middle'] + series[f'rolling_std_{BB_PERIOD}'] * width
+
+
+# Moving Averages
+for _period in sorted(set(SMA_PERIODS) | {BB_PERIOD}):
+    register_indicator(f'rolling_mean_{_period}', _rolling_mean, ['close'], stored=False,
+                       matrix=_matrix_rolling_mean, window=_period)
+for _period in SMA_PERIODS:
+    register_indicator(f'sma_{_period}', _alias, [f'rolling_mean_{_period}'], source=f'rolling_mean_{_period}')
+
+# Exponential Moving Averages
+for _period in EMA_PERIODS:
+    register_indicator(f'ema_{_period}', _ema, ['close'], matrix=_matrix_ema, span=_period)
+
+# MACD
+register_indicator('macd', _difference, ['ema_12', 'ema_26'], left='ema_12', right='ema_26')
+register_indicator('macd_signal', _ema, ['macd'], matrix=_matrix_ema, span=MACD_SIGNAL_PERIOD, source='macd')
+register_indicator('macd_histogram', _difference, ['macd', 'macd_signal'], left='macd', right='macd_signal')
+
+# RSI, from simple rolling means of gains and losses
+register_indicator('price_change', _price_change, ['close'], stored=False, matrix=_matrix_price_change)
+register_indicator('average_gain', _average_gain, ['price_change'], stored=False,
+                   matrix=_matrix_average_gain, window=RSI_PERIOD)
+register_indicator('average_loss', _average_loss, ['price_change'], stored=False,
+                   matrix=_matrix_average_loss, window=RSI_PERIOD)
+register_indicator('rsi', _rsi, ['average_gain', 'average_loss'])
+
+# Bollinger Bands
+register_indicator(f'rolling_std_{BB_PERIOD}', _rolling_std, ['close'], stored=False,
+                   matrix=_matrix_rolling_std, window=BB_PERIOD)
+register_indicator('bb_middle', _alias, [f'rolling_mean_{BB_PERIOD}'], source=f'rolling_mean_{BB_PERIOD}')
+register_indicator('bb_upper', _band, ['bb_middle', f'rolling_std_{BB_PERIOD}'], width=BB_WIDTH)
+register_indicator('bb_lower', _band, ['bb_middle', f'rolling_std_{BB_PERIOD}'], width=-BB_WIDTH)
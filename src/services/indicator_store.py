@@ -0,0 +1,163 @@
+import logging
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from ..models import db, TechnicalIndicator, IndicatorSnapshot
+from .bulk_writer import BulkWriter
+from .data_access import load_frame
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDICATOR_COLUMNS = [
+    'sma_20', 'sma_50', 'sma_200', 'ema_12', 'ema_26', 'macd', 'macd_signal',
+    'macd_histogram', 'rsi', 'bb_upper', 'bb_middle', 'bb_lower'
+]
+SIGNAL_COLUMNS = {'rsi_trade_signal': 'rsi', 'macd_trade_signal': 'macd_histogram'}
+
+
+def rsi_signals(rsi):
+    """Get buy/sell/hold signals for RSI values, None where RSI is undefined"""
+    signals = np.where(rsi > 70, 'sell', np.where(rsi < 30, 'buy', 'hold')).astype(object)
+    signals[np.isnan(rsi)] = None
+    return signals
+
+
+def macd_signals(histogram, previous_value=np.nan):
+    """Get buy/sell/hold signals for MACD histogram zero crossings, None where it is undefined
+    
+    ``previous_value`` is the histogram value before the first one, when the
+    values continue an earlier series. A 2-D histogram holds a series per
+    column, with a scalar or per-column ``previous_value``.
+    """
+    first = np.broadcast_to(np.asarray(previous_value, dtype=np.float64), (1,) + histogram.shape[1:])
+    previous = np.concatenate([first, histogram[:-1]])
+    signals = np.where((previous < 0) & (histogram > 0), 'buy',
+                       np.where((previous > 0) & (histogram < 0), 'sell', 'hold')).astype(object)
+    signals[np.isnan(histogram)] = None
+    return signals
+
+
+class IndicatorStore:
+    """Wide-format storage for technical indicators, one row per security, timeframe and date"""
+    
+    def __init__(self, writer=None):
+        """Initialize the store with the bulk writer used for persistence"""
+        self.writer = writer or BulkWriter()
+    
+    def rows(self, security_id, df, timeframe='1d', previous_histogram=None):
+        """Build snapshot rows from the indicator columns of a date-indexed DataFrame
+        
+        Dates where every indicator is undefined (the warm-up period) are skipped.
+        ``previous_histogram`` is the MACD histogram of the bar before the frame,
+        so a frame of new bars gets the same signals as the full history.
+        """
+        values = {name: df[name].to_numpy(dtype=np.float64)[:, None] for name in INDICATOR_COLUMNS if name in df}
+        dates = df.index.to_numpy(dtype='M8[D]')[:, None]
+        return self.matrix_rows([security_id], dates, values, timeframe,
+                                np.nan if previous_histogram is None else previous_histogram)
+    
+    def matrix_rows(self, security_ids, dates, values, timeframe='1d', previous_histogram=np.nan):
+        """Build snapshot rows for many securities from 2-D arrays with a column per security
+        
+        ``dates`` is a 2-D datetime64 array aligned with each array in
+        ``values``, NaT marks padding. Rows come out security by security in
+        date order, skipping the warm-up period as in rows().
+        """
+        columns = [name for name in INDICATOR_COLUMNS if name in values]
+        if not columns:
+            return []
+        
+        values = {name: np.asarray(values[name], dtype=np.float64) for name in columns}
+        if 'rsi' in values:
+            values['rsi_trade_signal'] = rsi_signals(values['rsi'])
+        if 'macd_histogram' in values:
+            values['macd_trade_signal'] = macd_signals(values['macd_histogram'], previous_histogram)
+        
+        keep = ~np.isnat(dates) & ~np.all(np.isnan(np.stack([values[name] for name in columns])), axis=0)
+        # Transposed so the selected cells come out grouped by security
+        keep = keep.T
+        ids = np.broadcast_to(np.asarray(security_ids), dates.shape).T[keep].tolist()
+        days = dates.T[keep].astype(object).tolist()
+        names = list(values)
+        # Store undefined values as NULL, signal columns already hold None
+        arrays = [(values[name] if values[name].dtype == object
+                   else np.where(np.isnan(values[name]), None, values[name])).T[keep].tolist()
+                  for name in names]
+        
+        return [{
+            'security_id': security_id,
+            'timeframe': timeframe,
+            'date': day,
+            **dict(zip(names, row))
+        } for security_id, day, row in zip(ids, days, zip(*arrays))]
+    
+    def write(self, security_id, df, timeframe='1d'):
+        """Write the indicators of a date-indexed DataFrame, returning upsert counts
+        
+        The caller is responsible for committing.
+        """
+        return self.writer.upsert(IndicatorSnapshot, self.rows(security_id, df, timeframe),
+                                  ['security_id', 'timeframe', 'date'])
+    
+    def read(self, security_id, start_date=None, end_date=None, timeframe='1d', columns=None, pending_rows=None):
+        """Read stored indicators as a DataFrame indexed by date, or None if there are none
+        
+        ``pending_rows`` are snapshot rows that may not be written yet, such as
+        ones queued for write-behind. Their dates in the range replace the
+        stored ones.
+        """
+        columns = columns or INDICATOR_COLUMNS + list(SIGNAL_COLUMNS)
+        dtypes = {name: np.float64 for name in INDICATOR_COLUMNS}
+        df = load_frame(IndicatorSnapshot, security_id, columns, start_date, end_date,
+                        dtypes=dtypes, timeframe=timeframe)
+        
+        pending = [row for row in pending_rows or ()
+                   if row['security_id'] == security_id and row['timeframe'] == timeframe
+                   and (not start_date or row['date'] >= start_date) and (not end_date or row['date'] <= end_date)]
+        if not pending:
+            return df
+        
+        fresh = pd.DataFrame(pending, columns=['date'] + list(columns))
+        fresh.index = pd.DatetimeIndex(fresh.pop('date').to_numpy(dtype='M8[D]').astype('M8[ns]'), name='date')
+        fresh = fresh.astype({name: np.float64 for name in columns if name in dtypes})
+        if df is None:
+            return fresh
+        df = pd.concat([df, fresh])
+        return df[~df.index.duplicated(keep='last')].sort_index()
+    
+    def migrate_legacy(self, delete=False):
+        """Copy rows from the per-value technical_indicators table into the wide table
+        
+        Securities are migrated one at a time and committed as they go, so the
+        migration can be rerun safely. With ``delete`` the legacy rows of each
+        migrated security are removed. Returns the number of snapshots written.
+        """
+        security_ids = db.session.execute(
+            select(TechnicalIndicator.security_id).distinct()
+        ).scalars().all()
+        
+        written = 0
+        for security_id in security_ids:
+            rows = db.session.execute(
+                select(TechnicalIndicator.date, TechnicalIndicator.timeframe,
+                       TechnicalIndicator.indicator_name, TechnicalIndicator.indicator_value)
+                .where(TechnicalIndicator.security_id == security_id)
+            ).all()
+            legacy = pd.DataFrame(rows, columns=['date', 'timeframe', 'indicator_name', 'indicator_value'])
+            legacy = legacy[legacy['indicator_name'].isin(INDICATOR_COLUMNS)]
+            
+            for timeframe, group in legacy.groupby('timeframe'):
+                wide = group.pivot_table(index='date', columns='indicator_name',
+                                         values='indicator_value', aggfunc='last')
+                wide.index = pd.to_datetime(wide.index)
+                counts = self.write(security_id, wide.sort_index(), timeframe)
+                written += counts['added'] + counts['updated']
+            
+            if delete:
+                TechnicalIndicator.query.filter_by(security_id=security_id).delete()
+            db.session.commit()
+            logger.info(f"Migrated technical indicators for security {security_id}")
+        
+        return written
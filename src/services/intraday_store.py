@@ -0,0 +1,115 @@
+import logging
+import pandas as pd
+from datetime import datetime, time, timezone
+from sqlalchemy import select
+from ..models import db, IntradayBar
+from .bulk_writer import BulkWriter
+from .market_calendar import MARKET_TIMEZONE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INTRADAY_TIMESPANS = ('minute', 'hour')
+
+class IntradayStore:
+    """Storage for intraday bars, kept apart from the daily price_data table"""
+    
+    def __init__(self, writer=None):
+        """Initialize the store with the bulk writer used for ingestion"""
+        self.writer = writer or BulkWriter()
+    
+    @staticmethod
+    def _month(timestamp):
+        """Get the YYYYMM partition key for an epoch millisecond timestamp"""
+        moment = datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc)
+        return moment.year * 100 + moment.month
+    
+    @staticmethod
+    def _months(start_ts, end_ts):
+        """Get every partition key between two epoch millisecond timestamps"""
+        start = datetime.fromtimestamp(start_ts / 1000, tz=timezone.utc)
+        end = datetime.fromtimestamp(end_ts / 1000, tz=timezone.utc)
+        months = []
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            months.append(year * 100 + month)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return months
+    
+    @staticmethod
+    def window(start_date, end_date):
+        """Get the epoch millisecond bounds of whole market days"""
+        start = datetime.combine(start_date, time.min, tzinfo=MARKET_TIMEZONE)
+        end = datetime.combine(end_date, time.max, tzinfo=MARKET_TIMEZONE)
+        return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+    
+    def write_bars(self, security_id, timespan, aggs):
+        """Write Polygon aggregate bars for a security into the intraday store"""
+        rows = []
+        records_failed = 0
+        
+        for agg in aggs or []:
+            try:
+                if agg.timestamp is None or agg.close is None:
+                    raise ValueError("aggregate is missing timestamp or close")
+                
+                rows.append({
+                    'security_id': security_id,
+                    'timespan': timespan,
+                    'month': self._month(agg.timestamp),
+                    'timestamp': int(agg.timestamp),
+                    'open': agg.open,
+                    'high': agg.high,
+                    'low': agg.low,
+                    'close': agg.close,
+                    'volume': agg.volume,
+                    'vwap': agg.vwap,
+                    'transactions': agg.transactions
+                })
+            except Exception as e:
+                logger.error(f"Error processing intraday bar for security {security_id}: {str(e)}")
+                records_failed += 1
+        
+        counts = self.writer.upsert(IntradayBar, rows, ['security_id', 'timespan', 'month', 'timestamp'])
+        counts['processed'] = len(aggs) if aggs else 0
+        counts['failed'] = records_failed
+        
+        # Coverage is tracked in market days
+        last_timestamp = max((row['timestamp'] for row in rows), default=None)
+        counts['last_date'] = datetime.fromtimestamp(last_timestamp / 1000, tz=MARKET_TIMEZONE).date() \
+            if last_timestamp is not None else None
+        return counts
+    
+    def _select_bars(self, security_id, timespan, start_ts, end_ts):
+        """Build the query for bars within a window, pruned to the window's months"""
+        return select(
+            IntradayBar.timestamp, IntradayBar.open, IntradayBar.high, IntradayBar.low,
+            IntradayBar.close, IntradayBar.volume, IntradayBar.vwap
+        ).where(
+            IntradayBar.security_id == security_id,
+            IntradayBar.timespan == timespan,
+            IntradayBar.month.in_(self._months(start_ts, end_ts)),
+            IntradayBar.timestamp >= start_ts,
+            IntradayBar.timestamp <= end_ts
+        ).order_by(IntradayBar.month, IntradayBar.timestamp)
+    
+    def get_bars(self, security_id, timespan, start_ts, end_ts):
+        """Get bars within an epoch millisecond window as a list of dicts"""
+        rows = db.session.execute(self._select_bars(security_id, timespan, start_ts, end_ts)).all()
+        return [{
+            'timestamp': row[0],
+            'open': row[1],
+            'high': row[2],
+            'low': row[3],
+            'close': row[4],
+            'volume': row[5],
+            'vwap': row[6]
+        } for row in rows]
+    
+    def get_bars_frame(self, security_id, timespan, start_ts, end_ts):
+        """Get bars within an epoch millisecond window as a DataFrame indexed by UTC time"""
+        rows = db.session.execute(self._select_bars(security_id, timespan, start_ts, end_ts)).all()
+        df = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'vwap'])
+        df.index = pd.to_datetime(df.pop('timestamp'), unit='ms', utc=True)
+        return df
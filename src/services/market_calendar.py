@@ -0,0 +1,76 @@
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar, Holiday, GoodFriday, USMartinLutherKingJr, USPresidentsDay,
+    USMemorialDay, USLaborDay, USThanksgivingDay, nearest_workday, sunday_to_monday
+)
+
+MARKET_TIMEZONE = ZoneInfo('America/New_York')
+MARKET_CLOSE = time(16, 0)
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    """Regular full-day NYSE holidays"""
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date=datetime(2022, 1, 1), observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday)
+    ]
+
+
+@lru_cache(maxsize=1)
+def _holidays():
+    """Get the set of market holidays"""
+    return {d.date() for d in NYSEHolidayCalendar().holidays(start='1990-01-01', end='2100-12-31')}
+
+
+def is_trading_day(day):
+    """Check whether the market is open on a date"""
+    return day.weekday() < 5 and day not in _holidays()
+
+
+def next_trading_day(day):
+    """Get the first trading day on or after a date"""
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return day
+
+
+def previous_trading_day(day):
+    """Get the last trading day on or before a date"""
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def trading_days(start, end):
+    """Get the trading days within an inclusive date range"""
+    days = []
+    day = start
+    while day <= end:
+        if is_trading_day(day):
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def has_trading_days(start, end):
+    """Check whether any trading day falls within an inclusive date range"""
+    return start <= end and next_trading_day(start) <= end
+
+
+def last_completed_session(now=None):
+    """Get the most recent trading day whose session has closed"""
+    now = now or datetime.now(MARKET_TIMEZONE)
+    today = now.date()
+    if is_trading_day(today) and now.time() >= MARKET_CLOSE:
+        return today
+    return previous_trading_day(today - timedelta(days=1))
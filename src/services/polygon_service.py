@@ -1,9 +1,18 @@
 import os
+import time
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
+from flask import has_app_context
 from polygon import RESTClient
 from ..models import db, Security, PriceData, ApiProvider, ApiKey, ApiEndpoint, ApiCallLog, DataSyncLog
+from .bulk_writer import BulkWriter
+from .rate_limiter import get_rate_limiter
+from .coverage_service import CoverageService
+from .market_calendar import trading_days
+from .intraday_store import IntradayStore, INTRADAY_TIMESPANS
+from .data_access import load_price_frame
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +21,10 @@ logger = logging.getLogger(__name__)
 class PolygonService:
     """Service for interacting with the Polygon.io API"""
     
+    # Limits used until the registered ApiKey has been loaded
+    DEFAULT_MINUTE_LIMIT = 200
+    DEFAULT_DAILY_LIMIT = 50000
+    
     def __init__(self, api_key=None):
         """Initialize the Polygon service with API key"""
         self.api_key = api_key or os.environ.get('POLYGON_API_KEY')
@@ -20,6 +33,13 @@ class PolygonService:
         
         self.client = RESTClient(self.api_key)
         self.base_url = "https://api.polygon.io"
+        self.writer = BulkWriter()
+        self.coverage = CoverageService()
+        self.intraday_store = IntradayStore(self.writer)
+        self.rate_limiter = get_rate_limiter()
+        self.rate_limit_bucket = 'Polygon.io:default'
+        self.minute_limit = self.DEFAULT_MINUTE_LIMIT
+        self.daily_limit = self.DEFAULT_DAILY_LIMIT
         self._provider_registered = False
     
     def _ensure_registered(self):
@@ -64,6 +84,10 @@ class PolygonService:
                 db.session.add(api_key)
                 db.session.commit()
                 logger.info("Registered Polygon.io API key")
+            
+            # Enforce the limits stored on the API key
+            self.minute_limit = api_key.minute_limit
+            self.daily_limit = api_key.daily_limit
                 
             # Register common endpoints
             self._register_endpoints(provider.id)
@@ -72,6 +96,17 @@ class PolygonService:
             logger.error(f"Error registering Polygon.io API provider: {str(e)}")
             db.session.rollback()
     
+    def _acquire(self, blocking=True):
+        """Wait for a request slot under the API key's rate limits"""
+        if has_app_context():
+            self._ensure_registered()
+        return self.rate_limiter.acquire(
+            self.rate_limit_bucket,
+            per_minute=self.minute_limit,
+            per_day=self.daily_limit,
+            blocking=blocking
+        )
+    
     def _register_endpoints(self, provider_id):
         """Register common Polygon.io API endpoints"""
         endpoints = [
@@ -87,6 +122,12 @@ class PolygonService:
                 'method': 'GET',
                 'description': 'Get aggregate bars for a ticker over a given date range in custom time window sizes.'
             },
+            {
+                'name': 'grouped_daily',
+                'path': '/v2/aggs/grouped/locale/us/market/stocks/{date}',
+                'method': 'GET',
+                'description': 'Get the daily open, high, low, and close for the entire stocks market.'
+            },
             {
                 'name': 'previous_close',
                 'path': '/v2/aggs/ticker/{ticker}/prev',
@@ -151,6 +192,7 @@ class PolygonService:
     def get_ticker_details(self, ticker):
         """Get detailed information for a ticker symbol"""
         try:
+            self._acquire()
             ticker_details = self.client.get_ticker_details(ticker)
             
             # Create or update security in database
@@ -182,8 +224,85 @@ class PolygonService:
             self._log_api_call('ticker_details', url, 'GET', None, None, e)
             return None
     
-    def get_price_data(self, ticker, timespan='day', from_date=None, to_date=None, limit=1000):
-        """Get price data for a ticker symbol"""
+    def _write_bars(self, security_id, timespan, aggs):
+        """Write aggregate bars to the daily or intraday store depending on timespan"""
+        if timespan in INTRADAY_TIMESPANS:
+            return self.intraday_store.write_bars(security_id, timespan, aggs)
+        return self.writer.write_price_bars(security_id, aggs)
+    
+    def _sync_missing_ranges(self, security, timespan, start_date, end_date, limit):
+        """Fetch and store the parts of a date range that aren't covered yet, returning the sync log"""
+        # Only fetch the sub-ranges that aren't already covered
+        missing_ranges = self.coverage.missing_ranges(security.id, timespan, start_date, end_date)
+        if not missing_ranges:
+            return None
+        
+        # Create data sync log
+        sync_log = DataSyncLog(
+            data_type='price_data' if timespan == 'day' else f'intraday_{timespan}',
+            security_id=security.id,
+            start_date=start_date,
+            end_date=end_date,
+            records_processed=0,
+            records_added=0,
+            records_updated=0,
+            records_failed=0
+        )
+        
+        for range_start, range_end in missing_ranges:
+            while True:
+                # Get aggregates from Polygon
+                self._acquire()
+                aggs = self.client.get_aggs(
+                    ticker=security.symbol,
+                    multiplier=1,
+                    timespan=timespan,
+                    from_=range_start.isoformat(),
+                    to=range_end.isoformat(),
+                    limit=limit
+                )
+                
+                # Write all bars in bulk using the table's unique key
+                counts = self._write_bars(security.id, timespan, aggs)
+                self.coverage.record_fetch(security.id, timespan, range_start, range_end,
+                                           counts['processed'], counts['last_date'], limit)
+                
+                # Update sync log
+                sync_log.records_processed += counts['processed']
+                sync_log.records_added += counts['added']
+                sync_log.records_updated += counts['updated']
+                sync_log.records_failed += counts['failed']
+                
+                # Continue after a response truncated by the limit
+                if counts['processed'] < limit or not counts['last_date']:
+                    break
+                next_start = counts['last_date'] if timespan in INTRADAY_TIMESPANS \
+                    else counts['last_date'] + timedelta(days=1)
+                if next_start <= range_start or next_start > range_end:
+                    break
+                range_start = next_start
+        
+        sync_log.is_success = sync_log.records_failed == 0
+        db.session.add(sync_log)
+        db.session.commit()
+        return sync_log
+    
+    def _get_or_create_security(self, ticker):
+        """Get security from database or create it from ticker details"""
+        security = Security.query.filter_by(symbol=ticker).first()
+        if not security:
+            security = self.get_ticker_details(ticker)
+        return security
+    
+    def get_price_data(self, ticker, timespan='day', from_date=None, to_date=None, limit=1000, as_frame=False):
+        """Get daily price data for a ticker symbol, fetching only ranges not already stored
+        
+        With ``as_frame`` the bars are returned as a date-indexed DataFrame
+        instead of PriceData objects.
+        """
+        if timespan in INTRADAY_TIMESPANS:
+            raise ValueError(f"Use get_intraday_data for {timespan} bars")
+        
         try:
             # Default to last 30 days if no dates provided
             if not from_date:
@@ -191,88 +310,30 @@ class PolygonService:
             if not to_date:
                 to_date = datetime.now().strftime('%Y-%m-%d')
             
-            # Get security from database or create if it doesn't exist
-            security = Security.query.filter_by(symbol=ticker).first()
+            security = self._get_or_create_security(ticker)
             if not security:
-                security = self.get_ticker_details(ticker)
-                if not security:
-                    return None
-            
-            # Get aggregates from Polygon
-            aggs = self.client.get_aggs(
-                ticker=ticker,
-                multiplier=1,
-                timespan=timespan,
-                from_=from_date,
-                to=to_date,
-                limit=limit
-            )
+                return None
             
-            # Create data sync log
-            sync_log = DataSyncLog(
-                data_type='price_data',
-                security_id=security.id,
-                start_date=datetime.strptime(from_date, '%Y-%m-%d').date(),
-                end_date=datetime.strptime(to_date, '%Y-%m-%d').date(),
-                records_processed=len(aggs) if aggs else 0
-            )
+            start_date = datetime.strptime(from_date, '%Y-%m-%d').date()
+            end_date = datetime.strptime(to_date, '%Y-%m-%d').date()
+            sync_log = self._sync_missing_ranges(security, timespan, start_date, end_date, limit)
             
-            records_added = 0
-            records_updated = 0
-            records_failed = 0
-            
-            # Process and store price data
-            for agg in aggs:
-                try:
-                    # Convert timestamp to date
-                    date = datetime.fromtimestamp(agg.timestamp / 1000).date()
-                    
-                    # Check if price data already exists for this date
-                    price_data = PriceData.query.filter_by(
-                        security_id=security.id,
-                        date=date
-                    ).first()
-                    
-                    if price_data:
-                        # Update existing record
-                        price_data.open = agg.open
-                        price_data.high = agg.high
-                        price_data.low = agg.low
-                        price_data.close = agg.close
-                        price_data.volume = agg.volume
-                        price_data.vwap = agg.vwap
-                        records_updated += 1
-                    else:
-                        # Create new record
-                        price_data = PriceData(
-                            security_id=security.id,
-                            date=date,
-                            open=agg.open,
-                            high=agg.high,
-                            low=agg.low,
-                            close=agg.close,
-                            volume=agg.volume,
-                            vwap=agg.vwap
-                        )
-                        db.session.add(price_data)
-                        records_added += 1
-                        
-                except Exception as e:
-                    logger.error(f"Error processing price data for {ticker} on {date}: {str(e)}")
-                    records_failed += 1
-            
-            # Update sync log
-            sync_log.records_added = records_added
-            sync_log.records_updated = records_updated
-            sync_log.records_failed = records_failed
-            sync_log.is_success = records_failed == 0
-            
-            db.session.add(sync_log)
-            db.session.commit()
+            if as_frame:
+                return {
+                    'security': security,
+                    'price_data': load_price_frame(security.id, start_date, end_date),
+                    'sync_log': sync_log
+                }
+            
+            price_data = PriceData.query.filter(
+                PriceData.security_id == security.id,
+                PriceData.date >= start_date,
+                PriceData.date <= end_date
+            ).order_by(PriceData.date).all()
             
             return {
                 'security': security,
-                'price_data': PriceData.query.filter_by(security_id=security.id).all(),
+                'price_data': price_data,
                 'sync_log': sync_log
             }
             
@@ -283,9 +344,329 @@ class PolygonService:
             db.session.rollback()
             return None
     
+    def get_intraday_data(self, ticker, timespan='minute', from_date=None, to_date=None, limit=50000):
+        """Get minute or hour bars for a ticker symbol, fetching only days not already stored"""
+        if timespan not in INTRADAY_TIMESPANS:
+            raise ValueError(f"Timespan must be one of {', '.join(INTRADAY_TIMESPANS)}")
+        
+        try:
+            # Default to last 5 days if no dates provided
+            if not from_date:
+                from_date = (datetime.now() - timedelta(days=5)).strftime('%Y-%m-%d')
+            if not to_date:
+                to_date = datetime.now().strftime('%Y-%m-%d')
+            
+            security = self._get_or_create_security(ticker)
+            if not security:
+                return None
+            
+            start_date = datetime.strptime(from_date, '%Y-%m-%d').date()
+            end_date = datetime.strptime(to_date, '%Y-%m-%d').date()
+            sync_log = self._sync_missing_ranges(security, timespan, start_date, end_date, limit)
+            
+            start_ts, end_ts = self.intraday_store.window(start_date, end_date)
+            return {
+                'security': security,
+                'bars': self.intraday_store.get_bars(security.id, timespan, start_ts, end_ts),
+                'sync_log': sync_log
+            }
+            
+        except Exception as e:
+            logger.error(f"Error getting {timespan} bars for {ticker}: {str(e)}")
+            url = f"{self.base_url}/v2/aggs/ticker/{ticker}/range/1/{timespan}/{from_date}/{to_date}"
+            self._log_api_call('aggregates', url, 'GET', {'limit': limit}, None, e)
+            db.session.rollback()
+            return None
+    
+    def _fetch_ticker(self, ticker, timespan, ranges, limit, fetch_details):
+        """Fetch aggregates (and details if needed) for a ticker without touching the database"""
+        start_time = time.time()
+        try:
+            details = None
+            if fetch_details:
+                self._acquire()
+                details = self.client.get_ticker_details(ticker)
+            
+            batches = []
+            for range_start, range_end in ranges:
+                self._acquire()
+                aggs = list(self.client.get_aggs(
+                    ticker=ticker,
+                    multiplier=1,
+                    timespan=timespan,
+                    from_=range_start.isoformat(),
+                    to=range_end.isoformat(),
+                    limit=limit
+                ))
+                batches.append((range_start, range_end, aggs))
+            
+            return {'ticker': ticker, 'details': details, 'batches': batches, 'error': None,
+                    'fetch_time': time.time() - start_time}
+        except Exception as e:
+            return {'ticker': ticker, 'details': None, 'batches': None, 'error': e,
+                    'fetch_time': time.time() - start_time}
+    
+    def _store_ticker_result(self, result, securities, timespan, from_date, to_date, limit):
+        """Write one fetched ticker into the database and record its DataSyncLog"""
+        ticker = result['ticker']
+        start_time = time.time()
+        sync_log = DataSyncLog(
+            data_type='price_data' if timespan == 'day' else f'intraday_{timespan}',
+            start_date=datetime.strptime(from_date, '%Y-%m-%d').date(),
+            end_date=datetime.strptime(to_date, '%Y-%m-%d').date()
+        )
+        
+        try:
+            if result['error'] is not None:
+                raise result['error']
+            
+            security = securities.get(ticker)
+            if not security:
+                details = result['details']
+                security = Security(
+                    symbol=ticker,
+                    name=details.name,
+                    security_type=details.type.lower() if details.type else 'unknown',
+                    exchange=details.primary_exchange,
+                    sector=details.sic_description,
+                    market_cap=details.market_cap
+                )
+                db.session.add(security)
+                db.session.flush()
+            
+            sync_log.security_id = security.id
+            sync_log.records_processed = 0
+            sync_log.records_added = 0
+            sync_log.records_updated = 0
+            sync_log.records_failed = 0
+            
+            for range_start, range_end, aggs in result['batches']:
+                counts = self._write_bars(security.id, timespan, aggs)
+                self.coverage.record_fetch(security.id, timespan, range_start, range_end,
+                                           counts['processed'], counts['last_date'], limit)
+                sync_log.records_processed += counts['processed']
+                sync_log.records_added += counts['added']
+                sync_log.records_updated += counts['updated']
+                sync_log.records_failed += counts['failed']
+            
+            sync_log.is_success = sync_log.records_failed == 0
+            securities[ticker] = security
+            
+        except Exception as e:
+            logger.error(f"Error syncing price data for {ticker}: {str(e)}")
+            db.session.rollback()
+            security = securities.get(ticker)
+            sync_log.security_id = security.id if security else None
+            sync_log.is_success = False
+            sync_log.error_message = str(e)
+            url = f"{self.base_url}/v2/aggs/ticker/{ticker}/range/1/{timespan}/{from_date}/{to_date}"
+            self._log_api_call('aggregates', url, 'GET', None, None, e)
+        
+        sync_log.execution_time = result['fetch_time'] + (time.time() - start_time)
+        db.session.add(sync_log)
+        db.session.commit()
+        return sync_log
+    
+    def sync_universe(self, tickers, from_date=None, to_date=None, timespan='day', max_workers=8, limit=50000, force=False):
+        """Sync price data for many tickers concurrently
+        
+        Polygon requests fan out across a bounded thread pool while every database
+        write happens on the calling thread, so SQLite only ever sees one writer.
+        Only ranges missing from the coverage index are fetched unless ``force``.
+        """
+        # Default to last 30 days if no dates provided
+        if not from_date:
+            from_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+        if not to_date:
+            to_date = datetime.now().strftime('%Y-%m-%d')
+        
+        # Register on this thread so workers pick up the API key's limits
+        self._ensure_registered()
+        wait_before = self.rate_limiter.get_metrics(self.rate_limit_bucket).get('wait_time', 0.0)
+        
+        tickers = list(dict.fromkeys(t.upper() for t in tickers))
+        securities = {s.symbol: s for s in Security.query.filter(Security.symbol.in_(tickers)).all()}
+        
+        # Plan the missing ranges for every ticker up front
+        start_date = datetime.strptime(from_date, '%Y-%m-%d').date()
+        end_date = datetime.strptime(to_date, '%Y-%m-%d').date()
+        intervals = self.coverage.get_intervals_bulk([s.id for s in securities.values()], timespan)
+        plans = {}
+        for ticker in tickers:
+            security = securities.get(ticker)
+            if security and not force:
+                plans[ticker] = self.coverage.missing_ranges(security.id, timespan, start_date, end_date,
+                                                             intervals[security.id])
+            else:
+                plans[ticker] = [(start_date, end_date)]
+        
+        summary = {
+            'tickers': len(tickers),
+            'succeeded': 0,
+            'skipped': sum(1 for ranges in plans.values() if not ranges),
+            'failed': 0,
+            'records_added': 0,
+            'records_updated': 0,
+            'records_failed': 0
+        }
+        start_time = time.time()
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            queue = iter([ticker for ticker in tickers if plans[ticker]])
+            
+            while True:
+                # Keep at most two fetches per worker in flight to bound memory
+                while len(pending) < max_workers * 2:
+                    ticker = next(queue, None)
+                    if ticker is None:
+                        break
+                    pending.add(executor.submit(
+                        self._fetch_ticker, ticker, timespan, plans[ticker], limit,
+                        ticker not in securities
+                    ))
+                
+                if not pending:
+                    break
+                
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sync_log = self._store_ticker_result(future.result(), securities, timespan, from_date, to_date, limit)
+                    if sync_log.is_success:
+                        summary['succeeded'] += 1
+                    else:
+                        summary['failed'] += 1
+                    summary['records_added'] += sync_log.records_added or 0
+                    summary['records_updated'] += sync_log.records_updated or 0
+                    summary['records_failed'] += sync_log.records_failed or 0
+        
+        summary['execution_time'] = time.time() - start_time
+        summary['rate_limit_wait'] = self.rate_limiter.get_metrics(self.rate_limit_bucket).get('wait_time', 0.0) - wait_before
+        logger.info(f"Synced {summary['succeeded']}/{summary['tickers']} tickers "
+                    f"({summary['skipped']} already covered) in {summary['execution_time']:.1f}s")
+        return summary
+    
+    def _fetch_grouped_day(self, day, adjusted):
+        """Fetch grouped daily bars for every ticker on one date without touching the database"""
+        start_time = time.time()
+        try:
+            self._acquire()
+            aggs = list(self.client.get_grouped_daily_aggs(date=day.isoformat(), adjusted=adjusted))
+            return {'day': day, 'aggs': aggs, 'error': None, 'fetch_time': time.time() - start_time}
+        except Exception as e:
+            return {'day': day, 'aggs': None, 'error': e, 'fetch_time': time.time() - start_time}
+    
+    def _store_grouped_day(self, result, symbols):
+        """Write one day of grouped bars and record its DataSyncLog, returning the security ids written"""
+        day = result['day']
+        start_time = time.time()
+        sync_log = DataSyncLog(data_type='price_data', start_date=day, end_date=day)
+        security_ids = {}
+        
+        try:
+            if result['error'] is not None:
+                raise result['error']
+            
+            aggs = [agg for agg in result['aggs'] if agg.ticker and (symbols is None or agg.ticker in symbols)]
+            security_ids = self.writer.ensure_securities([agg.ticker for agg in aggs])
+            counts = self.writer.write_grouped_bars(security_ids, aggs)
+            
+            sync_log.records_processed = counts['processed']
+            sync_log.records_added = counts['added']
+            sync_log.records_updated = counts['updated']
+            sync_log.records_failed = counts['failed']
+            sync_log.is_success = counts['failed'] == 0
+            
+        except Exception as e:
+            logger.error(f"Error syncing grouped daily bars for {day}: {str(e)}")
+            db.session.rollback()
+            security_ids = {}
+            sync_log.is_success = False
+            sync_log.error_message = str(e)
+            url = f"{self.base_url}/v2/aggs/grouped/locale/us/market/stocks/{day.isoformat()}"
+            self._log_api_call('grouped_daily', url, 'GET', None, None, e)
+        
+        sync_log.execution_time = result['fetch_time'] + (time.time() - start_time)
+        db.session.add(sync_log)
+        db.session.commit()
+        return sync_log, set(security_ids.values())
+    
+    def sync_grouped_daily(self, from_date=None, to_date=None, symbols=None, max_workers=4, adjusted=True):
+        """Sync daily bars for the whole market with one grouped request per trading day
+        
+        Unknown tickers get Security stubs created in bulk. Pass ``symbols`` to only
+        store a subset of the market; it costs the same number of requests.
+        """
+        # Default to the last trading day if no dates provided
+        if not to_date:
+            to_date = datetime.now().strftime('%Y-%m-%d')
+        if not from_date:
+            from_date = to_date
+        
+        self._ensure_registered()
+        days = trading_days(datetime.strptime(from_date, '%Y-%m-%d').date(),
+                            datetime.strptime(to_date, '%Y-%m-%d').date())
+        symbols = {symbol.upper() for symbol in symbols} if symbols else None
+        
+        summary = {
+            'days': len(days),
+            'succeeded': 0,
+            'failed': 0,
+            'records_added': 0,
+            'records_updated': 0,
+            'records_failed': 0
+        }
+        start_time = time.time()
+        
+        # The ranges of consecutive synced days each security received bars for
+        received = {}
+        previous_day = None
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Days are written in order so coverage runs stay contiguous, a window at a time
+            window = max_workers * 2
+            results = (
+                result
+                for chunk_start in range(0, len(days), window)
+                for result in executor.map(lambda day: self._fetch_grouped_day(day, adjusted),
+                                           days[chunk_start:chunk_start + window])
+            )
+            for result in results:
+                sync_log, security_ids = self._store_grouped_day(result, symbols)
+                summary['records_added'] += sync_log.records_added or 0
+                summary['records_updated'] += sync_log.records_updated or 0
+                summary['records_failed'] += sync_log.records_failed or 0
+                
+                if sync_log.is_success:
+                    summary['succeeded'] += 1
+                    day = result['day']
+                    for security_id in security_ids:
+                        ranges = received.setdefault(security_id, [])
+                        if ranges and ranges[-1][1] == previous_day:
+                            ranges[-1] = (ranges[-1][0], day)
+                        else:
+                            ranges.append((day, day))
+                    previous_day = day
+                else:
+                    summary['failed'] += 1
+                    if received:
+                        self.coverage.record_fetch_many(received, 'day')
+                        db.session.commit()
+                    received, previous_day = {}, None
+        
+        if received:
+            self.coverage.record_fetch_many(received, 'day')
+            db.session.commit()
+        
+        summary['execution_time'] = time.time() - start_time
+        logger.info(f"Synced grouped daily bars for {summary['succeeded']}/{summary['days']} days "
+                    f"in {summary['execution_time']:.1f}s")
+        return summary
+    
     def search_tickers(self, query, limit=10):
         """Search for tickers by name or symbol"""
         try:
+            self._acquire()
             results = self.client.get_tickers(search=query, limit=limit)
             
             securities = []
@@ -317,6 +698,7 @@ class PolygonService:
     def get_market_status(self):
         """Get current market status"""
         try:
+            self._acquire()
             status = self.client.get_market_status()
             return status
         except Exception as e:
@@ -0,0 +1,82 @@
+import logging
+from datetime import date, datetime
+from sqlalchemy import select
+from ..models import (
+    db, Security, PriceData, PriceCoverage, FTDData, SwapCycle, IndicatorSnapshot,
+    Watchlist, WatchlistItem, Alert, ApiProvider, ApiEndpoint, ApiCallLog, ApiCallRollup
+)
+from .bulk_writer import BulkWriter
+from .data_access import PRICE_COLUMNS, FTD_COLUMNS, frame_query
+from .indicator_store import INDICATOR_COLUMNS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Hot lookups, each built the way the code that runs it builds it
+HOT_QUERIES = {
+    'security_by_symbol': lambda: select(Security).where(Security.symbol == 'GME'),
+    'price_frame': lambda: frame_query(PriceData, 1, PRICE_COLUMNS, date(2024, 1, 1), date(2024, 12, 31)),
+    'price_close_frame': lambda: frame_query(PriceData, 1, ['close']),
+    'upsert_existing_keys': lambda: BulkWriter().existing_keys_query(
+        PriceData.__table__, ['security_id', 'date'], [(1, date(2024, 1, 2)), (2, date(2024, 1, 2))]
+    ),
+    'has_price_data': lambda: select(PriceData.id).where(PriceData.security_id == 1).limit(1),
+    'price_coverage': lambda: select(PriceCoverage).where(
+        PriceCoverage.security_id == 1, PriceCoverage.timespan == 'day'
+    ).order_by(PriceCoverage.start_date),
+    'ftd_frame': lambda: frame_query(FTDData, 1, FTD_COLUMNS),
+    'indicator_frame': lambda: frame_query(IndicatorSnapshot, 1, INDICATOR_COLUMNS, timeframe='1d'),
+    'active_swap_cycles': lambda: select(SwapCycle.id).where(
+        SwapCycle.security_id.in_([1, 2]), SwapCycle.is_active.is_(True)
+    ),
+    'user_watchlists': lambda: select(Watchlist).where(Watchlist.user_id == 1),
+    'watchlist_items': lambda: select(WatchlistItem).where(WatchlistItem.watchlist_id == 1),
+    'user_alerts': lambda: select(Alert).where(Alert.user_id == 1),
+    'user_active_alerts': lambda: select(Alert).where(Alert.user_id == 1, Alert.is_active.is_(True)),
+    'security_active_alerts': lambda: select(Alert).where(Alert.security_id == 1, Alert.is_active.is_(True)),
+    'provider_by_name': lambda: select(ApiProvider).where(ApiProvider.name == 'Polygon.io'),
+    'endpoint_by_name': lambda: select(ApiEndpoint).where(
+        ApiEndpoint.provider_id == 1, ApiEndpoint.name == 'aggregates'
+    ),
+    'expired_call_logs': lambda: select(ApiCallLog.id).where(
+        ApiCallLog.created_at < datetime(2024, 1, 1)
+    ).limit(5000),
+    'api_usage': lambda: select(ApiCallRollup).where(
+        ApiCallRollup.hour >= datetime(2024, 1, 1), ApiCallRollup.provider_id == 1
+    )
+}
+
+
+def explain_query_plan(stmt):
+    """Get the detail lines of SQLite's EXPLAIN QUERY PLAN for a statement"""
+    compiled = stmt.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+    return [row[-1] for row in rows]
+
+
+def plan_problems(plan):
+    """Get the steps of a query plan that read a whole table or index, or sort in a temp b-tree"""
+    # Scanning the rows of a VALUES list is expected
+    return [step for step in plan
+            if (step.startswith('SCAN ') and 'CONSTANT ROW' not in step) or 'TEMP B-TREE' in step]
+
+
+def check_query_plans(names=None):
+    """Explain each hot query, returning {name: {'plan': [...], 'problems': [...]}}
+    
+    A query has problems when SQLite plans a full table scan or an extra sort
+    for it, which means the index it depends on is missing or no longer usable.
+    Only SQLite is supported.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        raise ValueError(f"Query plan checks only support SQLite, not {db.engine.dialect.name}")
+    
+    results = {}
+    for name in names or HOT_QUERIES:
+        plan = explain_query_plan(HOT_QUERIES[name]())
+        results[name] = {'plan': plan, 'problems': plan_problems(plan)}
+        if results[name]['problems']:
+            logger.warning(f"Query {name} plan regressed: {results[name]['problems']}")
+    return results
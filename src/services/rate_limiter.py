@@ -0,0 +1,169 @@
+import os
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from datetime import datetime
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be admitted under the configured rate limits"""
+    pass
+
+
+class RateLimiter:
+    """Token-bucket rate limiter shared between processes through a SQLite file
+    
+    Each bucket holds up to ``per_minute`` tokens and refills continuously at
+    ``per_minute / 60`` tokens per second. An optional ``per_day`` counter resets
+    at midnight UTC. Bucket state lives in a small SQLite database so every
+    gunicorn worker draws from the same budget.
+    """
+    
+    def __init__(self, path=None):
+        """Initialize the rate limiter with the path of its state database"""
+        self.path = path or os.environ.get(
+            'RATE_LIMIT_DB',
+            os.path.join(tempfile.gettempdir(), 'finport_rate_limits.db')
+        )
+        self._local = threading.local()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {}
+        self._init_db()
+    
+    def _connect(self):
+        """Get the calling thread's connection to the state database"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+    
+    def _init_db(self):
+        """Create the bucket table if it doesn't exist"""
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_buckets ('
+            'bucket TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, '
+            'day TEXT NOT NULL, day_count INTEGER NOT NULL)'
+        )
+    
+    def _try_acquire(self, bucket, per_minute, per_day, tokens):
+        """Atomically take tokens from a bucket, returning the seconds to wait if unavailable"""
+        conn = self._connect()
+        now = time.time()
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at, day, day_count FROM rate_limit_buckets WHERE bucket = ?',
+                (bucket,)
+            ).fetchone()
+            
+            if row is None:
+                available, day, day_count = float(per_minute or 0), today, 0
+            else:
+                available, updated_at, day, day_count = row
+                if per_minute:
+                    # Refill for the time elapsed since the last acquire
+                    available = min(float(per_minute), available + (now - updated_at) * per_minute / 60.0)
+            
+            if day != today:
+                day, day_count = today, 0
+            
+            if per_day and day_count + tokens > per_day:
+                conn.execute('COMMIT')
+                raise RateLimitExceeded(f"Daily limit of {per_day} requests reached for {bucket}")
+            
+            wait = 0.0
+            if per_minute:
+                if available >= tokens:
+                    available -= tokens
+                else:
+                    wait = (tokens - available) * 60.0 / per_minute
+            if wait == 0.0:
+                day_count += tokens
+            
+            conn.execute(
+                'INSERT INTO rate_limit_buckets (bucket, tokens, updated_at, day, day_count) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT(bucket) DO UPDATE SET '
+                'tokens = excluded.tokens, updated_at = excluded.updated_at, '
+                'day = excluded.day, day_count = excluded.day_count',
+                (bucket, available, now, day, day_count)
+            )
+            conn.execute('COMMIT')
+            return wait
+        
+        except RateLimitExceeded:
+            raise
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def _record(self, bucket, acquired, waited):
+        """Record acquire metrics for a bucket"""
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(bucket, {
+                'acquired': 0,
+                'rejected': 0,
+                'wait_time': 0.0,
+                'max_wait_time': 0.0
+            })
+            if acquired:
+                metrics['acquired'] += 1
+            else:
+                metrics['rejected'] += 1
+            metrics['wait_time'] += waited
+            metrics['max_wait_time'] = max(metrics['max_wait_time'], waited)
+    
+    def acquire(self, bucket, per_minute=None, per_day=None, tokens=1, blocking=True, timeout=None):
+        """Take tokens from a bucket
+        
+        In blocking mode this sleeps until the tokens are available (or ``timeout``
+        seconds have passed) and raises RateLimitExceeded once the daily limit is
+        spent. In non-blocking mode it returns False instead of waiting.
+        """
+        start_time = time.monotonic()
+        
+        while True:
+            try:
+                wait = self._try_acquire(bucket, per_minute, per_day, tokens)
+            except RateLimitExceeded:
+                self._record(bucket, False, time.monotonic() - start_time)
+                if blocking:
+                    raise
+                return False
+            
+            waited = time.monotonic() - start_time
+            if wait == 0.0:
+                self._record(bucket, True, waited)
+                return True
+            
+            if not blocking or (timeout is not None and waited + wait > timeout):
+                self._record(bucket, False, waited)
+                return False
+            
+            time.sleep(min(wait, 1.0))
+    
+    def get_metrics(self, bucket=None):
+        """Get acquire counts and time spent waiting, per bucket"""
+        with self._metrics_lock:
+            if bucket is not None:
+                return dict(self._metrics.get(bucket, {}))
+            return {name: dict(metrics) for name, metrics in self._metrics.items()}
+
+
+# Shared limiter, created lazily
+_rate_limiter = None
+
+def get_rate_limiter():
+    """Get or create the process-wide rate limiter"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
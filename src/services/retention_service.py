@@ -0,0 +1,177 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func, text
+from ..models import db, ApiCallLog, ApiCallRollup, DataSyncLog
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class RetentionService:
+    """Service for rolling up, expiring and compacting API call and sync logs"""
+    
+    def __init__(self, call_log_days=None, sync_log_days=None, batch_size=5000):
+        """Initialize the service with how many days of raw logs to keep"""
+        self.call_log_days = call_log_days or int(os.environ.get('API_CALL_LOG_RETENTION_DAYS', 30))
+        self.sync_log_days = sync_log_days or int(os.environ.get('DATA_SYNC_LOG_RETENTION_DAYS', 90))
+        self.batch_size = batch_size
+    
+    def _floor_hour(self, value):
+        """Truncate a datetime to the start of its hour"""
+        return value.replace(minute=0, second=0, microsecond=0)
+    
+    def _rollup_window(self, start, end):
+        """Aggregate the raw call logs in [start, end) into rollup rows"""
+        rows = db.session.execute(
+            select(ApiCallLog.provider_id, ApiCallLog.endpoint_id, ApiCallLog.created_at,
+                   ApiCallLog.is_success, ApiCallLog.response_size, ApiCallLog.execution_time)
+            .where(ApiCallLog.created_at >= start, ApiCallLog.created_at < end)
+        ).all()
+        if not rows:
+            return []
+        
+        df = pd.DataFrame(rows, columns=['provider_id', 'endpoint_id', 'created_at', 'is_success',
+                                         'response_size', 'execution_time'])
+        df['hour'] = pd.to_datetime(df['created_at']).dt.floor('h')
+        # Group NULL endpoints together rather than dropping them
+        df['endpoint_id'] = df['endpoint_id'].fillna(-1).astype(np.int64)
+        df['is_error'] = ~df['is_success'].fillna(False).astype(bool)
+        
+        grouped = df.groupby(['provider_id', 'endpoint_id', 'hour'])
+        latency = grouped['execution_time']
+        stats = pd.DataFrame({
+            'call_count': grouped.size(),
+            'error_count': grouped['is_error'].sum(),
+            'response_bytes': grouped['response_size'].sum(min_count=0),
+            'latency_p50': latency.quantile(0.5),
+            'latency_p95': latency.quantile(0.95),
+            'latency_p99': latency.quantile(0.99),
+            'latency_max': latency.max()
+        }).reset_index()
+        
+        return [{
+            'provider_id': int(row.provider_id),
+            'endpoint_id': None if row.endpoint_id == -1 else int(row.endpoint_id),
+            'hour': row.hour.to_pydatetime(),
+            'call_count': int(row.call_count),
+            'error_count': int(row.error_count),
+            'response_bytes': int(row.response_bytes),
+            'latency_p50': None if pd.isna(row.latency_p50) else float(row.latency_p50),
+            'latency_p95': None if pd.isna(row.latency_p95) else float(row.latency_p95),
+            'latency_p99': None if pd.isna(row.latency_p99) else float(row.latency_p99),
+            'latency_max': None if pd.isna(row.latency_max) else float(row.latency_max)
+        } for row in stats.itertuples(index=False)]
+    
+    def rollup_api_calls(self, until=None, since=None):
+        """Roll completed hours of raw call logs into hourly aggregates, returning the hours rolled
+        
+        Rolling up resumes after the latest hour already aggregated and works a
+        day at a time. Each day's rollups replace any existing rows for its hours,
+        so the job can be rerun safely. ``since`` rolls the hours from then on
+        again, so call logs written late into hours already aggregated are counted.
+        """
+        until = self._floor_hour(until or datetime.utcnow())
+        last_hour = db.session.execute(select(func.max(ApiCallRollup.hour))).scalar()
+        if last_hour is not None:
+            start = last_hour + timedelta(hours=1)
+        else:
+            first_call = db.session.execute(select(func.min(ApiCallLog.created_at))).scalar()
+            if first_call is None:
+                return 0
+            start = self._floor_hour(first_call)
+        if since is not None:
+            start = min(start, self._floor_hour(since))
+        
+        hours = 0
+        while start < until:
+            end = min(start + timedelta(days=1), until)
+            rollups = self._rollup_window(start, end)
+            db.session.execute(delete(ApiCallRollup).where(ApiCallRollup.hour >= start, ApiCallRollup.hour < end))
+            if rollups:
+                db.session.execute(ApiCallRollup.__table__.insert(), rollups)
+            db.session.commit()
+            hours += len({row['hour'] for row in rollups})
+            start = end
+        
+        return hours
+    
+    def _delete_before(self, model, cutoff):
+        """Delete rows created before a cutoff in batches, committing each batch"""
+        deleted = 0
+        while True:
+            ids = select(model.id).where(model.created_at < cutoff).limit(self.batch_size)
+            count = db.session.execute(delete(model).where(model.id.in_(ids))).rowcount
+            db.session.commit()
+            deleted += count
+            if count < self.batch_size:
+                return deleted
+    
+    def purge(self, now=None):
+        """Delete raw logs past their retention period, rolling call logs up first"""
+        now = now or datetime.utcnow()
+        call_cutoff = self._floor_hour(now - timedelta(days=self.call_log_days))
+        
+        # Never delete raw call logs that haven't been aggregated. The hours being
+        # deleted are rolled again first, in case logs were written into them late.
+        oldest_call = db.session.execute(
+            select(func.min(ApiCallLog.created_at)).where(ApiCallLog.created_at < call_cutoff)
+        ).scalar()
+        self.rollup_api_calls(until=call_cutoff, since=oldest_call)
+        
+        return {
+            'api_call_logs': self._delete_before(ApiCallLog, call_cutoff),
+            'data_sync_logs': self._delete_before(DataSyncLog, now - timedelta(days=self.sync_log_days))
+        }
+    
+    def vacuum(self, pages=None, convert=False):
+        """Return free pages to the filesystem with an incremental VACUUM, returning pages freed
+        
+        Databases created before incremental auto-vacuum was enabled need a one-off
+        full VACUUM to switch modes, which only runs when ``convert`` is set since
+        it rewrites the whole file. Other backends reclaim space on their own.
+        """
+        if db.engine.dialect.name != 'sqlite':
+            return 0
+        
+        with db.engine.connect() as conn:
+            # VACUUM can't run inside a transaction
+            conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+            if conn.execute(text('PRAGMA auto_vacuum')).scalar() != 2:
+                if not convert:
+                    logger.warning("Database isn't in incremental auto-vacuum mode, skipping vacuum")
+                    return 0
+                logger.info("Converting database to incremental auto-vacuum")
+                free_pages = conn.execute(text('PRAGMA freelist_count')).scalar()
+                conn.execute(text('PRAGMA auto_vacuum=INCREMENTAL'))
+                conn.execute(text('VACUUM'))
+                return free_pages
+            
+            free_pages = conn.execute(text('PRAGMA freelist_count')).scalar()
+            conn.execute(text(f'PRAGMA incremental_vacuum({int(pages)})' if pages else 'PRAGMA incremental_vacuum'))
+            return free_pages - conn.execute(text('PRAGMA freelist_count')).scalar()
+    
+    def run(self, vacuum_pages=None, convert=False):
+        """Roll up, purge and compact, returning a summary"""
+        start_time = datetime.now()
+        summary = {'hours_rolled': self.rollup_api_calls()}
+        summary.update(self.purge())
+        summary['pages_freed'] = self.vacuum(vacuum_pages, convert)
+        summary['execution_time'] = (datetime.now() - start_time).total_seconds()
+        logger.info(f"Retention run: {summary}")
+        return summary
+    
+    def get_rollups(self, provider_id=None, endpoint_id=None, start=None, end=None):
+        """Get hourly call rollups, oldest first"""
+        query = ApiCallRollup.query
+        if start:
+            query = query.filter(ApiCallRollup.hour >= start)
+        if end:
+            query = query.filter(ApiCallRollup.hour < end)
+        if provider_id:
+            query = query.filter(ApiCallRollup.provider_id == provider_id)
+        if endpoint_id:
+            query = query.filter(ApiCallRollup.endpoint_id == endpoint_id)
+        return query.order_by(ApiCallRollup.hour, ApiCallRollup.provider_id, ApiCallRollup.endpoint_id).all()
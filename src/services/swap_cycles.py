@@ -0,0 +1,184 @@
+import math
+import logging
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fields of a detected cycle that are computed rather than read from a bar
+CYCLE_STATISTICS = ('duration', 'return', 'drawdown', 'volatility', 'ftd_correlation')
+
+
+def add_cycle_columns(df):
+    """Add the volatility and the peak and trough flags swap cycles are detected from
+    
+    ``df`` is date-indexed with close and FTD quantity columns.
+    """
+    # Calculate volatility
+    df['returns'] = df['close'].pct_change()
+    df['volatility'] = df['returns'].rolling(window=20).std() * np.sqrt(252)  # Annualized
+    
+    # Identify potential cycle peaks and troughs
+    df['rolling_max'] = df['close'].rolling(window=20).max()
+    df['rolling_min'] = df['close'].rolling(window=20).min()
+    df['is_peak'] = (df['close'] == df['rolling_max']) & (df['close'].shift(1) < df['close']) & (df['close'].shift(-1) < df['close'])
+    df['is_trough'] = (df['close'] == df['rolling_min']) & (df['close'].shift(1) > df['close']) & (df['close'].shift(-1) > df['close'])
+    return df
+
+
+def find_swap_cycles(df):
+    """Find trough-peak-trough cycles in a frame prepared by add_cycle_columns
+    
+    A cycle starts at the first trough and ends at the next trough with a peak
+    after the cycle start, which then starts the following cycle. Its peak is
+    the last one before the end. Cycle boundaries come from index arrays and
+    per-cycle statistics from sums over each cycle's rows, so there is no loop
+    over bars.
+    """
+    troughs = np.flatnonzero(df['is_trough'].to_numpy(dtype=bool))
+    peaks = np.flatnonzero(df['is_peak'].to_numpy(dtype=bool))
+    
+    # Troughs without a peak since the previous trough don't end the open cycle,
+    # so a trough ends one exactly when a peak falls between it and the previous trough
+    peaks_before = np.searchsorted(peaks, troughs)
+    ends = troughs[1:][np.diff(peaks_before) > 0]
+    if len(ends) == 0:
+        return []
+    starts = np.concatenate([troughs[:1], ends[:-1]])
+    peak_rows = peaks[np.searchsorted(peaks, ends) - 1]
+    
+    close = df['close'].to_numpy()
+    quantity = df['quantity'].to_numpy()
+    dates = df.index[np.concatenate([starts, peak_rows, ends])].date.reshape(3, -1)
+    start_price, peak_price, end_price = close[starts], close[peak_rows], close[ends]
+    volatility, correlation = _cycle_statistics(starts, ends, close, quantity, df['volatility'].to_numpy())
+    
+    cycles = []
+    for i, (start_date, peak_date, end_date) in enumerate(zip(*dates)):
+        cycles.append({
+            'start_date': start_date,
+            'start_price': start_price[i].item(),
+            'ftd_start': quantity[starts[i]].item(),
+            'peak_date': peak_date,
+            'peak_price': peak_price[i].item(),
+            'ftd_peak': quantity[peak_rows[i]].item(),
+            'end_date': end_date,
+            'end_price': end_price[i].item(),
+            'ftd_end': quantity[ends[i]].item(),
+            'duration': (end_date - start_date).days,
+            'return': (peak_price[i] / start_price[i]).item() - 1,
+            'drawdown': (end_price[i] / peak_price[i]).item() - 1,
+            'volatility': volatility[i].item(),
+            'ftd_correlation': correlation[i].item()
+        })
+    return cycles
+
+
+def _cycle_statistics(starts, ends, close, quantity, volatility):
+    """Get the mean volatility and the close/FTD correlation over each cycle's rows, ends included
+    
+    Consecutive cycles share their boundary trough, so the rows of every cycle
+    are gathered back to back and summed per cycle with np.add.reduceat.
+    """
+    lengths = ends - starts + 1
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    rows = np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths)
+    
+    # Mean of the defined volatility values, as Series.mean skips NaN
+    values = volatility[rows].astype(np.float64)
+    defined = ~np.isnan(values)
+    x = close[rows].astype(np.float64)
+    y = quantity[rows].astype(np.float64)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_volatility = (np.add.reduceat(np.where(defined, values, 0.0), offsets)
+                           / np.add.reduceat(defined.astype(np.int64), offsets))
+        
+        # Pearson correlation from deviations about each cycle's means, in the order np.corrcoef divides
+        dx = x - np.repeat(np.add.reduceat(x, offsets) / lengths, lengths)
+        dy = y - np.repeat(np.add.reduceat(y, offsets) / lengths, lengths)
+        scale = lengths - 1
+        covariance = np.add.reduceat(dx * dy, offsets) / scale
+        correlation = covariance / np.sqrt(np.add.reduceat(dx * dx, offsets) / scale)
+        correlation = correlation / np.sqrt(np.add.reduceat(dy * dy, offsets) / scale)
+    return mean_volatility, np.clip(correlation, -1, 1)
+
+
+def find_swap_cycles_iterative(df):
+    """Find swap cycles by walking the bars one at a time, the reference find_swap_cycles is checked against"""
+    cycles = []
+    current_cycle = None
+    
+    for date, row in df.iterrows():
+        if row['is_trough'] and current_cycle is None:
+            # Start of a new cycle
+            current_cycle = {
+                'start_date': date.date(),
+                'start_price': row['close'],
+                'ftd_start': row['quantity']
+            }
+        elif row['is_peak'] and current_cycle is not None:
+            # Peak of the cycle
+            current_cycle['peak_date'] = date.date()
+            current_cycle['peak_price'] = row['close']
+            current_cycle['ftd_peak'] = row['quantity']
+        elif row['is_trough'] and current_cycle is not None and 'peak_date' in current_cycle:
+            # End of the cycle
+            current_cycle['end_date'] = date.date()
+            current_cycle['end_price'] = row['close']
+            current_cycle['ftd_end'] = row['quantity']
+            current_cycle['duration'] = (current_cycle['end_date'] - current_cycle['start_date']).days
+            current_cycle['return'] = (current_cycle['peak_price'] / current_cycle['start_price']) - 1
+            current_cycle['drawdown'] = (current_cycle['end_price'] / current_cycle['peak_price']) - 1
+            
+            # Calculate volatility for the cycle
+            cycle_df = df.loc[(df.index >= pd.Timestamp(current_cycle['start_date'])) &
+                             (df.index <= pd.Timestamp(current_cycle['end_date']))]
+            current_cycle['volatility'] = cycle_df['volatility'].mean()
+            
+            # Calculate FTD correlation
+            if 'quantity' in cycle_df.columns:
+                current_cycle['ftd_correlation'] = cycle_df['close'].corr(cycle_df['quantity'])
+            else:
+                current_cycle['ftd_correlation'] = None
+            
+            cycles.append(current_cycle)
+            current_cycle = {
+                'start_date': date.date(),
+                'start_price': row['close'],
+                'ftd_start': row['quantity']
+            }
+    
+    return cycles
+
+
+def compare_swap_cycles(expected, actual):
+    """Get the largest relative difference between the statistics of two cycle lists
+    
+    Returns inf when the cycles themselves differ: their number, dates, prices
+    or FTD quantities. NaN statistics only match NaN.
+    """
+    if len(expected) != len(actual):
+        return math.inf
+    
+    worst = 0.0
+    for expected_cycle, actual_cycle in zip(expected, actual):
+        for name, value in expected_cycle.items():
+            other = actual_cycle.get(name)
+            if name not in CYCLE_STATISTICS:
+                if value != other:
+                    return math.inf
+                continue
+            if _undefined(value) or _undefined(other):
+                if _undefined(value) != _undefined(other):
+                    return math.inf
+                continue
+            worst = max(worst, abs(value - other) / max(abs(value), 1.0))
+    return worst
+
+
+def _undefined(value):
+    """Check whether a cycle statistic is missing or NaN"""
+    return value is None or math.isnan(value)
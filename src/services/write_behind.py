@@ -0,0 +1,226 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from flask import current_app, has_app_context
+from ..models import db
+from .bulk_writer import BulkWriter
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How each kind of result is persisted, filled in by register_kind
+_kinds = {}
+
+
+def register_kind(kind, model, conflict_columns, update_columns=None, key_columns=None, prepare=None, write=None):
+    """Register how rows of one kind of result are written
+    
+    Rows are upserted on ``conflict_columns``. Queued rows are coalesced on
+    ``key_columns`` (the conflict columns by default), a newer submission for a
+    key replacing the older one entirely. ``prepare`` is called with the key
+    tuples being rewritten inside the write transaction before the rows are
+    upserted, including keys submitted without any rows. ``write`` replaces
+    the upsert for rows spanning several tables, it is called with the rows
+    and the BulkWriter inside the same transaction and returns the counts.
+    """
+    _kinds[kind] = {
+        'model': model,
+        'conflict_columns': conflict_columns,
+        'update_columns': update_columns,
+        'key_columns': key_columns or conflict_columns,
+        'prepare': prepare,
+        'write': write
+    }
+
+
+def _group_rows(spec, rows, keys=()):
+    """Group rows by their key columns, with an empty group for each of ``keys`` without rows"""
+    groups = {tuple(key): [] for key in keys}
+    for row in rows:
+        groups.setdefault(tuple(row[name] for name in spec['key_columns']), []).append(row)
+    return groups
+
+
+def write_rows(kind, rows, writer=None, keys=()):
+    """Write rows of a registered kind in one transaction
+    
+    ``keys`` are key tuples being rewritten in addition to those of the rows,
+    so a key whose new result is empty still goes through ``prepare``.
+    """
+    spec = _kinds[kind]
+    writer = writer or BulkWriter()
+    try:
+        if spec['prepare']:
+            spec['prepare'](list(_group_rows(spec, rows, keys)))
+        if spec['write']:
+            counts = spec['write'](rows, writer)
+        else:
+            counts = writer.upsert(spec['model'], rows, spec['conflict_columns'], spec['update_columns'])
+        db.session.commit()
+        return counts
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _pending_size(group):
+    """Count a queued group towards the backlog, a key queued without rows counting as one"""
+    return len(group) or 1
+
+
+class WriteBehindQueue:
+    """Background writer that persists analytics results after the response is sent
+    
+    Submitted rows are grouped by kind and coalesced by key, so repeated views
+    of the same security only write the latest values. A daemon thread flushes
+    every ``flush_interval`` seconds or as soon as ``batch_size`` rows are
+    pending. Submitters block once ``max_pending`` rows are waiting, which
+    bounds memory, and anything still queued is flushed at interpreter exit.
+    """
+    
+    def __init__(self, app, max_pending=50000, batch_size=5000, flush_interval=1.0):
+        """Initialize the queue for an app and start its writer thread"""
+        self.app = app
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.writer = BulkWriter()
+        
+        self._condition = threading.Condition()
+        self._pending = {}
+        self._pending_rows = 0
+        self._in_flight_rows = 0
+        self._stopping = False
+        self._metrics = {'submitted': 0, 'coalesced': 0, 'written': 0, 'failed': 0, 'flushes': 0}
+        
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def submit(self, kind, rows, keys=()):
+        """Queue rows of a registered kind for writing, replacing anything queued for their keys
+        
+        ``keys`` are further key tuples to replace, for keys whose new result has no rows.
+        """
+        groups = _group_rows(_kinds[kind], rows, keys)
+        
+        if self._stopping:
+            # The writer thread is gone, write in the caller instead
+            write_rows(kind, rows, self.writer, keys)
+            return
+        
+        with self._condition:
+            # Wait for the writer to catch up rather than grow without bound
+            while (self._pending_rows + self._in_flight_rows >= self.max_pending
+                   and not self._stopping and self._thread.is_alive()):
+                self._condition.wait()
+            
+            pending = self._pending.setdefault(kind, {})
+            for key, group in groups.items():
+                replaced = pending.pop(key, None)
+                if replaced is not None:
+                    self._pending_rows -= _pending_size(replaced)
+                    self._metrics['coalesced'] += len(replaced)
+                pending[key] = group
+                self._pending_rows += _pending_size(group)
+            self._metrics['submitted'] += len(rows)
+            
+            if self._pending_rows >= self.batch_size:
+                self._condition.notify_all()
+    
+    def _take(self):
+        """Swap out the pending rows for writing"""
+        with self._condition:
+            pending, self._pending = self._pending, {}
+            self._in_flight_rows, self._pending_rows = self._pending_rows, 0
+            return pending
+    
+    def _write(self, pending):
+        """Write a batch of pending rows, one transaction per kind"""
+        with self.app.app_context():
+            for kind, groups in pending.items():
+                rows = [row for group in groups.values() for row in group]
+                try:
+                    write_rows(kind, rows, self.writer, keys=list(groups))
+                    self._metrics['written'] += len(rows)
+                except Exception as e:
+                    logger.error(f"Error writing {len(rows)} queued {kind} rows: {str(e)}")
+                    self._metrics['failed'] += len(rows)
+        
+        with self._condition:
+            self._in_flight_rows = 0
+            self._metrics['flushes'] += 1
+            self._condition.notify_all()
+    
+    def _run(self):
+        """Flush pending rows until the queue is stopped"""
+        while True:
+            with self._condition:
+                if not self._stopping and self._pending_rows < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                stopping = self._stopping
+            
+            pending = self._take()
+            if pending:
+                self._write(pending)
+            elif stopping:
+                return
+    
+    def flush(self, timeout=None):
+        """Wait until everything submitted so far has been written"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._condition.notify_all()
+            while self._pending_rows or self._in_flight_rows:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining if remaining is not None else self.flush_interval)
+        return True
+    
+    def stop(self, timeout=30):
+        """Flush remaining rows and stop the writer thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+    
+    def get_metrics(self):
+        """Get queue counters and the current backlog"""
+        with self._condition:
+            metrics = dict(self._metrics)
+            metrics['pending'] = self._pending_rows
+            metrics['in_flight'] = self._in_flight_rows
+        return metrics
+
+
+def init_write_behind(app):
+    """Start the app's write-behind queue unless WRITE_BEHIND is disabled"""
+    if os.environ.get('WRITE_BEHIND', 'true').lower() in ('0', 'false', 'no'):
+        return None
+    queue = WriteBehindQueue(
+        app,
+        max_pending=int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 50000)),
+        batch_size=int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 5000)),
+        flush_interval=float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', 1.0))
+    )
+    app.extensions['write_behind'] = queue
+    return queue
+
+
+def persist(kind, rows, keys=()):
+    """Queue rows on the current app's write-behind queue, or write them now if there is none
+    
+    ``keys`` are key tuples the rows replace, so that an empty result still
+    clears what was stored for its key.
+    """
+    if not rows and not keys:
+        return
+    queue = current_app.extensions.get('write_behind') if has_app_context() else None
+    if queue is not None:
+        queue.submit(kind, rows, keys)
+    else:
+        write_rows(kind, rows, keys=keys)
@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models import db, init_app
+
+
+def make_app(uri):
+    """Create a Flask app bound to a database, with every table and index created"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    init_app(app)
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    """An app on a fresh SQLite database, inside an app context"""
+    app = make_app(f"sqlite:///{tmp_path / 'test.db'}")
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,62 @@
+import io
+import zipfile
+from src.models import db, FTDData, FTDArchive
+from src.services.archive_cache import ArchiveCache
+from src.services.ftd_service import FTDService
+
+HEADER = 'SETTLEMENT DATE|CUSIP|SYMBOL|QUANTITY (FAILS)|DESCRIPTION|PRICE'
+
+
+def ftd_archive(year, rows):
+    """Zip an FTD file with a fail per row for symbols FTD0, FTD1, ..."""
+    lines = [HEADER] + [f'{year}0105|000000000|FTD{i}|{100 * (i + 1)}|Test {i}|1.50' for i in range(rows)]
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, 'w') as archive:
+        archive.writestr(f'cnsfails{year}01a.txt', '\n'.join(lines))
+    return content.getvalue()
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+    
+    def __init__(self, content):
+        self.content = content
+        self.elapsed = None
+
+
+def test_pinned_blobs_are_not_evicted(tmp_path):
+    cache = ArchiveCache(str(tmp_path), max_bytes=1)
+    first = cache.store('https://example.com/a.zip', b'a' * 10, pin=True)
+    second = cache.store('https://example.com/b.zip', b'b' * 10)
+    assert cache.lookup(first['url']) == first
+    assert cache.lookup(second['url']) is None
+    
+    # Pins are counted, the blob is evictable once every pin is released
+    assert cache.lookup(first['url'], pin=True) == first
+    cache.unpin(first)
+    assert cache.evict() == 0
+    cache.unpin(first)
+    assert cache.evict() == 1
+    assert cache.lookup(first['url'], pin=True) is None
+    assert not cache._pins
+
+
+def test_backfill_keeps_archives_until_parsed(app, tmp_path, monkeypatch):
+    archives = [(f'https://example.com/cnsfails{year}01a.zip', year, 1) for year in (2010, 2011, 2012)]
+    contents = {url: ftd_archive(year, 5) for url, year, _ in archives}
+    
+    service = FTDService()
+    # Too small for even one archive, so every download evicts the others
+    service.cache = ArchiveCache(str(tmp_path / 'cache'), max_bytes=1)
+    monkeypatch.setattr(service, 'list_archives', lambda start_year, end_year: archives)
+    monkeypatch.setattr(service, '_log_api_call', lambda *args: None)
+    monkeypatch.setattr('src.services.ftd_service.requests.get',
+                        lambda url, headers=None: FakeResponse(contents[url]))
+    
+    summary = service.backfill(2010, 2012, download_workers=3, parse_workers=1)
+    assert (summary['succeeded'], summary['failed']) == (3, 0)
+    assert FTDArchive.query.count() == 3
+    assert db.session.query(FTDData).count() == 15
+    assert service.cache.size() == 0
+    assert not service.cache._pins
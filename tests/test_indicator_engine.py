@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import date, timedelta
+from src.models import db, PriceData, IndicatorSnapshot, IndicatorState
+from src.services.bulk_writer import BulkWriter
+from src.services.indicator_engine import IndicatorEngine, new_closes
+from src.services.indicator_registry import compute_series
+from src.services.indicator_store import INDICATOR_COLUMNS
+from src.services.analytics_service import AnalyticsService
+from src.services.write_behind import WriteBehindQueue
+
+DAYS = 620
+START = date(2020, 1, 1)
+
+
+@pytest.fixture
+def closes():
+    rng = np.random.default_rng(7)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, DAYS)))
+    # A flat stretch, where running sums have to come back to exactly zero variance
+    closes[300:330] = closes[300]
+    return closes
+
+
+def insert_bars(security_id, closes, rows):
+    """Store the bars at the given row positions of a close series"""
+    BulkWriter().upsert(PriceData, [{
+        'security_id': security_id,
+        'date': START + timedelta(days=int(i)),
+        'close': float(closes[i])
+    } for i in rows], ['security_id', 'date'])
+    db.session.commit()
+
+
+def assert_matches_full_history(engine, security_id, closes):
+    """Check the stored indicators against computing every bar from scratch"""
+    index = pd.DatetimeIndex([START + timedelta(days=i) for i in range(len(closes))])
+    expected = compute_series(pd.Series(closes, index=index))
+    stored = engine.store.read(security_id).reindex(index)
+    
+    for name in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(stored[name].to_numpy(), expected[name].to_numpy(),
+                                   rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=name)
+    state = IndicatorState.query.filter_by(security_id=security_id).one()
+    assert (state.last_date, state.bar_count) == (index[-1].date(), len(closes))
+
+
+@pytest.fixture
+def security_id(app):
+    security_id = BulkWriter().ensure_securities(['TEST'])['TEST']
+    db.session.commit()
+    return security_id
+
+
+def test_appended_bars_match_full_recompute(security_id, closes):
+    engine = IndicatorEngine()
+    insert_bars(security_id, closes, range(250))
+    assert engine.refresh([security_id])['seeded'] == 1
+    
+    # Appended in steps of one bar, a few bars and many bars
+    for start, stop in [(250, 251), (251, 256), (256, 400), (400, DAYS)]:
+        insert_bars(security_id, closes, range(start, stop))
+        summary = engine.refresh([security_id])
+        assert (summary['updated'], summary['seeded'], summary['bars']) == (1, 0, stop - start)
+    
+    assert_matches_full_history(engine, security_id, closes)
+
+
+def test_backfilled_bars_reseed_the_state(security_id, closes):
+    engine = IndicatorEngine()
+    insert_bars(security_id, closes, range(DAYS - 60, DAYS))
+    engine.refresh([security_id])
+    assert engine.store.read(security_id)['sma_200'].notna().sum() == 0
+    
+    insert_bars(security_id, closes, range(DAYS - 60))
+    summary = engine.refresh([security_id])
+    assert (summary['updated'], summary['seeded']) == (0, 1)
+    
+    assert engine.store.read(security_id)['sma_200'].notna().sum() == DAYS - 199
+    assert_matches_full_history(engine, security_id, closes)
+
+
+def test_gap_filled_bars_reseed_the_state(security_id, closes):
+    engine = IndicatorEngine()
+    insert_bars(security_id, closes, [i for i in range(500) if not 100 <= i < 150])
+    engine.refresh([security_id])
+    
+    insert_bars(security_id, closes, range(100, 150))
+    insert_bars(security_id, closes, range(500, DAYS))
+    assert engine.refresh([security_id])['seeded'] == 1
+    assert_matches_full_history(engine, security_id, closes)
+
+
+@pytest.mark.parametrize('as_text', [False, True], ids=['date', 'text'])
+def test_new_closes_accepts_date_objects_and_text(as_text):
+    # PostgreSQL drivers return date objects, SQLite can return ISO text
+    days = [date(2024, 1, 2), date(2024, 1, 3), date(2024, 1, 4)]
+    rows = [(security_id, day.isoformat() if as_text else day, 10.0 + i)
+            for security_id in (1, 2) for i, day in enumerate(days)]
+    
+    closes = new_closes(rows, {1: date(2024, 1, 2), 2: date(2024, 1, 4)})
+    assert list(closes) == [1]
+    assert list(closes[1].index) == [pd.Timestamp(day) for day in days[1:]]
+    assert closes[1].tolist() == [11.0, 12.0]
+
+
+@pytest.mark.parametrize('queued', [False, True], ids=['direct', 'write-behind'])
+def test_failed_snapshot_write_keeps_the_state(app, security_id, closes, monkeypatch, queued):
+    insert_bars(security_id, closes, range(250))
+    IndicatorEngine().refresh([security_id])
+    insert_bars(security_id, closes, range(250, 300))
+    
+    upsert = BulkWriter.upsert
+    
+    def failing_upsert(self, model, rows, *args, **kwargs):
+        if model is IndicatorSnapshot and rows:
+            raise RuntimeError('snapshot write failed')
+        return upsert(self, model, rows, *args, **kwargs)
+    
+    monkeypatch.setattr(BulkWriter, 'upsert', failing_upsert)
+    if queued:
+        queue = WriteBehindQueue(app)
+        app.extensions['write_behind'] = queue
+        result = AnalyticsService().calculate_technical_indicators('TEST')
+        assert queue.flush(10)
+        queue.stop()
+        assert queue.get_metrics()['failed'] == 1
+        # The response still has the new bars, only storing them failed
+        assert len(result['indicators']['sma_20']) == 300 - 19
+    else:
+        assert AnalyticsService().calculate_technical_indicators('TEST') is None
+    
+    db.session.expire_all()
+    state = IndicatorState.query.filter_by(security_id=security_id).one()
+    assert (state.last_date, state.bar_count) == (START + timedelta(days=249), 250)
+    assert IndicatorSnapshot.query.filter_by(security_id=security_id).count() == 250
@@ -0,0 +1,42 @@
+from datetime import date, datetime, time
+from types import SimpleNamespace
+from src.services.coverage_service import CoverageService
+from src.services.polygon_service import PolygonService
+
+# Monday to Friday, with the Thursday request failing
+DAYS = [date(2024, 1, 8), date(2024, 1, 9), date(2024, 1, 10), date(2024, 1, 11), date(2024, 1, 12)]
+FAILED_DAY = date(2024, 1, 11)
+# Tickers without a bar on some of the days
+MISSING = {'BBB': {date(2024, 1, 10)}, 'CCC': set(DAYS[:4])}
+
+
+class FakeClient:
+    """Grouped daily bars for AAA, BBB and CCC, less the days in MISSING"""
+    
+    def get_grouped_daily_aggs(self, date, adjusted=True):
+        day = datetime.strptime(date, '%Y-%m-%d').date()
+        if day == FAILED_DAY:
+            raise ConnectionError('request failed')
+        timestamp = datetime.combine(day, time(12)).timestamp() * 1000
+        return [
+            SimpleNamespace(ticker=ticker, timestamp=timestamp, open=10.0, high=11.0, low=9.0,
+                            close=10.5, volume=1000, vwap=10.2)
+            for ticker in ('AAA', 'BBB', 'CCC') if day not in MISSING.get(ticker, ())
+        ]
+
+
+def test_grouped_sync_covers_only_the_days_each_security_received(app, monkeypatch):
+    service = PolygonService(api_key='test')
+    service.client = FakeClient()
+    monkeypatch.setattr(service, '_log_api_call', lambda *args: None)
+    
+    summary = service.sync_grouped_daily('2024-01-08', '2024-01-12')
+    assert (summary['succeeded'], summary['failed']) == (4, 1)
+    
+    security_ids = service.writer.ensure_securities(['AAA', 'BBB', 'CCC'])
+    coverage = CoverageService()
+    assert coverage.get_intervals(security_ids['AAA'], 'day') == [(date(2024, 1, 8), date(2024, 1, 10)),
+                                                                  (date(2024, 1, 12), date(2024, 1, 12))]
+    assert coverage.get_intervals(security_ids['BBB'], 'day') == [(date(2024, 1, 8), date(2024, 1, 9)),
+                                                                  (date(2024, 1, 12), date(2024, 1, 12))]
+    assert coverage.get_intervals(security_ids['CCC'], 'day') == [(date(2024, 1, 12), date(2024, 1, 12))]
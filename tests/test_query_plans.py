@@ -0,0 +1,69 @@
+import re
+import pytest
+from sqlalchemy import text
+from src.models import db, ensure_indexes
+from src.services.query_plans import HOT_QUERIES, explain_query_plan, plan_problems
+
+# Leading columns of the index each hot query must search
+EXPECTED_INDEXES = {
+    'security_by_symbol': ('securities', ('symbol',)),
+    'price_frame': ('price_data', ('security_id', 'date', 'open', 'high', 'low', 'close', 'volume', 'vwap')),
+    'price_close_frame': ('price_data', ('security_id', 'date', 'open', 'high', 'low', 'close', 'volume', 'vwap')),
+    'upsert_existing_keys': ('price_data', ('security_id', 'date')),
+    'has_price_data': ('price_data', ('security_id',)),
+    'price_coverage': ('price_coverage', ('security_id', 'timespan', 'start_date')),
+    'ftd_frame': ('ftd_data', ('security_id', 'date')),
+    'indicator_frame': ('indicator_snapshots', ('security_id', 'timeframe', 'date')),
+    'active_swap_cycles': ('swap_cycles', ('security_id', 'is_active')),
+    'user_watchlists': ('watchlists', ('user_id',)),
+    'watchlist_items': ('watchlist_items', ('watchlist_id',)),
+    'user_alerts': ('alerts', ('user_id',)),
+    'user_active_alerts': ('alerts', ('user_id', 'is_active')),
+    'security_active_alerts': ('alerts', ('security_id', 'is_active')),
+    'provider_by_name': ('api_providers', ('name',)),
+    'endpoint_by_name': ('api_endpoints', ('provider_id', 'name')),
+    'expired_call_logs': ('api_call_logs', ('created_at',)),
+    'api_usage': ('api_call_rollups', ('hour',)),
+}
+
+
+def index_columns(name):
+    """Get the columns of a SQLite index in order"""
+    rows = db.session.execute(text(f'PRAGMA index_info("{name}")')).all()
+    return tuple(row[2] for row in sorted(rows))
+
+
+def searched_indexes(plan, table):
+    """Get the indexes a plan searches a table with"""
+    pattern = re.compile(rf'SEARCH {table} USING (?:COVERING )?INDEX (\S+)')
+    return [match.group(1) for match in map(pattern.match, plan) if match]
+
+
+def drop_declared_indexes():
+    """Drop the named indexes declared on models, as in a database created before they were added"""
+    names = db.session.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_autoindex%'"
+    )).scalars().all()
+    for name in names:
+        db.session.execute(text(f'DROP INDEX "{name}"'))
+    db.session.commit()
+
+
+def test_every_hot_query_has_an_expected_index():
+    assert set(EXPECTED_INDEXES) == set(HOT_QUERIES)
+
+
+@pytest.mark.parametrize('upgraded', [False, True], ids=['created', 'upgraded'])
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_expected_index(app, name, upgraded):
+    if upgraded:
+        drop_declared_indexes()
+        ensure_indexes(db.engine, db.metadata)
+    
+    plan = explain_query_plan(HOT_QUERIES[name]())
+    assert plan_problems(plan) == []
+    
+    table, columns = EXPECTED_INDEXES[name]
+    indexes = searched_indexes(plan, table)
+    assert indexes, plan
+    assert any(index_columns(index)[:len(columns)] == columns for index in indexes), plan
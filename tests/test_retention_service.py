@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from src.models import db, ApiProvider, ApiCallLog, ApiCallRollup
+from src.services.retention_service import RetentionService
+
+NOW = datetime(2026, 3, 1, 12, 30)
+
+
+def add_calls(provider_id, times):
+    """Store successful call logs created at the given times"""
+    db.session.execute(ApiCallLog.__table__.insert(), [{
+        'provider_id': provider_id,
+        'request_url': 'https://example.com',
+        'request_method': 'GET',
+        'is_success': True,
+        'response_size': 100,
+        'execution_time': 0.5,
+        'created_at': created_at
+    } for created_at in times])
+    db.session.commit()
+
+
+def rolled_calls(hour):
+    """Get the number of calls rolled up for an hour"""
+    return db.session.execute(
+        select(func.sum(ApiCallRollup.call_count)).where(ApiCallRollup.hour == hour)
+    ).scalar()
+
+
+def test_late_call_logs_are_rolled_up_before_purge(app):
+    provider = ApiProvider(name='Test', base_url='https://example.com')
+    db.session.add(provider)
+    db.session.commit()
+    
+    service = RetentionService(call_log_days=30)
+    old_hour = datetime(2026, 1, 20, 9)
+    add_calls(provider.id, [old_hour + timedelta(minutes=minute) for minute in (5, 10, 15)])
+    add_calls(provider.id, [NOW - timedelta(hours=2)])
+    service.rollup_api_calls(until=NOW)
+    assert rolled_calls(old_hour) == 3
+    
+    # Written after its hour was already rolled up
+    add_calls(provider.id, [old_hour + timedelta(minutes=50)])
+    assert service.rollup_api_calls(until=NOW) == 0
+    assert rolled_calls(old_hour) == 3
+    
+    deleted = service.purge(now=NOW)
+    assert deleted['api_call_logs'] == 4
+    assert rolled_calls(old_hour) == 4
+    # Hours newer than the cutoff keep their rollups
+    assert rolled_calls(service._floor_hour(NOW - timedelta(hours=2))) == 1
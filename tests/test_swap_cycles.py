@@ -0,0 +1,64 @@
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from src.services.swap_cycles import (
+    add_cycle_columns, find_swap_cycles, find_swap_cycles_iterative, compare_swap_cycles
+)
+
+# The iterative reference correlates through np.corrcoef, which warns on constant quantities
+pytestmark = pytest.mark.filterwarnings('ignore:invalid value encountered in divide:RuntimeWarning')
+
+
+def cycle_frame(closes, quantities):
+    """Build a frame as swap_cycle_frame does, from closes and FTD quantities (0 on days without fails)"""
+    index = pd.date_range('2020-01-01', periods=len(closes), freq='D', name='date')
+    df = pd.DataFrame({'close': np.asarray(closes, dtype=np.float64),
+                       'quantity': np.asarray(quantities, dtype=np.float64)}, index=index)
+    return add_cycle_columns(df)
+
+
+def random_frame(seed, days=1500, ftd_rate=0.3):
+    """Random-walk closes rounded to cents, with fails on a fraction of the days"""
+    rng = np.random.default_rng(seed)
+    closes = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.03, days))), 2)
+    quantities = np.where(rng.random(days) < ftd_rate, rng.integers(1, 10 ** 6, days), 0)
+    return cycle_frame(closes, quantities)
+
+
+def assert_same_cycles(df):
+    expected = find_swap_cycles_iterative(df)
+    actual = find_swap_cycles(df)
+    assert compare_swap_cycles(expected, actual) <= 1e-9
+    return actual
+
+
+@pytest.mark.parametrize('seed', range(8))
+@pytest.mark.parametrize('ftd_rate', [0.0, 0.3, 1.0])
+def test_matches_iterative_detector(seed, ftd_rate):
+    cycles = assert_same_cycles(random_frame(seed, ftd_rate=ftd_rate))
+    assert cycles
+    if ftd_rate == 0.0:
+        # Constant quantities have no correlation
+        assert all(math.isnan(cycle['ftd_correlation']) for cycle in cycles)
+
+
+@pytest.mark.parametrize('days', [0, 1, 19, 20, 21, 45])
+def test_short_histories(days):
+    assert_same_cycles(random_frame(days, days=days))
+
+
+def test_flat_prices_have_no_cycles():
+    assert find_swap_cycles(cycle_frame(np.full(100, 10.0), np.zeros(100))) == []
+
+
+def test_consecutive_troughs_without_a_peak_extend_the_cycle():
+    # Two 20-day lows in a row before the first peak, then a second pair after it
+    closes = np.concatenate([
+        np.linspace(120, 100, 25), [101, 99.5, 100.5, 99], np.linspace(100, 130, 20), [129],
+        np.linspace(128, 90, 25), [91, 89, 90, 88], np.linspace(89, 110, 10)
+    ])
+    df = cycle_frame(closes, np.arange(len(closes)))
+    assert df['is_trough'].sum() > df['is_peak'].sum()
+    cycles = assert_same_cycles(df)
+    assert len(cycles) == 1